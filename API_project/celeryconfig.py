@@ -3,4 +3,23 @@ import os
 
 BROKER_URL = os.getenv('BROKER_URL')
 CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND')
-CELERY_TASK_TRACK_STARTED = True
\ No newline at end of file
+CELERY_TASK_TRACK_STARTED = True
+
+CELERYBEAT_SCHEDULE = {
+    'flush-votes': {
+        'task': 'flush_votes',
+        'schedule': float(os.getenv('VOTES_FLUSH_INTERVAL') or 1.0),
+    },
+    'compact-votes': {
+        'task': 'compact_votes',
+        'schedule': float(os.getenv('VOTES_COMPACTION_INTERVAL') or 5.0),
+    },
+    'update-statuses': {
+        'task': 'update_statuses',
+        'schedule': float(os.getenv('VOTINGS_STATUS_INTERVAL') or 60.0),
+    },
+    'dispatch-reports': {
+        'task': 'dispatch_reports',
+        'schedule': float(os.getenv('REPORT_DISPATCH_INTERVAL') or 30.0),
+    },
+}
@@ -59,6 +59,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "votings.compression.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -156,7 +157,7 @@ MEDIA_ROOT = Path(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
 REST_FRAMEWORK = {
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'votings.pagination.OptionalCursorPagination',
     'PAGE_SIZE': 10
 }
 
@@ -166,8 +167,86 @@ EMAIL_PORT = os.getenv('EMAIL_PORT')
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 EMAIL_USE_SSL = os.getenv('EMAIL_USE_SSL')
+# Report emails sent over one SMTP connection
+REPORT_EMAIL_BATCH_SIZE = int(os.getenv('REPORT_EMAIL_BATCH_SIZE') or 50)
+
+# Buffered votings keep unflushed votes here, see votings/buffers.py
+VOTES_BUFFER = {
+    'BACKEND': 'votings.buffers.RedisVoteBuffer',
+    'LOCATION': os.getenv('VOTES_BUFFER_URL') or os.getenv('BROKER_URL'),
+}
+
+# Live member rankings, see votings/leaderboards.py
+LEADERBOARD = {
+    'BACKEND': 'votings.leaderboards.RedisLeaderboard',
+    'LOCATION': os.getenv('LEADERBOARD_URL') or os.getenv('BROKER_URL'),
+}
+
+# Server-sent vote updates, see votings/streams.py
+VOTES_STREAM = {
+    'INTERVAL_MS': int(os.getenv('VOTES_STREAM_INTERVAL_MS') or 500),
+    'KEEPALIVE': 15,
+    'MAX_SECONDS': int(os.getenv('VOTES_STREAM_MAX_SECONDS') or 300),
+    'RETRY_MS': 1000,
+    # Most seconds between polls of a voting while they fail
+    'MAX_BACKOFF': 30,
+}
+
+# VoteEvents folded into CharacterVote.amount per transaction
+VOTES_COMPACTION_BATCH = int(os.getenv('VOTES_COMPACTION_BATCH') or 1000)
+# Most votes of one add_votes entry, ledger votings insert one row each
+VOTES_MAX_ENTRY_COUNT = int(os.getenv('VOTES_MAX_ENTRY_COUNT') or 1000)
+
+# Report rows read from the database per query round trip
+REPORT_CHUNK_SIZE = int(os.getenv('REPORT_CHUNK_SIZE') or 2000)
+# Rows per row group of parquet reports
+REPORT_ROW_GROUP_SIZE = int(os.getenv('REPORT_ROW_GROUP_SIZE') or 100000)
+# Seconds workers wait for another one building the same report
+REPORT_LOCK_TIMEOUT = int(os.getenv('REPORT_LOCK_TIMEOUT') or 600)
+# Seconds before a report claimed for sending but not sent is claimed again
+REPORT_SEND_TIMEOUT = int(os.getenv('REPORT_SEND_TIMEOUT') or 900)
+# Claims of a report failing to build or send before it is given up
+REPORT_MAX_ATTEMPTS = int(os.getenv('REPORT_MAX_ATTEMPTS') or 5)
+# 'database': the dispatch_reports beat task sends due ExportTask rows,
+# 'eta': every ExportTask is a Celery ETA task held by workers until due
+REPORT_SCHEDULER = os.getenv('REPORT_SCHEDULER') or 'database'
+# Seconds before reports dispatched but still not sent are dispatched again
+REPORT_DISPATCH_TIMEOUT = int(os.getenv('REPORT_DISPATCH_TIMEOUT') or 900)
+
+# Winners of finished votings are cached until an admin edit
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_URL') or os.getenv('BROKER_URL'),
+    }
+}
+
+# Rendered read responses, local tier in front of CACHES[CACHE]
+RESPONSE_CACHE = {
+    'CACHE': 'default',
+    'TIMEOUT': int(os.getenv('RESPONSE_CACHE_TIMEOUT') or 300),
+    'LOCAL_TIMEOUT': int(os.getenv('RESPONSE_CACHE_LOCAL_TIMEOUT') or 30),
+    'LOCAL_SIZE': int(os.getenv('RESPONSE_CACHE_LOCAL_SIZE') or 512),
+    # Seconds other workers wait for the one rendering a miss, 0 is off
+    'LOCK_TIMEOUT': int(os.getenv('RESPONSE_CACHE_LOCK_TIMEOUT') or 0),
+}
+
+# gzip, or brotli when installed, for JSON responses from MIN_LENGTH bytes
+COMPRESSION = {
+    'MIN_LENGTH': int(os.getenv('COMPRESSION_MIN_LENGTH') or 1024),
+    'GZIP_LEVEL': int(os.getenv('COMPRESSION_GZIP_LEVEL') or 6),
+    'BROTLI_QUALITY': int(os.getenv('COMPRESSION_BROTLI_QUALITY') or 5),
+    'TYPES': ['application/json'],
+}
 
 if TESTING:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+    VOTES_BUFFER = {'BACKEND': 'votings.buffers.LocalVoteBuffer'}
+    LEADERBOARD = {'BACKEND': 'votings.leaderboards.LocalLeaderboard'}
     MEDIA_ROOT = os.path.join(
         BASE_DIR,
         'votings/tests/fixtures/media/',
@@ -1,25 +1,44 @@
 from typing import Any
 
+from django.conf import settings
 from django.contrib import admin
-from django.db.models import Max
 from votings.forms import CharacterForm, ExportTaskForm, VotingForm
 
-from .models import Character, CharacterVote, ExportTask, Voting
+from .models import Character, CharacterVote, ExportTask, VoteEvent, Voting
 from celery.result import AsyncResult
+from votings.counters import leader_votes_expression
 from votings.utilities import calculate_age
+from votings.winners import forget_winner
 
 
 @admin.register(Voting)
 class VotingAdmin(admin.ModelAdmin):
     list_display = ['id', 'title', 'start_date', 'end_date', 'max_votes',
-                    'leader_votes']
+                    'ingestion', 'status', 'leader_votes']
     empty_value_display = "not set"
     list_display_links = ['title']
     form = VotingForm
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            counted_leader_votes=leader_votes_expression())
+
     @admin.display(empty_value=0)
     def leader_votes(self, obj):
-        return obj.votes.aggregate(leader_votes=Max('amount'))['leader_votes']
+        return obj.total_leader_votes()
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        forget_winner(obj.id)
+
+    def delete_model(self, request, obj):
+        forget_winner(obj.id)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        for voting_id in queryset.values_list('id', flat=True):
+            forget_winner(voting_id)
+        super().delete_queryset(request, queryset)
 
 
 @admin.register(Character)
@@ -42,16 +61,29 @@ class CharacterVoteAdmin(admin.ModelAdmin):
     list_filter = ['voting__title']
 
 
+@admin.register(VoteEvent)
+class VoteEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'voting', 'character', 'created_at', 'compacted']
+    list_display_links = ['id']
+    list_filter = ['voting__title', 'compacted']
+
+
 @admin.register(ExportTask)
 class ExportTaskAdmin(admin.ModelAdmin):
-    list_display = ['id', 'execute_at', 'e_mail', 'voting', 'status', 'xlsx']
+    list_display = ['id', 'execute_at', 'e_mail', 'voting', 'format', 'status',
+                    'sent_at', 'file']
     list_display_links = ['e_mail']
     form = ExportTaskForm
 
     @admin.display
     def status(self, obj: ExportTask) -> str:
-        state = AsyncResult(obj.task_id).state if obj.task_id else 'PENDING'
-        return state
+        if obj.task_id:
+            return AsyncResult(obj.task_id).state
+        if obj.sent_at:
+            return 'SENT'
+        if obj.attempts >= settings.REPORT_MAX_ATTEMPTS:
+            return 'FAILED'
+        return 'PENDING'
 
     def get_form(self, request, *args, **kwargs) -> Any:
         form = super(ExportTaskAdmin, self).get_form(request, **kwargs)
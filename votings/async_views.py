@@ -0,0 +1,148 @@
+"""
+    Async versions of the read endpoints, served under async/ by an
+    ASGI server (make asgi). They answer with the same JSON as the DRF
+    views, with queries on the async ORM, so a worker is not blocked
+    on database round trips.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import (APIException, MethodNotAllowed,
+                                       NotFound)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.serializers import SerializerMetaclass
+
+from votings.counters import aranked_members
+from votings.models import Character, Voting
+from votings.serializers import (CharacterSerializer, MemberSerializer,
+                                 VotingSerializer, sparse_query)
+from votings.views import CharacterViewSet, VotingViewSet
+from votings.winners import avoting_winner
+
+
+def json_response(data, code: int = status.HTTP_200_OK) -> HttpResponse:
+    return HttpResponse(JSONRenderer().render(data), status=code,
+                        content_type='application/json')
+
+
+def read_view(view):
+    """GET and HEAD only, DRF exceptions answered like DRF does."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            if request.method not in ('GET', 'HEAD'):
+                raise MethodNotAllowed(request.method)
+            return await view(Request(request), *args, **kwargs)
+        except APIException as exc:
+            return json_response({'detail': exc.detail}, exc.status_code)
+    return wrapper
+
+
+async def serialize(serializer: SerializerMetaclass, instance,
+                    request: Request, many: bool = False):
+    """
+        Serializer data. Buffered votings read their leader_votes from
+        the vote buffer, those are serialized in a thread.
+    """
+    serializer = serializer(instance, many=many,
+                            context={'request': request})
+    fields = serializer.child.fields if many else serializer.fields
+    instances = instance if many else [instance]
+    if 'leader_votes' in fields and any(
+            isinstance(i, Voting) and
+            i.ingestion == Voting.Ingestion.BUFFERED for i in instances):
+        return await sync_to_async(lambda: serializer.data)()
+    return serializer.data
+
+
+async def paginated_response(query, request: Request,
+                             serializer: SerializerMetaclass) -> dict:
+    """VotingViewSet.get_p_response for async views, the response data."""
+    paginator = VotingViewSet.pagination_class()
+    query = sparse_query(query, serializer, request)
+    page = await paginator.apaginate_queryset(query, request)
+    data = await serialize(serializer, page, request, many=True)
+    return paginator.get_paginated_response(data).data
+
+
+@read_view
+async def voting_list(request):
+    query = VotingViewSet.queryset.all()
+    return json_response(
+        await paginated_response(query, request, VotingSerializer))
+
+
+@read_view
+async def voting_active(request):
+    query = VotingViewSet.queryset.filter(status=Voting.Status.ACTIVE)
+    return json_response(
+        await paginated_response(query, request, VotingSerializer))
+
+
+@read_view
+async def voting_finished(request):
+    query = VotingViewSet.queryset.filter(status=Voting.Status.FINISHED)
+    return json_response(
+        await paginated_response(query, request, VotingSerializer))
+
+
+@read_view
+async def voting_detail(request, pk):
+    voting = await sparse_query(VotingViewSet.queryset, VotingSerializer,
+                                request).filter(id=pk).afirst()
+    if voting is None:
+        raise NotFound()
+    return json_response(await serialize(VotingSerializer, voting, request))
+
+
+@read_view
+async def voting_members(request, pk):
+    voting = await Voting.objects.filter(id=pk).afirst()
+    if voting is None:
+        return json_response(
+            {"detail": f"Voting id {pk} does not exist"},
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    query = VotingViewSet.filter_members(await aranked_members(voting),
+                                         request)
+    data = await paginated_response(query, request, MemberSerializer)
+    if not data['results']:
+        data['detail'] = f'Voting id {pk} has no members'
+    return json_response(data)
+
+
+@read_view
+async def voting_winner(request, pk):
+    winner = await avoting_winner(pk)
+    if 'detail' in winner:
+        return json_response({"detail": winner['detail']},
+                             status.HTTP_400_BAD_REQUEST)
+
+    character = await sparse_query(Character.objects.all(),
+                                   CharacterSerializer,
+                                   request).aget(id=winner['character'])
+    character.votes_amount = winner['votes_amount']
+    return json_response(
+        await serialize(CharacterSerializer, character, request))
+
+
+@read_view
+async def character_list(request):
+    query = CharacterViewSet.queryset.all()
+    return json_response(
+        await paginated_response(query, request, CharacterSerializer))
+
+
+@read_view
+async def character_detail(request, pk):
+    character = await sparse_query(CharacterViewSet.queryset,
+                                   CharacterSerializer,
+                                   request).filter(id=pk).afirst()
+    if character is None:
+        raise NotFound()
+    return json_response(
+        await serialize(CharacterSerializer, character, request))
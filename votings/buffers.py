@@ -0,0 +1,259 @@
+import threading
+from functools import lru_cache
+from typing import Callable
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# KEYS: totals, buffer. ARGV: character id, max_votes or 0.
+# The new member total, nil at max_votes, -1 without the member total
+ADD_SCRIPT = """
+    local total = redis.call('HGET', KEYS[1], ARGV[1])
+    if not total then return -1 end
+    local leader = tonumber(redis.call('HGET', KEYS[1], 'leader') or 0)
+    local max_votes = tonumber(ARGV[2])
+    if max_votes > 0 and leader >= max_votes then return nil end
+    total = redis.call('HINCRBY', KEYS[1], ARGV[1], 1)
+    redis.call('HINCRBY', KEYS[2], ARGV[1], 1)
+    if total > leader then redis.call('HSET', KEYS[1], 'leader', total) end
+    return total
+"""
+
+# KEYS: totals. ARGV: character id and total pairs. Members already
+# there keep their totals, votes may have raised them meanwhile
+SEED_SCRIPT = """
+    local leader = tonumber(redis.call('HGET', KEYS[1], 'leader') or 0)
+    for i = 1, #ARGV, 2 do
+        redis.call('HSETNX', KEYS[1], ARGV[i], ARGV[i + 1])
+        local total = tonumber(redis.call('HGET', KEYS[1], ARGV[i]))
+        leader = math.max(leader, total)
+    end
+    redis.call('HSET', KEYS[1], 'leader', leader)
+"""
+
+# KEYS: buffer, flushing. ARGV: token. The deltas of an unfinished
+# flush, or the buffer renamed to the flushing hash of the token
+TAKE_SCRIPT = """
+    if redis.call('EXISTS', KEYS[2]) == 0 then
+        if redis.call('EXISTS', KEYS[1]) == 0 then return nil end
+        redis.call('RENAME', KEYS[1], KEYS[2])
+        redis.call('HSET', KEYS[2], 'token', ARGV[1])
+    end
+    return redis.call('HGETALL', KEYS[2])
+"""
+
+# KEYS: flushing. ARGV: token
+DISCARD_SCRIPT = """
+    if redis.call('HGET', KEYS[1], 'token') == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+"""
+
+
+def read_deltas(fields: dict) -> dict[int, int]:
+    """Member deltas of a redis hash, without its token or leader."""
+    return {int(k): int(v) for k, v in fields.items()
+            if k.isdigit() and int(v)}
+
+
+def merge_deltas(*deltas: dict[int, int]) -> dict[int, int]:
+    merged = {}
+    for member_deltas in deltas:
+        for character_id, amount in member_deltas.items():
+            merged[character_id] = merged.get(character_id, 0) + amount
+    return merged
+
+
+class RedisVoteBuffer:
+    """
+        Unflushed vote deltas stored in one redis hash per voting.
+        A flush takes the hash as the flushing hash of a token and
+        discards it once its deltas are committed, pending votes are
+        the deltas of both. Member totals, pending votes included, are
+        kept in a third hash to check max_votes on add.
+    """
+    prefix = 'votings:buffer:'
+    flushing_prefix = 'votings:flushing:'
+    totals_prefix = 'votings:totals:'
+
+    def __init__(self, location: str) -> None:
+        self.client = redis.Redis.from_url(location)
+        self.add_script = self.client.register_script(ADD_SCRIPT)
+        self.seed_script = self.client.register_script(SEED_SCRIPT)
+        self.take_script = self.client.register_script(TAKE_SCRIPT)
+        self.discard_script = self.client.register_script(DISCARD_SCRIPT)
+
+    def add(self, voting_id: int, character_id: int,
+            max_votes: int | None = None) -> int | None:
+        """
+            Adds a vote, returns the member total or None once a member
+            has max_votes. KeyError without the member total, see seed.
+        """
+        total = self.add_script(
+            keys=[self.totals_prefix + str(voting_id),
+                  self.prefix + str(voting_id)],
+            args=[character_id, max_votes or 0],
+        )
+        if total == -1:
+            raise KeyError(character_id)
+        return total
+
+    def seed(self, voting_id: int, totals: dict[int, int]) -> None:
+        """Sets member totals missing from the buffer."""
+        pairs = [value for item in totals.items() for value in item]
+        self.seed_script(keys=[self.totals_prefix + str(voting_id)],
+                         args=pairs)
+
+    def discard_totals(self, voting_id: int) -> None:
+        """Member totals are seeded again on the next vote."""
+        self.client.delete(self.totals_prefix + str(voting_id))
+
+    def leaders(self, voting_ids: list[int]) -> dict[int, int]:
+        """Leader totals of the votings with member totals."""
+        pipe = self.client.pipeline(transaction=False)
+        for voting_id in voting_ids:
+            pipe.hget(self.totals_prefix + str(voting_id), 'leader')
+        return {voting_id: int(leader)
+                for voting_id, leader in zip(voting_ids, pipe.execute())
+                if leader is not None}
+
+    def pending(self, voting_id: int,
+                committed: Callable[[str], bool]) -> dict[int, int]:
+        """
+            Buffered and flushing deltas, but those of a flush whose
+            token is committed(), its deltas are already in the database.
+        """
+        pipe = self.client.pipeline()
+        pipe.hgetall(self.prefix + str(voting_id))
+        pipe.hgetall(self.flushing_prefix + str(voting_id))
+        buffered, flushing = pipe.execute()
+        if flushing and committed(flushing[b'token'].decode()):
+            flushing = {}
+        return merge_deltas(read_deltas(buffered), read_deltas(flushing))
+
+    def votings(self) -> list[int]:
+        voting_ids = set()
+        for prefix in (self.prefix, self.flushing_prefix):
+            keys = self.client.scan_iter(match=prefix + '*')
+            voting_ids.update(int(k[len(prefix):]) for k in keys)
+        return list(voting_ids)
+
+    def take(self, voting_id: int,
+             token: str) -> tuple[str, dict[int, int]] | None:
+        """
+            (token, deltas) to flush: those of an unfinished flush, else
+            the buffered ones, taken under token. None without deltas.
+        """
+        fields = self.take_script(
+            keys=[self.prefix + str(voting_id),
+                  self.flushing_prefix + str(voting_id)],
+            args=[token],
+        )
+        if fields is None:
+            return None
+        fields = dict(zip(fields[::2], fields[1::2]))
+        return fields[b'token'].decode(), read_deltas(fields)
+
+    def discard(self, voting_id: int, token: str) -> None:
+        """Drops the flushed deltas of token, they are in the database."""
+        self.discard_script(keys=[self.flushing_prefix + str(voting_id)],
+                            args=[token])
+
+
+class LocalVoteBuffer:
+    """In-process stand-in for RedisVoteBuffer, used by tests."""
+
+    def __init__(self, location: str | None = None) -> None:
+        self.lock = threading.Lock()
+        self.data: dict[int, dict[int, int]] = {}
+        self.flushing: dict[int, tuple[str, dict[int, int]]] = {}
+        self.totals: dict[int, dict[int, int]] = {}
+
+    def add(self, voting_id: int, character_id: int,
+            max_votes: int | None = None) -> int | None:
+        with self.lock:
+            totals = self.totals.get(voting_id, {})
+            if character_id not in totals:
+                raise KeyError(character_id)
+            if max_votes and max(totals.values()) >= max_votes:
+                return None
+            totals[character_id] += 1
+            deltas = self.data.setdefault(voting_id, {})
+            deltas[character_id] = deltas.get(character_id, 0) + 1
+            return totals[character_id]
+
+    def seed(self, voting_id: int, totals: dict[int, int]) -> None:
+        with self.lock:
+            member_totals = self.totals.setdefault(voting_id, {})
+            for character_id, total in totals.items():
+                member_totals.setdefault(character_id, total)
+
+    def discard_totals(self, voting_id: int) -> None:
+        with self.lock:
+            self.totals.pop(voting_id, None)
+
+    def leaders(self, voting_ids: list[int]) -> dict[int, int]:
+        with self.lock:
+            return {voting_id: max(self.totals[voting_id].values())
+                    for voting_id in voting_ids if self.totals.get(voting_id)}
+
+    def pending(self, voting_id: int,
+                committed: Callable[[str], bool]) -> dict[int, int]:
+        with self.lock:
+            buffered = dict(self.data.get(voting_id, {}))
+            token, flushing = self.flushing.get(voting_id, (None, {}))
+        if token and committed(token):
+            flushing = {}
+        deltas = merge_deltas(buffered, flushing)
+        return {k: v for k, v in deltas.items() if v}
+
+    def votings(self) -> list[int]:
+        with self.lock:
+            return list(set(self.data) | set(self.flushing))
+
+    def take(self, voting_id: int,
+             token: str) -> tuple[str, dict[int, int]] | None:
+        with self.lock:
+            if voting_id not in self.flushing:
+                if voting_id not in self.data:
+                    return None
+                self.flushing[voting_id] = (token, self.data.pop(voting_id))
+            token, deltas = self.flushing[voting_id]
+            return token, dict(deltas)
+
+    def discard(self, voting_id: int, token: str) -> None:
+        with self.lock:
+            if self.flushing.get(voting_id, (None,))[0] == token:
+                del self.flushing[voting_id]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.data.clear()
+            self.flushing.clear()
+            self.totals.clear()
+
+
+def buffered_leader_votes(votings: list) -> dict[int, int | None]:
+    """
+        total_leader_votes of buffered votings by id, read from the
+        buffer totals in one round trip. Votings missing there have them
+        seeded from the database.
+    """
+    buffer = get_vote_buffer()
+    leaders = buffer.leaders([voting.id for voting in votings])
+    for voting in votings:
+        if voting.id not in leaders:
+            totals = voting.vote_totals()
+            if totals:
+                buffer.seed(voting.id, totals)
+            leaders[voting.id] = max(totals.values(), default=None)
+    return leaders
+
+
+@lru_cache(maxsize=None)
+def get_vote_buffer():
+    config = settings.VOTES_BUFFER
+    backend = import_string(config['BACKEND'])
+    return backend(config.get('LOCATION'))
@@ -0,0 +1,118 @@
+import gzip
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpRequest
+from django.http.response import HttpResponseBase
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def encodings() -> list[str]:
+    """Content codings this process writes, preferred first."""
+    return ['br', 'gzip'] if brotli else ['gzip']
+
+
+def compress(content: bytes, encoding: str) -> bytes:
+    options = settings.COMPRESSION
+    if encoding == 'br':
+        return brotli.compress(content, quality=options['BROTLI_QUALITY'])
+    # mtime=0, so the same content always compresses to the same bytes
+    return gzip.compress(content, compresslevel=options['GZIP_LEVEL'],
+                         mtime=0)
+
+
+def compressible(response: HttpResponseBase) -> bool:
+    """Large enough responses of COMPRESSION['TYPES'], not encoded yet."""
+    if response.streaming or response.has_header('Content-Encoding'):
+        return False
+    content_type = response.get('Content-Type', '').split(';')[0].strip()
+    return content_type in settings.COMPRESSION['TYPES'] and \
+        len(response.content) >= settings.COMPRESSION['MIN_LENGTH']
+
+
+def compress_all(response: HttpResponseBase) -> dict[str, bytes]:
+    """The content in every coding, for responses kept in a cache."""
+    if response.status_code != 200 or not compressible(response):
+        return {}
+    return {encoding: compress(response.content, encoding)
+            for encoding in encodings()}
+
+
+def accept_weights(header: str) -> dict[str, float]:
+    """Accept-Encoding as {coding: q}, malformed q values refuse."""
+    weights = {}
+    for item in header.split(','):
+        name, _, params = item.partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name.strip().lower()] = q
+    return weights
+
+
+def accepted_encoding(request: HttpRequest) -> str | None:
+    """Coding to answer the request with, the preferred one on ties."""
+    weights = accept_weights(request.headers.get('Accept-Encoding', ''))
+    best, best_q = None, 0.0
+    for encoding in encodings():
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionMiddleware:
+    """
+        gzip or brotli by Accept-Encoding for JSON responses of at least
+        COMPRESSION['MIN_LENGTH'] bytes. Responses from the response
+        cache carry their content already compressed, in `encoded`.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.encode(request, self.get_response(request))
+
+    async def __acall__(self, request: HttpRequest):
+        return self.encode(request, await self.get_response(request))
+
+    def encode(self, request: HttpRequest,
+               response: HttpResponseBase) -> HttpResponseBase:
+        if not compressible(response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = accepted_encoding(request)
+        if encoding is None:
+            return response
+
+        encoded = getattr(response, 'encoded', {})
+        content = encoded.get(encoding) or \
+            compress(response.content, encoding)
+        if len(content) >= len(response.content):
+            return response
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = encoding
+        # Like GZipMiddleware, the encoded bytes are another representation
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = f'W/{etag}'
+        return response
@@ -0,0 +1,529 @@
+import logging
+import random
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, connection, transaction
+from django.db.models import (Case, Count, Expression, ExpressionWrapper,
+                              F, FloatField, Max, OuterRef, Q, QuerySet,
+                              Subquery, Sum, Value, When, Window)
+from django.db.models.functions import Coalesce, NullIf, Rank
+from django.utils import timezone
+
+from votings.buffers import get_vote_buffer
+from votings.leaderboards import get_leaderboard
+from votings.models import (Character, CharacterVote, VoteEvent, VoteFlush,
+                            VoteShard, Voting, VotingLeader)
+from votings.utilities import is_active_voting
+from votings.versions import bump_voting_versions
+
+
+# Committed flush tokens are kept this long for reads that found their
+# flushing deltas before the discard, see VoteFlush.committed
+FLUSH_TOKEN_TTL = timedelta(minutes=1)
+
+ADD_VOTE_SQL = """
+    WITH vote AS (
+      UPDATE {vote} AS cv
+      SET amount = cv.amount + 1
+      FROM {voting} AS v
+      WHERE cv.voting_id = %(voting_id)s
+        AND cv.character_id = %(character_id)s
+        AND v.id = cv.voting_id
+        AND v.ingestion = %(direct)s
+        AND v.shards = 1
+        AND v.status = %(active)s
+        AND (v.max_votes IS NULL OR cv.amount < v.max_votes)
+      RETURNING cv.voting_id, cv.amount
+    ), leader AS (
+      INSERT INTO {leader} AS l (voting_id, votes)
+      SELECT voting_id, amount FROM vote
+      ON CONFLICT (voting_id)
+      DO UPDATE SET votes = EXCLUDED.votes
+      WHERE l.votes < EXCLUDED.votes
+    ), close AS (
+      UPDATE {voting} AS v
+      SET status = %(finished)s
+      FROM vote
+      WHERE v.id = vote.voting_id
+        AND vote.amount >= v.max_votes
+    ), member AS (
+      SELECT cv.voting_id, cv.character_id, v.shards, v.max_votes,
+             cv.amount + COALESCE((
+               SELECT SUM(s.amount) FROM {shard} AS s
+               WHERE s.voting_id = cv.voting_id
+                 AND s.character_id = cv.character_id
+             ), 0) AS total
+      FROM {vote} AS cv
+      JOIN {voting} AS v ON v.id = cv.voting_id
+      WHERE cv.voting_id = %(voting_id)s
+        AND cv.character_id = %(character_id)s
+        AND v.ingestion = %(direct)s
+        AND v.shards > 1
+        AND v.status = %(active)s
+    ), shard AS (
+      INSERT INTO {shard} AS s (voting_id, character_id, "index", amount)
+      SELECT voting_id, character_id, floor(random() * shards)::int, 1
+      FROM member
+      WHERE max_votes IS NULL OR total < max_votes
+      ON CONFLICT (voting_id, character_id, "index")
+      DO UPDATE SET amount = s.amount + 1
+      RETURNING s.voting_id
+    ), finish AS (
+      UPDATE {voting} AS v
+      SET status = %(finished)s
+      FROM member, shard
+      WHERE v.id = member.voting_id
+        AND member.total + 1 >= v.max_votes
+    )
+    SELECT amount, NULL::varchar, NULL::smallint, NULL::integer FROM vote
+    UNION ALL
+    SELECT total + 1, NULL, NULL, NULL FROM member, shard
+    UNION ALL
+    SELECT cv.amount, v.ingestion, v.shards, v.max_votes
+    FROM {voting} AS v
+    JOIN {vote} AS cv ON cv.voting_id = v.id
+    WHERE v.id = %(voting_id)s
+      AND cv.character_id = %(character_id)s
+      AND v.status = %(active)s
+      AND v.ingestion <> %(direct)s
+"""
+
+
+def add_vote(voting_id: int, character_id: int) -> int | None:
+    """
+        Adds one vote to the voting member.
+        Returns the new amount or None if the vote was rejected.
+    """
+    amount = _add_vote(voting_id, character_id)
+    if amount is not None:
+        _publish_votes(voting_id, {character_id: amount})
+    return amount
+
+
+def _add_vote(voting_id: int, character_id: int) -> int | None:
+    if connection.vendor == 'postgresql':
+        amount, vote = _add_vote_returning(voting_id, character_id)
+    else:
+        amount, vote = _add_vote_portable(voting_id, character_id)
+    if vote is None:
+        return amount
+
+    add = {
+        Voting.Ingestion.BUFFERED: add_buffered_vote,
+        Voting.Ingestion.LEDGER: add_ledger_vote,
+    }.get(vote.voting.ingestion, add_sharded_vote)
+    return add(vote.voting, character_id)
+
+
+def _add_vote_returning(voting_id: int,
+                        character_id: int) -> tuple[int | None,
+                                                    CharacterVote | None]:
+    """
+        Direct votings: one round trip increments the amount, or a random
+        VoteShard of sharded votings, and raises VotingLeader.votes,
+        finishing the voting at max_votes.
+        Returns (new amount, None), or (None, member) of the active
+        votings of other ingestions, read in the same round trip.
+    """
+    sql = ADD_VOTE_SQL.format(
+        vote=CharacterVote._meta.db_table,
+        voting=Voting._meta.db_table,
+        shard=VoteShard._meta.db_table,
+        leader=VotingLeader._meta.db_table,
+    )
+    params = {
+        'voting_id': voting_id,
+        'character_id': character_id,
+        'direct': Voting.Ingestion.DIRECT,
+        'active': Voting.Status.ACTIVE,
+        'finished': Voting.Status.FINISHED,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    if row is None:
+        return None, None
+    amount, ingestion, shards, max_votes = row
+    if ingestion is None:
+        return amount, None
+    voting = Voting(id=voting_id, ingestion=ingestion, shards=shards,
+                    max_votes=max_votes, status=Voting.Status.ACTIVE)
+    return None, CharacterVote(voting=voting, character_id=character_id,
+                               amount=amount)
+
+
+def _add_vote_portable(voting_id: int,
+                       character_id: int) -> tuple[int | None,
+                                                   CharacterVote | None]:
+    """Fallback for backends without data-modifying WITH ... RETURNING."""
+    votes = CharacterVote.objects.filter(
+        Q(voting__max_votes__isnull=True) |
+        Q(amount__lt=F('voting__max_votes')),
+        voting_id=voting_id,
+        character_id=character_id,
+        voting__status=Voting.Status.ACTIVE,
+        voting__ingestion=Voting.Ingestion.DIRECT,
+        voting__shards=1,
+    )
+    with transaction.atomic():
+        if not votes.update(amount=F('amount') + 1):
+            return None, CharacterVote.objects\
+                .select_related('voting')\
+                .filter(voting_id=voting_id, character_id=character_id,
+                        voting__status=Voting.Status.ACTIVE)\
+                .exclude(voting__ingestion=Voting.Ingestion.DIRECT,
+                         voting__shards=1)\
+                .first()
+        amount = CharacterVote.objects\
+            .filter(voting_id=voting_id, character_id=character_id)\
+            .values_list('amount', flat=True)\
+            .get()
+        leaders = VotingLeader.objects.filter(voting_id=voting_id)
+        if not leaders.filter(votes__lt=amount).update(votes=amount):
+            VotingLeader.objects.get_or_create(voting_id=voting_id,
+                                               defaults={'votes': amount})
+        _finish_at_max_votes(voting_id, amount)
+    return amount, None
+
+
+def _finish_at_max_votes(voting_id: int, amount: int) -> None:
+    Voting.objects\
+        .filter(id=voting_id, max_votes__lte=amount)\
+        .exclude(status=Voting.Status.FINISHED)\
+        .update(status=Voting.Status.FINISHED)
+
+
+def refresh_leader_votes(voting_ids) -> None:
+    """Sets VotingLeader.votes to the max of CharacterVote.amount."""
+    leaders = CharacterVote.objects\
+        .filter(voting_id__in=voting_ids)\
+        .values('voting_id')\
+        .annotate(votes=Max('amount'))\
+        .values_list('voting_id', 'votes')
+    leaders = [VotingLeader(voting_id=v, votes=votes) for v, votes in leaders]
+    VotingLeader.objects.bulk_create(leaders, update_conflicts=True,
+                                     unique_fields=['voting'],
+                                     update_fields=['votes'])
+    VotingLeader.objects\
+        .filter(voting_id__in=voting_ids)\
+        .exclude(voting_id__in=[leader.voting_id for leader in leaders])\
+        .delete()
+
+
+def leader_votes_expression() -> Expression:
+    """
+        Voting.total_leader_votes as SQL for Voting querysets, with the
+        pending votes of ledger and sharded votings. Buffered votings
+        keep theirs in the vote buffer, see buffered_leader_votes.
+    """
+    member = {'voting': OuterRef('voting'), 'character': OuterRef('character')}
+    events = VoteEvent.objects\
+        .filter(compacted=False, **member)\
+        .values('character')\
+        .annotate(amount=Count('id'))\
+        .values('amount')
+    shards = VoteShard.objects\
+        .filter(**member)\
+        .values('character')\
+        .annotate(amount=Sum('amount'))\
+        .values('amount')
+
+    def leader_votes(pending: QuerySet) -> Subquery:
+        return Subquery(
+            CharacterVote.objects
+            .filter(voting=OuterRef('pk'))
+            .annotate(total=F('amount') + Coalesce(Subquery(pending), 0))
+            .values('voting')
+            .annotate(leader_votes=Max('total'))
+            .values('leader_votes')
+        )
+
+    return Case(
+        When(ingestion=Voting.Ingestion.LEDGER, then=leader_votes(events)),
+        When(ingestion=Voting.Ingestion.DIRECT, shards__gt=1,
+             then=leader_votes(shards)),
+        default=F('leader__votes'),
+    )
+
+
+def accepts_votes(voting: Voting, totals: dict[int, int]) -> bool:
+    """is_active_voting for already counted member votes."""
+    if not is_active_voting(voting):
+        return False
+    leader_votes = max(totals.values(), default=0)
+    return not voting.max_votes or leader_votes < voting.max_votes
+
+
+def add_buffered_vote(voting: Voting, character_id: int) -> int | None:
+    """
+        Buffered votings: the vote goes to the vote buffer and is added
+        to CharacterVote.amount later by flush_buffered_votes. The buffer
+        checks max_votes against the member totals it keeps, seeded from
+        the database when missing.
+    """
+    buffer = get_vote_buffer()
+    try:
+        amount = buffer.add(voting.id, character_id, voting.max_votes)
+    except KeyError:
+        buffer.seed(voting.id, voting.vote_totals())
+        amount = buffer.add(voting.id, character_id, voting.max_votes)
+    if amount and voting.max_votes and amount >= voting.max_votes:
+        _finish_at_max_votes(voting.id, amount)
+    return amount
+
+
+def add_ledger_vote(voting: Voting, character_id: int) -> int | None:
+    """
+        Ledger votings: the vote is inserted as a VoteEvent and is added
+        to CharacterVote.amount later by compact_vote_events.
+        max_votes is checked before the insert, so votes arriving at the
+        same moment may overshoot it.
+    """
+    totals = voting.vote_totals()
+    if character_id not in totals or not accepts_votes(voting, totals):
+        return None
+
+    VoteEvent.objects.create(voting=voting, character_id=character_id)
+    _finish_at_max_votes(voting.id, totals[character_id] + 1)
+    return totals[character_id] + 1
+
+
+def add_sharded_vote(voting: Voting, character_id: int) -> int | None:
+    """
+        Sharded votings: the vote goes to a random VoteShard of the member,
+        so concurrent votes rarely wait for the same row lock. The member
+        total, its amount and shards, is checked against max_votes before
+        the increment, votes arriving at the same moment may overshoot it.
+        On PostgreSQL ADD_VOTE_SQL does it in the same round trip.
+    """
+    shards = VoteShard.objects.filter(voting=voting, character_id=character_id)
+    with transaction.atomic():
+        total = voting.votes\
+            .filter(character_id=character_id)\
+            .annotate(total=F('amount') + Coalesce(
+                Subquery(shards.values('character')
+                         .annotate(total=Sum('amount'))
+                         .values('total')), 0))\
+            .values_list('total', flat=True)\
+            .first()
+        if total is None or \
+                (voting.max_votes and total >= voting.max_votes):
+            return None
+        index = random.randrange(voting.shards)
+        shard = shards.filter(index=index)
+        if not shard.update(amount=F('amount') + 1):
+            try:
+                with transaction.atomic():
+                    VoteShard.objects.create(voting=voting,
+                                             character_id=character_id,
+                                             index=index, amount=1)
+            except IntegrityError:
+                shard.update(amount=F('amount') + 1)
+        _finish_at_max_votes(voting.id, total + 1)
+    return total + 1
+
+
+def increment_votes(deltas: dict[tuple[int, int], int]) -> None:
+    """
+        Adds deltas keyed by (voting id, character id) in one UPDATE
+        and refreshes leader_votes of the votings.
+    """
+    pairs = Q()
+    increments = []
+    for (voting_id, character_id), amount in deltas.items():
+        pair = Q(voting_id=voting_id, character_id=character_id)
+        pairs |= pair
+        increments.append(When(pair, then=Value(amount)))
+    CharacterVote.objects\
+        .filter(pairs)\
+        .update(amount=F('amount') + Case(*increments, default=Value(0)))
+    refresh_leader_votes({voting_id for voting_id, _ in deltas})
+
+
+def flush_buffered_votes() -> int:
+    """
+        Adds buffered deltas to CharacterVote.amount, one UPDATE per
+        voting. Deltas are taken under a token committed with them, a
+        flush interrupted after the commit is not added twice and reads
+        before the discard do not count them as pending.
+    """
+    buffer = get_vote_buffer()
+    started = timezone.now()
+    flushed = 0
+    for voting_id in buffer.votings():
+        taken = buffer.take(voting_id, uuid.uuid4().hex)
+        if taken is None:
+            continue
+        token, deltas = taken
+        try:
+            with transaction.atomic():
+                VoteFlush.objects.create(token=token)
+                increment_votes({(voting_id, c): d
+                                 for c, d in deltas.items()})
+        except IntegrityError:
+            logging.info(f'Votes of flush {token} are already added')
+        else:
+            flushed += sum(deltas.values())
+        buffer.discard(voting_id, token)
+    # Older flushes are discarded by now, retried above if interrupted
+    VoteFlush.objects\
+        .filter(created_at__lt=started - FLUSH_TOKEN_TTL)\
+        .delete()
+    return flushed
+
+
+def compact_vote_events(batch_size: int = 1000) -> int:
+    """Folds uncompacted VoteEvents into CharacterVote.amount in batches."""
+    compacted = 0
+    while True:
+        with transaction.atomic():
+            events = list(
+                VoteEvent.objects
+                .filter(compacted=False)
+                .select_for_update(skip_locked=True)
+                .order_by('id')
+                .values_list('id', 'voting_id', 'character_id')[:batch_size]
+            )
+            if not events:
+                return compacted
+            increment_votes(Counter((v, c) for _, v, c in events))
+            VoteEvent.objects\
+                .filter(id__in=[e[0] for e in events])\
+                .update(compacted=True)
+        compacted += len(events)
+
+
+def add_votes(voting_id: int,
+              entries: list[tuple[int, int]]) -> list[dict] | None:
+    """
+        Adds (character id, count) entries to the voting in one transaction.
+        Member rows are locked once, entries are applied in order and the
+        entry crossing max_votes is accepted up to it.
+        Returns per-entry results or None if the voting is not active.
+    """
+    with transaction.atomic():
+        voting = Voting.objects.filter(id=voting_id).first()
+        if voting is None:
+            return None
+        votes = voting.votes.select_for_update().order_by('id')
+        amounts = dict(votes.values_list('character_id', 'amount'))
+        pending = voting.pending_votes()
+        totals = {c: a + pending.get(c, 0) for c, a in amounts.items()}
+        if not accepts_votes(voting, totals):
+            return None
+
+        results = [_count_entry(voting, totals, c, n) for c, n in entries]
+        _save_accepted_votes(voting, results)
+        _finish_at_max_votes(voting.id, max(totals.values(), default=0))
+    if voting.ingestion == Voting.Ingestion.BUFFERED:
+        # Buffer totals miss the votes added here, they are seeded again
+        get_vote_buffer().discard_totals(voting_id)
+    _publish_votes(voting_id, {r['character']: r['votes_amount']
+                               for r in results if r['accepted']})
+    return results
+
+
+def _count_entry(voting: Voting, totals: dict[int, int],
+                 character_id: int, count: int) -> dict:
+    result = {'character': character_id, 'count': count, 'accepted': 0}
+    if character_id not in totals:
+        result['detail'] = \
+            f'Voting id {voting.id} has no member id {character_id}'
+        return result
+
+    accepted = count
+    if voting.max_votes:
+        leader_votes = max(totals.values())
+        room = voting.max_votes - totals[character_id]
+        accepted = 0 if leader_votes >= voting.max_votes else min(count, room)
+    totals[character_id] += accepted
+    result.update(accepted=accepted, votes_amount=totals[character_id])
+    if accepted < count:
+        result['detail'] = f'Voting id {voting.id} is finished'
+    return result
+
+
+def _save_accepted_votes(voting: Voting, results: list[dict]) -> None:
+    """Ledger votings keep their events, others get one bulk UPDATE."""
+    accepted = Counter()
+    for result in results:
+        accepted[result['character']] += result['accepted']
+    accepted = +accepted
+    if not accepted:
+        return
+    if voting.ingestion == Voting.Ingestion.LEDGER:
+        VoteEvent.objects.bulk_create([
+            VoteEvent(voting=voting, character_id=c)
+            for c, n in accepted.items() for _ in range(n)
+        ])
+    else:
+        increment_votes({(voting.id, c): n for c, n in accepted.items()})
+
+
+def _publish_votes(voting_id: int, amounts: dict[int, int]) -> None:
+    """New member totals for conditional GETs and the leaderboard."""
+    bump_voting_versions(voting_id)
+    get_leaderboard().update(voting_id, amounts)
+
+
+def rebuild_leaderboard(voting: Voting) -> None:
+    """Fills the leaderboard from CharacterVote and pending votes."""
+    get_leaderboard().rebuild(voting.id, voting.vote_totals())
+
+
+def voting_leaderboard(voting_id: int,
+                       top: int) -> list[tuple[int, int]] | None:
+    """
+        (character id, votes) of the top members, the leaderboard is
+        rebuilt when missing. None if the voting does not exist.
+    """
+    leaderboard = get_leaderboard()
+    if not leaderboard.exists(voting_id):
+        voting = Voting.objects.filter(id=voting_id).first()
+        if voting is None:
+            return None
+        rebuild_leaderboard(voting)
+    return leaderboard.top(voting_id, top)
+
+
+def ranked_members(voting: Voting) -> QuerySet:
+    """
+        Voting members in one query, with votes_amount (pending votes
+        included), rank and percentage of all voting votes.
+    """
+    votes_amount = F('votes__amount') + voting.pending_votes_expression()
+    all_votes = NullIf(Window(Sum('votes_amount')), 0)
+    return Character.objects\
+        .filter(votes__voting=voting)\
+        .annotate(votes_amount=votes_amount)\
+        .annotate(
+            rank=Window(Rank(), order_by=F('votes_amount').desc()),
+            percentage=ExpressionWrapper(
+                F('votes_amount') * 100.0 / all_votes,
+                output_field=FloatField(),
+            ),
+        )
+
+
+async def aranked_members(voting: Voting) -> QuerySet:
+    """
+        ranked_members for async views. Buffered votings read pending
+        votes from the buffer to build the query, that runs in a thread.
+    """
+    if voting.ingestion == Voting.Ingestion.BUFFERED:
+        return await sync_to_async(ranked_members)(voting)
+    return ranked_members(voting)
+
+
+def vote_rejection_detail(voting_id: int,
+                          character_id: int | None = None) -> str:
+    """Explains why a vote was rejected. Runs on error path only."""
+    voting = Voting.objects.filter(id=voting_id).first()
+    if voting is None:
+        return f'Voting id {voting_id} does not exist'
+    if character_id is None or not is_active_voting(voting):
+        return f'Voting id {voting_id} is finished'
+    return f'Voting id {voting_id} has no member id {character_id}'
@@ -0,0 +1,145 @@
+"""
+    Voting member exports for the data team: CSV and NDJSON streamed by
+    ExportView, and every ExportTask.Format written by send_report.
+    Rows are read from the database in chunks, so memory stays flat
+    whatever the number of members.
+"""
+import csv
+import io
+import json
+from itertools import islice
+from typing import AsyncIterator, BinaryIO, Iterable, Iterator
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpRequest, StreamingHttpResponse
+
+from votings.models import ExportTask, Voting
+from votings.utilities import report_rows, write_report_xlsx
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+COLUMNS = ('voting', 'character', 'last_name', 'votes')
+CONTENT_TYPES = {
+    ExportTask.Format.XLSX: ('application/vnd.openxmlformats-officedocument.'
+                             'spreadsheetml.sheet'),
+    ExportTask.Format.CSV: 'text/csv',
+    ExportTask.Format.NDJSON: 'application/x-ndjson',
+    ExportTask.Format.PARQUET: 'application/vnd.apache.parquet',
+}
+
+
+def formats() -> list[str]:
+    """ExportTask formats this process writes."""
+    return [f for f in ExportTask.Format
+            if pyarrow or f != ExportTask.Format.PARQUET]
+
+
+def voting_rows(voting: Voting, chunk_size: int) -> Iterator[tuple]:
+    """COLUMNS of voting members, pending votes included, most votes first."""
+    return report_rows(
+        voting.votes.all(), voting.pending_votes(), chunk_size,
+        columns=('voting_id', 'character_id', 'character__last_name'),
+    )
+
+
+def all_voting_rows(chunk_size: int) -> Iterator[tuple]:
+    """voting_rows of every voting, by voting id."""
+    for voting in Voting.objects.order_by('id').iterator(chunk_size):
+        yield from voting_rows(voting, chunk_size)
+
+
+def batches(rows: Iterable[tuple], size: int) -> Iterator[list[tuple]]:
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def csv_chunks(rows: Iterable[tuple], chunk_size: int) -> Iterator[bytes]:
+    """CSV with a COLUMNS header, chunk_size rows per chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for batch in batches(rows, chunk_size):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def ndjson_chunks(rows: Iterable[tuple], chunk_size: int) -> Iterator[bytes]:
+    """One JSON object with COLUMNS keys per line, chunk_size per chunk."""
+    for batch in batches(rows, chunk_size):
+        yield ''.join(
+            json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False,
+                       separators=(',', ':')) + '\n'
+            for row in batch
+        ).encode()
+
+
+STREAMS = {
+    ExportTask.Format.CSV: csv_chunks,
+    ExportTask.Format.NDJSON: ndjson_chunks,
+}
+
+
+def write_parquet(file: BinaryIO, rows: Iterable[tuple],
+                  row_group_size: int) -> None:
+    """COLUMNS into file, one parquet row group per row_group_size rows."""
+    schema = pyarrow.schema([('voting', pyarrow.int64()),
+                             ('character', pyarrow.int64()),
+                             ('last_name', pyarrow.string()),
+                             ('votes', pyarrow.int64())])
+    with pyarrow.parquet.ParquetWriter(file, schema) as writer:
+        for batch in batches(rows, row_group_size):
+            writer.write_table(
+                pyarrow.Table.from_pylist(
+                    [dict(zip(COLUMNS, row)) for row in batch], schema),
+                row_group_size=row_group_size,
+            )
+
+
+def write_export(file: BinaryIO, voting: Voting, export_format: str,
+                 chunk_size: int) -> None:
+    """Voting members in export_format into file."""
+    if export_format == ExportTask.Format.XLSX:
+        write_report_xlsx(file, voting.votes.all(), voting.pending_votes(),
+                          chunk_size, created=voting.finished_at)
+    elif export_format == ExportTask.Format.PARQUET:
+        write_parquet(file, voting_rows(voting, chunk_size),
+                      settings.REPORT_ROW_GROUP_SIZE)
+    else:
+        for chunk in STREAMS[export_format](voting_rows(voting, chunk_size),
+                                            chunk_size):
+            file.write(chunk)
+
+
+async def achunks(chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+    """
+        chunks for ASGI servers. StreamingHttpResponse reads a sync
+        iterator into a list there, this one is read chunk by chunk in
+        the thread of sync views, where its database cursor is.
+    """
+    next_chunk = sync_to_async(next)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
+
+
+def export_response(request: HttpRequest, rows: Iterable[tuple],
+                    export_format: str, name: str) -> StreamingHttpResponse:
+    """rows as a streamed CSV or NDJSON attachment named name."""
+    chunks = STREAMS[export_format](rows, settings.REPORT_CHUNK_SIZE)
+    if isinstance(request, ASGIRequest):
+        chunks = achunks(chunks)
+    response = StreamingHttpResponse(
+        chunks, content_type=CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = \
+        f'attachment; filename="{name}.{export_format}"'
+    return response
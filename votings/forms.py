@@ -3,6 +3,7 @@ from datetime import datetime
 from django import forms
 from django.utils import timezone
 
+from votings.exports import formats
 from votings.models import Character, ExportTask, Voting
 from votings.utilities import calculate_age
 
@@ -10,7 +11,7 @@ from votings.utilities import calculate_age
 class ExportTaskForm(forms.ModelForm):
     class Meta:
         model = ExportTask
-        fields = ['execute_at', 'voting', 'e_mail']
+        fields = ['execute_at', 'voting', 'e_mail', 'format']
 
     def is_valid(self) -> bool:
         date_str = self.data.get('execute_at_0')
@@ -23,6 +24,9 @@ class ExportTaskForm(forms.ModelForm):
                                   tzinfo=now.tzinfo)
             if now >= execute_at:
                 self.add_error('execute_at', 'Datetime must be later than now')
+        parquet = ExportTask.Format.PARQUET
+        if self.data.get('format') == parquet and parquet not in formats():
+            self.add_error('format', 'Parquet reports need pyarrow installed')
 
         return super().is_valid()
 
@@ -50,7 +54,8 @@ class CharacterForm(forms.ModelForm):
 class VotingForm(forms.ModelForm):
     class Meta:
         model = Voting
-        fields = ['title', 'start_date', 'end_date', 'max_votes']
+        fields = ['title', 'start_date', 'end_date', 'max_votes',
+                  'ingestion', 'shards']
 
     def is_valid(self) -> bool:
         try:
@@ -0,0 +1,113 @@
+import threading
+import time
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class RedisLeaderboard:
+    """
+        Member votes in one redis sorted set per voting. Votes only
+        raise scores of members already there, a missing set is rebuilt
+        from the database. Votings without members have no set, a marker
+        key stands for it for empty_timeout seconds.
+    """
+    prefix = 'votings:leaderboard:'
+    empty_prefix = 'votings:leaderboard-empty:'
+    empty_timeout = 60
+
+    def __init__(self, location: str) -> None:
+        self.client = redis.Redis.from_url(location)
+
+    def keys(self, voting_id: int) -> list[str]:
+        return [self.prefix + str(voting_id),
+                self.empty_prefix + str(voting_id)]
+
+    def exists(self, voting_id: int) -> bool:
+        return bool(self.client.exists(*self.keys(voting_id)))
+
+    def update(self, voting_id: int, amounts: dict[int, int]) -> None:
+        """Raises member scores to amounts, out of order updates lose."""
+        self.client.zadd(self.prefix + str(voting_id), amounts,
+                         xx=True, gt=True)
+
+    def rebuild(self, voting_id: int, amounts: dict[int, int]) -> None:
+        pipe = self.client.pipeline()
+        pipe.delete(*self.keys(voting_id))
+        if amounts:
+            pipe.zadd(self.prefix + str(voting_id), amounts)
+        else:
+            pipe.set(self.empty_prefix + str(voting_id), 1,
+                     ex=self.empty_timeout)
+        pipe.execute()
+
+    def top(self, voting_id: int, n: int) -> list[tuple[int, int]]:
+        """
+            (character id, votes) of the n best members, O(log(N) + n).
+            Members with equal votes come by character id string, reversed.
+        """
+        members = self.client.zrevrange(self.prefix + str(voting_id),
+                                        0, n - 1, withscores=True)
+        return [(int(c), int(amount)) for c, amount in members]
+
+    def discard(self, voting_id: int) -> None:
+        self.client.delete(*self.keys(voting_id))
+
+
+class LocalLeaderboard:
+    """In-process stand-in for RedisLeaderboard, used by tests."""
+
+    def __init__(self, location: str | None = None) -> None:
+        self.lock = threading.Lock()
+        # Keyed like redis keys, so '1' and 1 are the same voting
+        self.data: dict[str, dict[int, int]] = {}
+        # Expiry times of the empty markers by voting
+        self.empty: dict[str, float] = {}
+
+    def exists(self, voting_id: int) -> bool:
+        with self.lock:
+            return str(voting_id) in self.data or \
+                self.empty.get(str(voting_id), 0) > time.monotonic()
+
+    def update(self, voting_id: int, amounts: dict[int, int]) -> None:
+        with self.lock:
+            scores = self.data.get(str(voting_id), {})
+            for character_id, amount in amounts.items():
+                if amount > scores.get(character_id, amount):
+                    scores[character_id] = amount
+
+    def rebuild(self, voting_id: int, amounts: dict[int, int]) -> None:
+        with self.lock:
+            self.data.pop(str(voting_id), None)
+            self.empty.pop(str(voting_id), None)
+            if amounts:
+                self.data[str(voting_id)] = dict(amounts)
+            else:
+                self.empty[str(voting_id)] = \
+                    time.monotonic() + RedisLeaderboard.empty_timeout
+
+    def top(self, voting_id: int, n: int) -> list[tuple[int, int]]:
+        with self.lock:
+            scores = self.data.get(str(voting_id), {})
+            # Like ZREVRANGE, ties by member string in reverse: '9', '10'
+            return sorted(scores.items(), key=lambda s: (s[1], str(s[0])),
+                          reverse=True)[:n]
+
+    def discard(self, voting_id: int) -> None:
+        with self.lock:
+            self.data.pop(str(voting_id), None)
+            self.empty.pop(str(voting_id), None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.data.clear()
+            self.empty.clear()
+
+
+@lru_cache(maxsize=None)
+def get_leaderboard():
+    config = settings.LEADERBOARD
+    backend = import_string(config['BACKEND'])
+    return backend(config.get('LOCATION'))
@@ -0,0 +1,78 @@
+"""
+    Recounts of ledger votings. A member's amount is its baseline, the
+    votes counted before the voting kept a ledger, and its VoteEvents.
+"""
+from django.db import transaction
+from django.db.models import (Case, Count, F, Max, OuterRef, Subquery,
+                              Value, When)
+from django.db.models.functions import Coalesce
+
+from votings.counters import refresh_leader_votes
+from votings.leaderboards import get_leaderboard
+from votings.models import CharacterVote, VoteEvent, Voting
+from votings.versions import bump_voting_versions
+from votings.winners import forget_winner
+
+
+def set_ledger_baseline(voting: Voting,
+                        character_id: int | None = None) -> None:
+    """
+        Baseline of the voting members, or of one: amount less the
+        VoteEvents compacted into it. Votes still pending in a former
+        ingestion are added, they reach amount later.
+    """
+    pending = {}
+    if voting.ingestion != Voting.Ingestion.LEDGER:
+        pending = voting.pending_votes()
+    compacted = VoteEvent.objects\
+        .filter(voting=OuterRef('voting'), character=OuterRef('character'),
+                compacted=True)\
+        .values('character')\
+        .annotate(amount=Count('id'))\
+        .values('amount')
+    votes = CharacterVote.objects.filter(voting=voting)
+    if character_id is not None:
+        votes = votes.filter(character_id=character_id)
+    votes.update(baseline=(
+        F('amount') - Coalesce(Subquery(compacted), 0) + Case(
+            *[When(character_id=c, then=Value(n)) for c, n in pending.items()],
+            default=Value(0),
+        )
+    ))
+
+
+def rebuild_votes(voting_id: int) -> None:
+    """
+        Recounts CharacterVote.amount of the ledger voting from baselines
+        and VoteEvents. Rows are locked in the order compact_vote_events
+        locks them, VoteEvents first.
+    """
+    with transaction.atomic():
+        events = VoteEvent.objects.filter(voting_id=voting_id)
+        # Compaction skips these events until the recount is committed
+        list(events
+             .filter(compacted=False)
+             .select_for_update()
+             .order_by('id')
+             .values_list('id', flat=True))
+        votes = CharacterVote.objects.filter(voting_id=voting_id)
+        list(votes.select_for_update().order_by('id')
+             .values_list('id', flat=True))
+        last_id = events.aggregate(last_id=Max('id'))['last_id'] or 0
+        counts = dict(
+            events
+            .filter(id__lte=last_id)
+            .values('character_id')
+            .annotate(amount=Count('id'))
+            .values_list('character_id', 'amount')
+        )
+        votes.update(amount=F('baseline') + Case(
+            *[When(character_id=c, then=Value(n)) for c, n in counts.items()],
+            default=Value(0),
+        ))
+        events.filter(id__lte=last_id, compacted=False).update(compacted=True)
+        refresh_leader_votes([voting_id])
+        Voting.objects.get(id=voting_id).save(update_fields=['status'])
+    forget_winner(voting_id)
+    get_leaderboard().discard(voting_id)
+    bump_voting_versions(voting_id)
@@ -0,0 +1,89 @@
+import asyncio
+import statistics
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+
+ENDPOINTS = ['voting-list', 'voting-active', 'voting-detail',
+             'voting-members', 'voting-winner', 'character-list']
+DETAIL_ENDPOINTS = {'voting-detail', 'voting-members', 'voting-winner'}
+
+
+class Command(BaseCommand):
+    help = ('Compares requests/sec and latency of the DRF read endpoints '
+            'and their async/ versions on a running single process ASGI '
+            'server (make asgi). Every request has its own query string, '
+            'so the response cache of the DRF views misses.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('voting_id', type=int)
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--endpoints', nargs='*', default=ENDPOINTS,
+                            choices=ENDPOINTS)
+
+    def handle(self, *args, **options):
+        for name in options['endpoints']:
+            kwargs = {}
+            if name in DETAIL_ENDPOINTS:
+                kwargs['pk'] = options['voting_id']
+            for path in [reverse(name, kwargs=kwargs),
+                         reverse(f'async-{name}', kwargs=kwargs)]:
+                rps, timings = asyncio.run(self.run(path, options))
+                self.stdout.write(
+                    f'{path:32} {rps:8.1f} req/s'
+                    f'   p50 {self.percentile(timings, 50):7.1f} ms'
+                    f'   p99 {self.percentile(timings, 99):7.1f} ms'
+                )
+
+    async def run(self, path: str, options: dict) -> tuple[float, list]:
+        """Requests/sec and latencies of the path, in ms."""
+        server = urlsplit(options['url'])
+        queue = asyncio.Queue()
+        for i in range(options['requests']):
+            queue.put_nowait(f'{path}?bench={i}')
+        timings = []
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await asyncio.gather(*[self.client(server, queue, timings)
+                               for _ in range(options['concurrency'])])
+        return len(timings) / (loop.time() - started), timings
+
+    async def client(self, server, queue: asyncio.Queue,
+                     timings: list) -> None:
+        """One keep-alive connection sending queued requests in turn."""
+        reader, writer = await asyncio.open_connection(
+            server.hostname, server.port or 80)
+        loop = asyncio.get_running_loop()
+        try:
+            while not queue.empty():
+                path = queue.get_nowait()
+                started = loop.time()
+                writer.write(f'GET {path} HTTP/1.1\r\n'
+                             f'Host: {server.netloc}\r\n'
+                             'Accept: application/json\r\n\r\n'.encode())
+                status = await self.read_response(reader)
+                assert status < 500, f'{path} answered {status}'
+                timings.append((loop.time() - started) * 1000)
+        finally:
+            writer.close()
+
+    async def read_response(self, reader: asyncio.StreamReader) -> int:
+        """Status of the response, reads it to the end."""
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while (line := await reader.readline()) != b'\r\n':
+            name, value = line.decode().split(':', 1)
+            headers[name.lower()] = value.strip()
+        if 'content-length' in headers:
+            await reader.readexactly(int(headers['content-length']))
+            return status
+        while size := int(await reader.readline(), 16):
+            await reader.readexactly(size + 2)
+        await reader.readline()
+        return status
+
+    def percentile(self, timings: list, n: int) -> float:
+        return statistics.quantiles(timings, n=100)[n - 1]
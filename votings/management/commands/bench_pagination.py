@@ -0,0 +1,73 @@
+import statistics
+import time
+import uuid
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+from rest_framework.pagination import Cursor
+
+from votings.models import Character
+from votings.pagination import IdCursorPagination
+
+
+class Command(BaseCommand):
+    help = ('Compares characters/ page latency of page number and cursor '
+            'pagination as pages get deeper. Creates and deletes its own '
+            'characters.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        prefix = f'benchmark {uuid.uuid4()}'
+        Character.objects.bulk_create(
+            [Character(last_name=f'{prefix} {i}', birth_date=date(1990, 1, 1))
+             for i in range(options['rows'])],
+            batch_size=5000,
+        )
+        try:
+            self.compare(options)
+        finally:
+            Character.objects.filter(last_name__startswith=prefix).delete()
+
+    def compare(self, options: dict) -> None:
+        client = Client()
+        url = reverse('character-list')
+        page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        pages = Character.objects.count() // page_size
+
+        ids = Character.objects.order_by('id').values_list('id', flat=True)
+
+        page = 1
+        while page <= pages:
+            offset = (page - 1) * page_size
+            position = ids[offset - 1] if offset else None
+            numbered = self.measure(client, f'{url}?page={page}', options)
+            cursor = self.measure(client, self.cursor_url(url, position),
+                                  options)
+            self.stdout.write(f'page={page:<8} page number {numbered:8.2f} ms'
+                              f'   cursor {cursor:8.2f} ms')
+            page *= 10
+
+    def cursor_url(self, url: str, position: int | None) -> str:
+        paginator = IdCursorPagination()
+        paginator.base_url = f'http://testserver{url}'
+        return paginator.encode_cursor(
+            Cursor(offset=0, reverse=False, position=position)
+        )
+
+    def measure(self, client: Client, url: str, options: dict) -> float:
+        timings = []
+        separator = '&' if '?' in url else '?'
+        for _ in range(options['repeat']):
+            # A URL of its own per run, repeated ones are response cache hits
+            bench_url = f'{url}{separator}bench={uuid.uuid4().hex}'
+            started = time.perf_counter()
+            response = client.get(bench_url)
+            timings.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.status_code
+        return statistics.median(timings)
@@ -0,0 +1,68 @@
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from votings.models import Character, CharacterVote, Voting
+from votings.utilities import write_report_xlsx
+
+
+class Command(BaseCommand):
+    help = ('Time and peak traced memory of the members xlsx report of '
+            'votings with 10k, 100k and 1M members. Creates and deletes '
+            'its own characters and votings.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='*',
+                            default=[10000, 100000, 1000000])
+        parser.add_argument('--chunk-size', type=int,
+                            default=settings.REPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        prefix = f'benchmark {uuid.uuid4()}'
+        characters = Character.objects.bulk_create(
+            [Character(last_name=f'{prefix} {i}', birth_date=date(1990, 1, 1))
+             for i in range(max(options['sizes']))],
+            batch_size=5000,
+        )
+        try:
+            for size in options['sizes']:
+                voting = Voting.objects.create(
+                    title=f'{prefix} {size}', start_date=date(2023, 7, 1),
+                    end_date=date(2023, 7, 31))
+                CharacterVote.objects.bulk_create(
+                    [CharacterVote(voting=voting, character=character,
+                                   amount=i % 1000)
+                     for i, character in enumerate(characters[:size])],
+                    batch_size=5000,
+                )
+                self.measure(voting, size, options['chunk_size'])
+        finally:
+            # One DELETE, not the per vote signals of QuerySet.delete()
+            CharacterVote.objects\
+                .filter(voting__title__startswith=prefix)\
+                ._raw_delete(CharacterVote.objects.db)
+            Voting.objects.filter(title__startswith=prefix).delete()
+            Character.objects.filter(last_name__startswith=prefix).delete()
+
+    def measure(self, voting: Voting, size: int, chunk_size: int) -> None:
+        with tempfile.TemporaryFile() as file:
+            started = time.perf_counter()
+            write_report_xlsx(file, voting.votes.all(), {}, chunk_size)
+            seconds = time.perf_counter() - started
+            file_size = file.tell()
+
+        tracemalloc.start()
+        with tempfile.TemporaryFile() as file:
+            write_report_xlsx(file, voting.votes.all(), {}, chunk_size)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f'{size:>9} members {seconds:8.2f} s'
+            f'   peak {peak / 2 ** 20:7.1f} MiB'
+            f'   file {file_size / 2 ** 20:7.1f} MiB'
+        )
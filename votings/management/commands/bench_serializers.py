@@ -0,0 +1,82 @@
+import statistics
+import time
+import uuid
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from votings.models import Character, Voting
+from votings.renderers import FastJSONRenderer
+from votings.serializers import (CharacterRowSerializer, CharacterSerializer,
+                                 VotingRowSerializer, VotingSerializer)
+
+
+class Command(BaseCommand):
+    help = ('Compares rendering a page of characters and of votings with '
+            'the DRF serializers and JSONRenderer, and with values() rows '
+            'and FastJSONRenderer. Creates and deletes its own rows.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        prefix = f'benchmark {uuid.uuid4()}'
+        size = options['page_size']
+        characters = Character.objects.bulk_create(
+            [Character(last_name=f'{prefix} {i}', first_name='Бенчмарк',
+                       birth_date=date(1990, 1, 1), description='x' * 200,
+                       photo=f'character_images/{i}.jpg')
+             for i in range(size)]
+        )
+        votings = Voting.objects.bulk_create(
+            [Voting(title=f'{prefix} {i}', start_date=date(2023, 7, 1),
+                    end_date=date(2023, 7, 31)) for i in range(size)]
+        )
+        try:
+            self.compare(
+                'characters',
+                Character.objects.filter(id__in=[c.id for c in characters]),
+                CharacterSerializer, CharacterRowSerializer, options,
+            )
+            self.compare(
+                'votings',
+                Voting.objects.filter(id__in=[v.id for v in votings]),
+                VotingSerializer, VotingRowSerializer, options,
+            )
+        finally:
+            Character.objects.filter(last_name__startswith=prefix).delete()
+            Voting.objects.filter(title__startswith=prefix).delete()
+
+    def compare(self, name, query, serializer, row_serializer,
+                options: dict) -> None:
+        request = Request(RequestFactory().get('/'))
+
+        def drf():
+            data = serializer(query.order_by('id'), many=True,
+                              context={'request': request}).data
+            return JSONRenderer().render(data)
+
+        def rows():
+            rows = row_serializer(request)
+            data = rows.data(rows.values(query.order_by('id')))
+            return FastJSONRenderer().render(data)
+
+        assert drf() == rows(), 'outputs differ'
+        slow = self.measure(drf, options)
+        fast = self.measure(rows, options)
+        self.stdout.write(
+            f'{name:12} serializer {slow:7.2f} ms   rows {fast:7.2f} ms'
+            f'   {slow / fast:4.1f}x per {options["page_size"]} rows'
+        )
+
+    def measure(self, render, options: dict) -> float:
+        timings = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            render()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,65 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from votings.counters import add_vote
+from votings.models import Character, CharacterVote, Voting
+
+
+class Command(BaseCommand):
+    help = ('Measures add_vote throughput for one hot member '
+            'at different shard counts. Creates and deletes its own voting.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', type=int, nargs='+',
+                            default=[1, 8, 32])
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--votes', type=int, default=200,
+                            help='Votes per thread.')
+
+    def handle(self, *args, **options):
+        today = timezone.now().date()
+        character = Character.objects.create(
+            last_name=f'benchmark {uuid.uuid4()}',
+            birth_date=today - timedelta(days=365 * 30),
+        )
+        try:
+            for shards in options['shards']:
+                voting = Voting.objects.create(
+                    title=f'benchmark {uuid.uuid4()}',
+                    start_date=today - timedelta(days=1),
+                    end_date=today + timedelta(days=1),
+                    shards=shards,
+                )
+                CharacterVote.objects.create(voting=voting,
+                                             character=character, amount=0)
+                rate = self.measure(voting, character, options)
+                self.stdout.write(f'shards={shards:<4} {rate:10.1f} votes/s')
+                voting.delete()
+        finally:
+            character.delete()
+
+    def measure(self, voting: Voting, character: Character,
+                options: dict) -> float:
+        def vote(_):
+            try:
+                for _ in range(options['votes']):
+                    add_vote(voting.id, character.id)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['threads']) as executor:
+            list(executor.map(vote, range(options['threads'])))
+        elapsed = time.perf_counter() - started
+
+        total = voting.vote_totals()[character.id]
+        expected = options['threads'] * options['votes']
+        if total != expected:
+            self.stderr.write(f'Lost votes: {total} of {expected}')
+        return total / elapsed
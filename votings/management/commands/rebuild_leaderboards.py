@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from votings.counters import rebuild_leaderboard
+from votings.models import Voting
+
+
+class Command(BaseCommand):
+    help = 'Refills leaderboards of active votings from CharacterVote.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('voting_ids', nargs='*', type=int,
+                            help='Votings to rebuild, any status.')
+
+    def handle(self, *args, **options):
+        votings = Voting.objects.filter(status=Voting.Status.ACTIVE)
+        if options['voting_ids']:
+            votings = Voting.objects.filter(id__in=options['voting_ids'])
+
+        rebuilt = 0
+        for voting in votings:
+            rebuild_leaderboard(voting)
+            rebuilt += 1
+
+        self.stdout.write(f'Rebuilt {rebuilt} leaderboards.')
@@ -0,0 +1,37 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from votings.ledger import rebuild_votes
+from votings.models import Voting
+
+
+class Command(BaseCommand):
+    help = 'Recounts CharacterVote.amount of ledger votings from VoteEvents.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('voting_ids', nargs='*', type=int)
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Votings rebuilt in parallel.')
+
+    def handle(self, *args, **options):
+        votings = Voting.objects.filter(ingestion=Voting.Ingestion.LEDGER)
+        if options['voting_ids']:
+            votings = votings.filter(id__in=options['voting_ids'])
+        voting_ids = list(votings.values_list('id', flat=True))
+
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(options['workers']) as executor:
+                list(executor.map(self.rebuild, voting_ids))
+        else:
+            for voting_id in voting_ids:
+                rebuild_votes(voting_id)
+
+        self.stdout.write(f'Rebuilt {len(voting_ids)} votings.')
+
+    def rebuild(self, voting_id: int) -> None:
+        try:
+            rebuild_votes(voting_id)
+        finally:
+            connection.close()
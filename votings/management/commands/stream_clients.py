@@ -0,0 +1,66 @@
+import asyncio
+import statistics
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+
+
+class Command(BaseCommand):
+    help = ('Connects many clients to votings/<pk>/stream/ of a running '
+            'ASGI server (make asgi) and reports the events they got.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('voting_id', type=int)
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--clients', type=int, default=200)
+        parser.add_argument('--seconds', type=float, default=10)
+
+    def handle(self, *args, **options):
+        counts = asyncio.run(self.run(options))
+        connected = [c for c in counts if c is not None]
+        self.stdout.write(f'{len(connected)} of {options["clients"]} '
+                          'clients connected')
+        if connected:
+            self.stdout.write(
+                f'events per client: min {min(connected)}, '
+                f'median {statistics.median(connected)}, '
+                f'max {max(connected)}'
+            )
+
+    async def run(self, options: dict) -> list[int | None]:
+        path = reverse('voting-stream', kwargs={'pk': options['voting_id']})
+        clients = [self.client(options['url'], path, options['seconds'])
+                   for _ in range(options['clients'])]
+        return await asyncio.gather(*clients)
+
+    async def client(self, url: str, path: str,
+                     seconds: float) -> int | None:
+        """Votes events read by one client, None if it failed."""
+        server = urlsplit(url)
+        try:
+            reader, writer = await asyncio.open_connection(
+                server.hostname, server.port or 80)
+        except OSError:
+            return None
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: {server.netloc}\r\n'
+                     'Accept: text/event-stream\r\n\r\n'.encode())
+        try:
+            return await self.read_events(reader, seconds)
+        finally:
+            writer.close()
+
+    async def read_events(self, reader: asyncio.StreamReader,
+                          seconds: float) -> int:
+        loop = asyncio.get_running_loop()
+        ends = loop.time() + seconds
+        events = 0
+        try:
+            while (left := ends - loop.time()) > 0:
+                line = await asyncio.wait_for(reader.readline(), left)
+                if not line:
+                    break
+                events += line.startswith(b'event: votes')
+        except asyncio.TimeoutError:
+            pass
+        return events
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-18 18:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votings', '0004_remove_character_age_character_birth_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voting',
+            name='ingestion',
+            field=models.CharField(choices=[('direct', 'Direct'), ('buffered', 'Buffered')], default='direct', max_length=10),
+        ),
+    ]
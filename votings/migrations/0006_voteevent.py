@@ -0,0 +1,32 @@
+# Generated by Django 4.2.3 on 2026-10-18 18:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votings', '0005_voting_ingestion'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='voting',
+            name='ingestion',
+            field=models.CharField(choices=[('direct', 'Direct'), ('buffered', 'Buffered'), ('ledger', 'Ledger')], default='direct', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='VoteEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('compacted', models.BooleanField(default=False)),
+                ('character', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='votings.character')),
+                ('voting', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='votings.voting')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('compacted', False)), fields=['voting', 'character'], name='vote_event_uncompacted')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.3 on 2026-10-18 18:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votings', '0006_voteevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voting',
+            name='shards',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.CreateModel(
+            name='VoteShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('amount', models.IntegerField(default=0)),
+                ('character', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vote_shards', to='votings.character')),
+                ('voting', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vote_shards', to='votings.voting')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='voteshard',
+            constraint=models.UniqueConstraint(fields=('voting', 'character', 'index'), name='unique_voting_character_shard'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.3 on 2026-10-18 18:56
+
+from django.db import migrations, models
+from django.db.models import Max
+from django.utils import timezone
+
+
+def fill_leader_votes_status(apps, schema_editor):
+    Voting = apps.get_model('votings', 'Voting')
+    today = timezone.now().date()
+    votings = Voting.objects.annotate(max_amount=Max('votes__amount'))
+    for voting in votings:
+        voting.leader_votes = voting.max_amount
+        max_reached = voting.max_votes and \
+            (voting.max_amount or 0) >= voting.max_votes
+        if today > voting.end_date or max_reached:
+            voting.status = 'finished'
+        elif today <= voting.start_date:
+            voting.status = 'scheduled'
+        else:
+            voting.status = 'active'
+        voting.save(update_fields=['leader_votes', 'status'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votings', '0007_voting_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voting',
+            name='leader_votes',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='voting',
+            name='status',
+            field=models.CharField(choices=[('scheduled', 'Scheduled'), ('active', 'Active'), ('finished', 'Finished')], db_index=True, default='scheduled', max_length=10),
+        ),
+        migrations.RunPython(fill_leader_votes_status,
+                             migrations.RunPython.noop),
+    ]
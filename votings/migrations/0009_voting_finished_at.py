@@ -0,0 +1,29 @@
+# Generated by Django 4.2.3 on 2026-10-18 18:58
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def stamp_finished_votings(apps, schema_editor):
+    """Votings finished before the hook existed must not trigger it."""
+    Voting = apps.get_model('votings', 'Voting')
+    Voting.objects\
+        .filter(status='finished')\
+        .update(finished_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votings', '0008_voting_leader_votes_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voting',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(stamp_finished_votings,
+                             migrations.RunPython.noop),
+    ]
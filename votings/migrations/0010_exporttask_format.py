@@ -0,0 +1,23 @@
+# Generated by Django 4.2.3 on 2026-10-18 20:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votings', '0009_voting_finished_at'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='exporttask',
+            old_name='xlsx',
+            new_name='file',
+        ),
+        migrations.AddField(
+            model_name='exporttask',
+            name='format',
+            field=models.CharField(choices=[('xlsx', 'Xlsx'), ('csv', 'Csv'), ('ndjson', 'Ndjson'), ('parquet', 'Parquet')], default='xlsx', max_length=10),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.3 on 2026-10-18 21:02
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def stamp_sent_reports(apps, schema_editor):
+    """Reports due before the field existed were sent by their tasks."""
+    ExportTask = apps.get_model('votings', 'ExportTask')
+    ExportTask.objects\
+        .filter(execute_at__lte=timezone.now())\
+        .update(sent_at=models.F('execute_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votings', '0010_exporttask_format'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exporttask',
+            name='sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(stamp_sent_reports,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.3 on 2026-10-18 21:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votings', '0011_exporttask_sent_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exporttask',
+            name='dispatched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='exporttask',
+            index=models.Index(condition=models.Q(('sent_at', None)), fields=['execute_at'], name='export_task_unsent'),
+        ),
+    ]
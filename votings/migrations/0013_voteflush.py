@@ -0,0 +1,21 @@
+# Generated by Django 4.2.3 on 2026-10-18 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votings', '0012_exporttask_dispatched_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteFlush',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=32, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
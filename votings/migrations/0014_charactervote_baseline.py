@@ -0,0 +1,37 @@
+# Generated by Django 4.2.3 on 2026-10-18 22:40
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def set_ledger_baselines(apps, schema_editor):
+    """Ledger votings keep their current amounts as counted."""
+    CharacterVote = apps.get_model('votings', 'CharacterVote')
+    VoteEvent = apps.get_model('votings', 'VoteEvent')
+    compacted = VoteEvent.objects\
+        .filter(voting=models.OuterRef('voting'),
+                character=models.OuterRef('character'), compacted=True)\
+        .values('character')\
+        .annotate(amount=models.Count('id'))\
+        .values('amount')
+    CharacterVote.objects\
+        .filter(voting__ingestion='ledger')\
+        .update(baseline=models.F('amount') -
+                Coalesce(models.Subquery(compacted), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votings', '0013_voteflush'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='charactervote',
+            name='baseline',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(set_ledger_baselines,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.3 on 2026-10-18 23:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_leader_votes(apps, schema_editor):
+    Voting = apps.get_model('votings', 'Voting')
+    VotingLeader = apps.get_model('votings', 'VotingLeader')
+    votings = Voting.objects.filter(leader_votes__isnull=False)
+    VotingLeader.objects.bulk_create([
+        VotingLeader(voting_id=voting_id, votes=leader_votes)
+        for voting_id, leader_votes in votings.values_list('id',
+                                                           'leader_votes')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votings', '0014_charactervote_baseline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VotingLeader',
+            fields=[
+                ('voting', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='leader', serialize=False, to='votings.voting')),
+                ('votes', models.IntegerField()),
+            ],
+        ),
+        migrations.RunPython(copy_leader_votes, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='voting',
+            name='leader_votes',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-18 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votings', '0015_votingleader'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exporttask',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-18 23:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votings', '0016_exporttask_claimed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exporttask',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -1,22 +1,154 @@
+from django.conf import settings
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from votings.buffers import buffered_leader_votes, get_vote_buffer
 from votings.utilities import character_image_path
 import celery
 
 
 class Voting(models.Model):
+    class Ingestion(models.TextChoices):
+        DIRECT = 'direct'
+        BUFFERED = 'buffered'
+        LEDGER = 'ledger'
+
+    class Status(models.TextChoices):
+        SCHEDULED = 'scheduled'
+        ACTIVE = 'active'
+        FINISHED = 'finished'
+
     title = models.CharField(max_length=100, unique=True)
     start_date = models.DateField()
     end_date = models.DateField()
     max_votes = models.IntegerField(null=True, blank=True)
     characters = models.ManyToManyField('Character', through='CharacterVote')
+    ingestion = models.CharField(max_length=10, choices=Ingestion.choices,
+                                 default=Ingestion.DIRECT)
+    # Direct votings with several shards spread votes over VoteShard rows
+    shards = models.PositiveSmallIntegerField(default=1)
+    status = models.CharField(max_length=10, choices=Status.choices,
+                              default=Status.SCHEDULED, db_index=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self) -> str:
         return f'{self.id} | {self.title}'
 
+    def save(self, *args, **kwargs) -> None:
+        for name in ['start_date', 'end_date']:
+            field = self._meta.get_field(name)
+            setattr(self, name, field.to_python(getattr(self, name)))
+        self.status = self.current_status()
+        if self.status != self.Status.FINISHED and self.finished_at:
+            # Stamped again by update_statuses once it finishes again
+            self.finished_at = None
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'],
+                                           'finished_at'}
+        super().save(*args, **kwargs)
+
+    def current_status(self) -> str:
+        """Status by dates and leader votes."""
+        today = timezone.now().date()
+        leader_votes = self.total_leader_votes() or 0
+        if today > self.end_date or \
+                (self.max_votes and leader_votes >= self.max_votes):
+            return self.Status.FINISHED
+        if today <= self.start_date:
+            return self.Status.SCHEDULED
+        return self.Status.ACTIVE
+
+    @property
+    def leader_votes(self) -> int | None:
+        """Max of CharacterVote.amount, pending votes are not included."""
+        try:
+            return self.leader.votes
+        except VotingLeader.DoesNotExist:
+            return None
+
+    def total_leader_votes(self) -> int | None:
+        """
+            leader_votes with pending votes included. Queries annotate it
+            as counted_leader_votes, see counters.leader_votes_expression,
+            but for buffered votings, those read the vote buffer.
+        """
+        if self.pk and self.ingestion == self.Ingestion.BUFFERED:
+            return buffered_leader_votes([self])[self.id]
+        if hasattr(self, 'counted_leader_votes'):
+            return self.counted_leader_votes
+        if self.pk and self.has_pending_votes:
+            return max(self.vote_totals().values(), default=None)
+        return self.leader_votes
+
+    def pending_votes(self) -> dict[int, int]:
+        """Accepted votes not yet added to CharacterVote.amount."""
+        if self.ingestion == self.Ingestion.BUFFERED:
+            return get_vote_buffer().pending(self.id, VoteFlush.committed)
+        if self.ingestion == self.Ingestion.LEDGER:
+            events = self.events\
+                .filter(compacted=False)\
+                .values('character_id')\
+                .annotate(amount=models.Count('id'))\
+                .values_list('character_id', 'amount')
+            return dict(events)
+        if self.shards > 1:
+            shards = self.vote_shards\
+                .values('character_id')\
+                .annotate(amount=models.Sum('amount'))\
+                .values_list('character_id', 'amount')
+            return dict(shards)
+        return {}
+
+    def pending_votes_expression(self, character='pk') -> models.Expression:
+        """pending_votes as SQL for querysets with the character id ref."""
+        if self.ingestion == self.Ingestion.BUFFERED:
+            pending = self.pending_votes()
+            return models.Case(
+                *[models.When(**{character: c}, then=models.Value(amount))
+                  for c, amount in pending.items()],
+                default=models.Value(0),
+            )
+        if self.ingestion == self.Ingestion.LEDGER:
+            pending = self.events\
+                .filter(compacted=False, character=models.OuterRef(character))\
+                .values('character')\
+                .annotate(amount=models.Count('id'))\
+                .values('amount')
+        elif self.shards > 1:
+            pending = self.vote_shards\
+                .filter(character=models.OuterRef(character))\
+                .values('character')\
+                .annotate(amount=models.Sum('amount'))\
+                .values('amount')
+        else:
+            return models.Value(0)
+        return Coalesce(models.Subquery(pending), 0)
+
+    @property
+    def has_pending_votes(self) -> bool:
+        return self.ingestion != self.Ingestion.DIRECT or self.shards > 1
+
+    def vote_totals(self) -> dict[int, int]:
+        """Member votes by character id, pending votes included."""
+        pending = self.pending_votes()
+        amounts = self.votes.values_list('character_id', 'amount')
+        return {c: amount + pending.get(c, 0) for c, amount in amounts}
+
     class Meta:
         ordering = ['-id']
 
 
+class VotingLeader(models.Model):
+    """
+        Voting.leader_votes, raised by votes. Kept out of the Voting row,
+        which votes write only when they finish the voting.
+    """
+    voting = models.OneToOneField('Voting', primary_key=True,
+                                  related_name='leader',
+                                  on_delete=models.CASCADE)
+    votes = models.IntegerField()
+
+
 class Character(models.Model):
     last_name = models.CharField(max_length=100, unique=True, blank=False)
     first_name = models.CharField(max_length=100, blank=True)
@@ -38,31 +170,97 @@ class CharacterVote(models.Model):
     character = models.ForeignKey('Character', related_name='votes',
                                   on_delete=models.CASCADE)
     amount = models.IntegerField()
+    # Votes counted before the voting kept a ledger, see votings/ledger.py
+    baseline = models.IntegerField(default=0)
 
     class Meta:
         constraints = [models.UniqueConstraint(fields=['voting', 'character'],
                        name='unique_voting_character')]
 
 
+class VoteShard(models.Model):
+    voting = models.ForeignKey('Voting', related_name='vote_shards',
+                               on_delete=models.CASCADE)
+    character = models.ForeignKey('Character', related_name='vote_shards',
+                                  on_delete=models.CASCADE)
+    index = models.PositiveSmallIntegerField()
+    amount = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(
+            fields=['voting', 'character', 'index'],
+            name='unique_voting_character_shard',
+        )]
+
+
+class VoteEvent(models.Model):
+    voting = models.ForeignKey('Voting', related_name='events',
+                               on_delete=models.CASCADE)
+    character = models.ForeignKey('Character', related_name='events',
+                                  on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    compacted = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [models.Index(fields=['voting', 'character'],
+                                condition=models.Q(compacted=False),
+                                name='vote_event_uncompacted')]
+
+
+class VoteFlush(models.Model):
+    """
+        Token of a vote buffer flush, committed with its deltas. A flush
+        retried after a crash finds it and does not add them again, reads
+        find it and do not count the flushing deltas as pending.
+    """
+    token = models.CharField(max_length=32, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def committed(cls, token: str) -> bool:
+        """Whether the deltas of the flush are in CharacterVote.amount."""
+        return cls.objects.filter(token=token).exists()
+
+
 class ExportTask(models.Model):
+    class Format(models.TextChoices):
+        XLSX = 'xlsx'
+        CSV = 'csv'
+        NDJSON = 'ndjson'
+        PARQUET = 'parquet'
+
     execute_at = models.DateTimeField(blank=False)
     e_mail = models.EmailField(blank=False)
     voting = models.ForeignKey('Voting', on_delete=models.DO_NOTHING,
                                blank=False)
     task_id = models.CharField(max_length=100, null=True)
-    xlsx = models.FileField(upload_to='reports/', null=True, default=None)
+    format = models.CharField(max_length=10, choices=Format.choices,
+                              default=Format.XLSX)
+    file = models.FileField(upload_to='reports/', null=True, default=None)
+    # Set once the report email is sent
+    sent_at = models.DateTimeField(null=True, blank=True)
+    # Set by the worker building and sending the report, see claim_report
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    # Claims so far, the report is given up after REPORT_MAX_ATTEMPTS
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Set by dispatch_reports when it queues the report for sending
+    dispatched_at = models.DateTimeField(null=True, blank=True)
 
     def save(self, *args, **kwargs) -> None:
         super().save(*args, **kwargs)
-        if not self.task_id:
+        # The database scheduler finds due rows itself, see dispatch_reports
+        if settings.REPORT_SCHEDULER == 'eta' and not self.task_id:
             task_id = celery.current_app.send_task(
                 args=[self.id],
                 name='report',
                 eta=self.execute_at,
             )
             self.task_id = task_id
-            super(ExportTask, self).save(*args, **kwargs)
+            super(ExportTask, self).save(update_fields=['task_id'])
 
     class Meta:
         verbose_name = 'Reports'
         verbose_name_plural = 'Reports'
+        indexes = [models.Index(fields=['execute_at'],
+                                condition=models.Q(sent_at=None),
+                                name='export_task_unsent')]
@@ -0,0 +1,91 @@
+from django.core.paginator import InvalidPage
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """Keyset pagination by id, no COUNT(*) and no OFFSET."""
+    ordering = 'id'
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset reading the page with the async ORM."""
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        offset, reverse, position = self.cursor or (0, False, None)
+
+        if position is not None:
+            lookup = 'id__lt' if reverse else 'id__gt'
+            queryset = queryset.filter(**{lookup: position})
+        queryset = queryset.order_by('-id' if reverse else 'id')
+        rows = queryset[offset:offset + self.page_size + 1]
+        results = [row async for row in rows]
+        self.page = results[:self.page_size]
+
+        following = None
+        if len(results) > self.page_size:
+            following = self._get_position_from_instance(results[-1],
+                                                         self.ordering)
+        moved = position is not None or offset > 0
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.next_position = moved, position
+            self.has_previous = following is not None
+            self.previous_position = following
+        else:
+            self.has_next = following is not None
+            self.next_position = following
+            self.has_previous, self.previous_position = moved, position
+        return self.page
+
+
+class OptionalCursorPagination(PageNumberPagination):
+    """
+        Page numbers by default. Requests with ?pagination=cursor or
+        a ?cursor= from a previous page get IdCursorPagination.
+    """
+    cursor_class = IdCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor = None
+        if self.is_cursor_request(request):
+            self.cursor = self.cursor_class()
+            return self.cursor.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset for async views, see async_views.py."""
+        self.cursor = None
+        if self.is_cursor_request(request):
+            self.cursor = self.cursor_class()
+            return await self.cursor.apaginate_queryset(queryset, request,
+                                                        view)
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Set ahead, so the paginator does not count synchronously
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)))
+        self.page.object_list = [row async for row in self.page.object_list]
+        self.request = request
+        return list(self.page)
+
+    def get_paginated_response(self, data):
+        if self.cursor:
+            return self.cursor.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def is_cursor_request(self, request) -> bool:
+        params = request.query_params
+        return self.cursor_class.cursor_query_param in params or \
+            params.get('pagination') == 'cursor'
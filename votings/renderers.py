@@ -0,0 +1,34 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+        JSONRenderer bytes from orjson, when it is installed and the
+        output is compact. orjson writes float exponents like 1e-5, not
+        1e-05, views with floats in their data keep JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or data is None or indent is not None or \
+                not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME |
+                orjson.OPT_NON_STR_KEYS,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        # Like JSONRenderer, keep the output a strict javascript subset
+        return ret.replace('\u2028'.encode(), b'\\u2028')\
+            .replace('\u2029'.encode(), b'\\u2029')
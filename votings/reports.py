@@ -0,0 +1,117 @@
+"""
+    Report files of send_report. They are stored content addressed, as
+    reports/<sha256>.<format>, so ExportTasks with the same report share
+    one file. Reports of finished votings are built once per (voting id,
+    voting version, format), later ExportTasks reuse the stored file.
+"""
+import hashlib
+import logging
+import tempfile
+import time
+from functools import partial
+from typing import Callable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+
+from votings.exports import write_export
+from votings.models import ExportTask, Voting
+from votings.versions import CHARACTERS, VOTING, get_versions
+
+STATS = ('hits', 'misses')
+# Seconds between reads of a report another worker builds
+LOCK_POLL_INTERVAL = 0.05
+
+
+def stat_key(stat: str) -> str:
+    return f'votings:reports:{stat}'
+
+
+def count(stat: str) -> None:
+    """Report hits and misses of all workers, in the shared cache."""
+    cache.add(stat_key(stat), 0, timeout=None)
+    cache.incr(stat_key(stat))
+
+
+def report_stats() -> dict[str, int]:
+    counts = cache.get_many([stat_key(s) for s in STATS])
+    return {s: counts.get(stat_key(s), 0) for s in STATS}
+
+
+def report_key(voting: Voting, export_format: str) -> str | None:
+    """
+        Key of reports of a finished voting, None for others. Votes and
+        last names in the report bump the versions of the key.
+    """
+    if voting.status != Voting.Status.FINISHED:
+        return None
+    versions = get_versions(VOTING.format(pk=voting.id), CHARACTERS)
+    version = hashlib.md5(str(versions).encode()).hexdigest()
+    return f'votings:report:{voting.id}:{version}:{export_format}'
+
+
+def build_report(voting: Voting, export_format: str,
+                 built: dict) -> dict:
+    """
+        Writes the report to a temporary file and copies it to storage
+        unless the same content is there. built gets its content, read
+        from the temporary file rather than storage.
+    """
+    storage = ExportTask.file.field.storage
+    digest = hashlib.sha256()
+    with tempfile.TemporaryFile() as file:
+        write_export(file, voting, export_format, settings.REPORT_CHUNK_SIZE)
+        file.seek(0)
+        while chunk := file.read(File.DEFAULT_CHUNK_SIZE):
+            digest.update(chunk)
+        name = f'reports/{digest.hexdigest()}.{export_format}'
+        if not storage.exists(name):
+            storage.save(name, File(file, name=name))
+        file.seek(0)
+        # The one copy in memory: EmailMessage.attach takes bytes and the
+        # mail backends encode the whole message before sending it
+        built['content'] = file.read()
+    return {'name': name}
+
+
+def report_entry(key: str, build: Callable[[], dict]) -> dict:
+    """
+        Cached entry of the report key, if its file is still in storage,
+        else build() under a lock of the key in the shared cache. Workers
+        missing the lock wait for the entry of its holder, and take the
+        lock themselves once it is gone without one.
+    """
+    storage = ExportTask.file.field.storage
+    lock = f'{key}:lock'
+    while True:
+        entry = cache.get(key)
+        if entry is not None and storage.exists(entry['name']):
+            return entry
+        if cache.add(lock, 1, timeout=settings.REPORT_LOCK_TIMEOUT):
+            break
+        time.sleep(LOCK_POLL_INTERVAL)
+    try:
+        entry = build()
+        cache.set(key, entry, timeout=None)
+        return entry
+    finally:
+        cache.delete(lock)
+
+
+def report_file(voting: Voting, export_format: str) -> tuple[str, bytes]:
+    """Storage name and content of the report, built or reused."""
+    key = report_key(voting, export_format)
+    built = {}
+    if key is None:
+        entry = build_report(voting, export_format, built)
+        return entry['name'], built['content']
+
+    entry = report_entry(
+        key, partial(build_report, voting, export_format, built))
+    count('misses' if built else 'hits')
+    logging.info(f'Report {key} {"built" if built else "reused"}')
+    if built:
+        return entry['name'], built['content']
+    with ExportTask.file.field.storage.open(entry['name'], 'rb') as file:
+        return entry['name'], file.read()
@@ -0,0 +1,212 @@
+import hashlib
+import threading
+import time
+from collections import Counter, OrderedDict
+from functools import lru_cache, partial
+from typing import Any, Callable
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.http.response import HttpResponseBase
+from rest_framework.request import Request
+
+from votings.compression import compress_all
+from votings.single_flight import SingleFlight
+
+
+class LocalLRU:
+    """Size bounded in-process cache, entries expire after timeout."""
+
+    def __init__(self, size: int, timeout: float) -> None:
+        self.size = size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self.lock:
+            expires, value = self.entries.get(key, (0, None))
+            if expires < time.monotonic():
+                self.entries.pop(key, None)
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        if self.size < 1:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+class ResponseCache:
+    """
+        Rendered responses in a LocalLRU in front of the shared Django
+        cache. Counts local_hits, shared_hits and misses per process.
+    """
+    poll_interval = 0.05
+
+    def __init__(self, options: dict) -> None:
+        self.shared = caches[options['CACHE']]
+        self.timeout = options['TIMEOUT']
+        self.lock_timeout = options['LOCK_TIMEOUT']
+        self.flight = SingleFlight()
+        self.local = LocalLRU(options['LOCAL_SIZE'],
+                              options['LOCAL_TIMEOUT'])
+        self.stats = Counter()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> dict | None:
+        entry = self.local.get(key)
+        if entry is not None:
+            self.count('local_hits')
+            return entry
+        entry = self.shared.get(key)
+        if entry is not None:
+            self.local.set(key, entry)
+            self.count('shared_hits')
+            return entry
+        self.count('misses')
+        return None
+
+    def set(self, key: str, entry: dict) -> None:
+        self.local.set(key, entry)
+        self.shared.set(key, entry, timeout=self.timeout)
+
+    def compute(self, key: str,
+                render: Callable[[], dict | None]) -> dict | None:
+        """
+            render() once for concurrent misses of the key in this
+            process, and with LOCK_TIMEOUT once across workers too.
+        """
+        return self.flight.do(key, lambda: self.render_locked(key, render))
+
+    def render_locked(self, key: str,
+                      render: Callable[[], dict | None]) -> dict | None:
+        lock = f'{key}:lock'
+        if not self.lock_timeout:
+            return self.render(key, render)
+        if not self.shared.add(lock, 1, timeout=self.lock_timeout):
+            return self.wait_for(key) or self.render(key, render)
+        try:
+            return self.render(key, render)
+        finally:
+            self.shared.delete(lock)
+
+    def render(self, key: str,
+               render: Callable[[], dict | None]) -> dict | None:
+        """
+            render() cached if it is a 200 entry. Others are only kept
+            for LOCK_TIMEOUT, for workers waiting on the lock.
+        """
+        entry = render()
+        if entry is None:
+            return None
+        if entry.get('status', 200) == 200:
+            self.set(key, entry)
+        elif self.lock_timeout:
+            self.shared.set(f'{key}:result', entry,
+                            timeout=self.lock_timeout)
+        return entry
+
+    def wait_for(self, key: str) -> dict | None:
+        """
+            Entry rendered by the worker holding the lock, None once the
+            lock is gone without one.
+        """
+        lock, result = f'{key}:lock', f'{key}:result'
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            found = self.shared.get_many([key, result, lock])
+            if key in found:
+                self.local.set(key, found[key])
+                return found[key]
+            if result in found:
+                return found[result]
+            if lock not in found:
+                return None
+        return None
+
+    def count(self, stat: str) -> None:
+        with self.lock:
+            self.stats[stat] += 1
+
+    def clear(self) -> None:
+        """Forgets the local tier and the counters."""
+        self.local.clear()
+        with self.lock:
+            self.stats.clear()
+
+
+@lru_cache
+def get_response_cache() -> ResponseCache:
+    return ResponseCache(settings.RESPONSE_CACHE)
+
+
+def response_key(request: Request, etag: str) -> str:
+    """The etag carries data versions, the uri query string and host."""
+    uri = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    version = etag.strip('"')
+    return f'votings:response:{version}:{uri}'
+
+
+def render_entry(view, request: Request,
+                 respond: Callable[[], HttpResponseBase],
+                 rendered: dict) -> dict:
+    """
+        Entry of respond(), the response goes to rendered. Entries keep
+        the content compressed too, so it is compressed once per fill,
+        not once per request. Only 200 entries are cached, see
+        ResponseCache.render, but concurrent misses share any.
+    """
+    response = view.finalize_response(request, respond())
+    rendered['response'] = response
+    response.render()
+    response.encoded = compress_all(response)
+    return {'content': response.content,
+            'content_type': response['Content-Type'],
+            'status': response.status_code,
+            'encoded': response.encoded}
+
+
+def entry_response(entry: dict) -> HttpResponse:
+    response = HttpResponse(entry['content'],
+                            content_type=entry['content_type'],
+                            status=entry.get('status', 200))
+    response.encoded = entry.get('encoded', {})
+    return response
+
+
+def cached_response(view, request: Request, etag: str,
+                    respond: Callable[[], HttpResponseBase]
+                    ) -> HttpResponseBase:
+    """
+        Rendered JSON response of the view from the cache, or respond()
+        rendered and cached. Concurrent misses share one respond().
+        Other formats, like the browsable API, hold per user content
+        and are not cached.
+    """
+    if request.accepted_renderer.format != 'json':
+        return respond()
+
+    cache = get_response_cache()
+    key = response_key(request, etag)
+    entry = cache.get(key)
+    if entry is not None:
+        return entry_response(entry)
+
+    rendered = {}
+    entry = cache.compute(
+        key, partial(render_entry, view, request, respond, rendered))
+    if 'response' in rendered:
+        return rendered['response']
+    return entry_response(entry)
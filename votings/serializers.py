@@ -1,20 +1,104 @@
+from operator import itemgetter
+
+from django.conf import settings
+from django.db.models import QuerySet
+from django.urls import reverse
+from django.utils.encoding import filepath_to_uri
 from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.request import Request
+from votings.buffers import buffered_leader_votes
+from votings.counters import leader_votes_expression
 from votings.models import Character, CharacterVote, Voting
-from votings.utilities import calculate_age
+from votings.utilities import age_expression, calculate_age
+
+
+def requested_fields(request: Request | None,
+                     allowed: list[str]) -> list[str] | None:
+    """
+        Fields picked by ?fields=id,title of a read request, in allowed
+        order, or None when it picks none.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    names = request.query_params.get('fields')
+    if not names:
+        return None
+    picked = {name.strip() for name in names.split(',')} - {''}
+    if picked - set(allowed):
+        raise ParseError(f'fields can be {", ".join(allowed)}')
+    return [name for name in allowed if name in picked]
+
+
+def sparse_query(query: QuerySet, serializer: type['SparseFieldsMixin'],
+                 request: Request) -> QuerySet:
+    """
+        query loading only the columns of the ?fields= of serializer,
+        with the annotations those are read from.
+    """
+    fields = requested_fields(request, serializer.Meta.fields)
+    query = serializer.annotate(query, fields or serializer.Meta.fields)
+    if fields is None:
+        return query
+    columns = {column for name in fields
+               for column in serializer.columns.get(name, [name])}
+    return query.only('id', *columns)
 
 
-class VotingSerializer(serializers.HyperlinkedModelSerializer):
-    leader_votes = serializers.IntegerField(read_only=True)
+class SparseFieldsMixin:
+    """
+        Serializes only the fields of ?fields=, see sparse_query.
+        columns are the model columns of fields not named like one.
+    """
+    columns: dict[str, list[str]] = {}
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        fields = requested_fields(self.context.get('request'),
+                                  self.Meta.fields)
+        for name in set(self.fields) - set(fields or self.fields):
+            self.fields.pop(name)
+
+    @classmethod
+    def annotate(cls, query: QuerySet, fields: list[str]) -> QuerySet:
+        """query with the annotations fields are read from."""
+        return query
+
+
+class VotingSerializer(SparseFieldsMixin,
+                       serializers.HyperlinkedModelSerializer):
+    leader_votes = serializers.IntegerField(source='total_leader_votes',
+                                            read_only=True)
+    columns = {
+        'url': [],
+        'leader_votes': ['ingestion', 'shards'],
+    }
 
     class Meta:
         model = Voting
         fields = ['url', 'id', 'title', 'start_date', 'end_date',
                   'max_votes', 'leader_votes']
 
+    @classmethod
+    def annotate(cls, query: QuerySet, fields: list[str]) -> QuerySet:
+        if 'leader_votes' in fields:
+            query = query.annotate(
+                counted_leader_votes=leader_votes_expression())
+        return query
+
 
-class CharacterSerializer(serializers.HyperlinkedModelSerializer):
+class CharacterSerializer(SparseFieldsMixin,
+                          serializers.HyperlinkedModelSerializer):
     votes_amount = serializers.IntegerField(read_only=True)
     age = serializers.SerializerMethodField()
+    columns = {
+        'url': [],
+        'age': ['birth_date'],
+        'votes_amount': [],
+        'rank': [],
+        'percentage': [],
+    }
 
     class Meta:
         model = Character
@@ -25,7 +109,123 @@ class CharacterSerializer(serializers.HyperlinkedModelSerializer):
         return calculate_age(obj.birth_date)
 
 
+class MemberSerializer(CharacterSerializer):
+    rank = serializers.IntegerField(read_only=True)
+    percentage = serializers.FloatField(read_only=True)
+
+    class Meta(CharacterSerializer.Meta):
+        fields = CharacterSerializer.Meta.fields + ['rank', 'percentage']
+
+
+class LeaderSerializer(CharacterSerializer):
+    rank = serializers.IntegerField(read_only=True)
+
+    class Meta(CharacterSerializer.Meta):
+        fields = CharacterSerializer.Meta.fields + ['rank']
+
+
+class RowSerializer:
+    """
+        Serializer output of list pages from values() rows, without
+        model instances. url comes from a template reversed once per
+        page, not once per row. Fields are read by represent_<field>
+        methods, or straight from the row.
+    """
+    fields: list[str]
+    view_name: str
+    columns: dict[str, list[str]] = {'url': []}
+
+    def __init__(self, request: Request, format: str | None = None) -> None:
+        self.request = request
+        kwargs = {'pk': 'PK'}
+        if format:
+            kwargs['format'] = format
+        url = request.build_absolute_uri(reverse(self.view_name,
+                                                 kwargs=kwargs))
+        self.url_head, _, self.url_tail = url.rpartition('PK')
+
+        self.fields = requested_fields(request, self.fields) or self.fields
+        self.representers = [
+            (name, getattr(self, f'represent_{name}', itemgetter(name)))
+            for name in self.fields
+        ]
+
+    def represent_url(self, row: dict) -> str:
+        return f'{self.url_head}{row["id"]}{self.url_tail}'
+
+    def values(self, query: QuerySet) -> QuerySet:
+        columns = {column for name in self.fields
+                   for column in self.columns.get(name, [name])}
+        return query.values('id', *columns)
+
+    def data(self, rows: list[dict]) -> list[dict]:
+        return [{name: represent(row) for name, represent in self.representers}
+                for row in rows]
+
+
+class VotingRowSerializer(RowSerializer):
+    """VotingSerializer output."""
+    fields = VotingSerializer.Meta.fields
+    view_name = 'voting-detail'
+    columns = {
+        **VotingSerializer.columns,
+        'leader_votes': ['counted_leader_votes', 'ingestion'],
+    }
+
+    def values(self, query: QuerySet) -> QuerySet:
+        return super().values(VotingSerializer.annotate(query, self.fields))
+
+    def data(self, rows: list[dict]) -> list[dict]:
+        if 'leader_votes' in self.fields:
+            # Buffered votings of the page read the vote buffer at once
+            self.buffered_leader_votes = buffered_leader_votes([
+                Voting(id=row['id'], ingestion=row['ingestion'])
+                for row in rows if row['ingestion'] == Voting.Ingestion.BUFFERED
+            ])
+        return super().data(rows)
+
+    def represent_start_date(self, row: dict) -> str:
+        return row['start_date'].isoformat()
+
+    def represent_end_date(self, row: dict) -> str:
+        return row['end_date'].isoformat()
+
+    def represent_leader_votes(self, row: dict) -> int | None:
+        if row['ingestion'] == Voting.Ingestion.BUFFERED:
+            return self.buffered_leader_votes[row['id']]
+        return row['counted_leader_votes']
+
+
+class CharacterRowSerializer(RowSerializer):
+    """CharacterSerializer output of characters without votes_amount."""
+    fields = [name for name in CharacterSerializer.Meta.fields
+              if name != 'votes_amount']
+    view_name = 'character-detail'
+
+    def __init__(self, request: Request, format: str | None = None) -> None:
+        super().__init__(request, format)
+        # FileSystemStorage.url() joins base_url and the name, once here
+        storage = Character._meta.get_field('photo').storage
+        self.media_url = request.build_absolute_uri(storage.base_url)
+
+    def values(self, query: QuerySet) -> QuerySet:
+        if 'age' in self.fields:
+            query = query.annotate(age=age_expression())
+        return super().values(query)
+
+    def represent_photo(self, row: dict) -> str | None:
+        if not row['photo']:
+            return None
+        return self.media_url + filepath_to_uri(row['photo']).lstrip('/')
+
+
 class CharacterVoteSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = CharacterVote
         fields = ['voting', 'character']
+
+
+class VoteEntrySerializer(serializers.Serializer):
+    character = serializers.IntegerField()
+    count = serializers.IntegerField(
+        min_value=1, max_value=settings.VOTES_MAX_ENTRY_COUNT)
@@ -3,10 +3,20 @@ import os
 
 from celery.result import AsyncResult
 from django.conf import settings
-from django.db.models.signals import pre_delete, pre_save
-from django.dispatch.dispatcher import receiver
+from django.db.models.signals import post_delete, post_save, pre_delete, \
+    pre_save
+from django.dispatch.dispatcher import Signal, receiver
 
-from .models import Character, ExportTask
+from .buffers import get_vote_buffer
+from .counters import refresh_leader_votes
+from .ledger import set_ledger_baseline
+from .leaderboards import get_leaderboard
+from .models import Character, CharacterVote, ExportTask, Voting
+from .versions import CHARACTERS, bump_versions, bump_voting_versions
+from .winners import cache_winner, forget_winner
+
+# Sent once per voting by the update_statuses task with voting=<Voting>
+voting_finished = Signal()
 
 
 @receiver(pre_delete, sender=Character)
@@ -32,17 +42,87 @@ def delete_prev_photo(sender, instance, *args, **kwargs):
                         f'{instance.id} previous photo.')
 
 
-@receiver(pre_delete, sender=ExportTask)
-def delete_result_xlsx(sender, instance: ExportTask, **kwargs):
+@receiver(post_delete, sender=ExportTask)
+def forget_task_result(sender, instance: ExportTask, **kwargs):
+    """ExportTasks of the database scheduler have no ETA task."""
+    if not instance.task_id:
+        return
     try:
         AsyncResult(instance.task_id).forget()
     except Exception:
         logging.warning('Failed to delete export task id '
                         f'{instance.id} celery result.')
 
-    if instance.xlsx:
+
+@receiver(post_delete, sender=ExportTask)
+def delete_result_file(sender, instance: ExportTask, **kwargs):
+    # Reports are shared by ExportTasks with the same content, after
+    # the delete the tasks left are the ones still using the file
+    if instance.file and \
+            not ExportTask.objects.filter(file=instance.file.name).exists():
         try:
-            instance.xlsx.delete(save=False)
+            instance.file.delete(save=False)
         except Exception:
             logging.warning('Failed to delete export task id '
-                            f'{instance.id} xlsx.')
+                            f'{instance.id} file.')
+
+
+@receiver(post_save, sender=CharacterVote)
+@receiver(post_delete, sender=CharacterVote)
+def refresh_voting_leader(sender, instance: CharacterVote, **kwargs):
+    """
+        Keeps leader_votes and status after member votes are edited,
+        drops the cached winner, the leaderboard and the vote buffer
+        totals.
+    """
+    refresh_leader_votes([instance.voting_id])
+    forget_winner(instance.voting_id)
+    get_leaderboard().discard(instance.voting_id)
+    get_vote_buffer().discard_totals(instance.voting_id)
+    voting = Voting.objects.filter(id=instance.voting_id).first()
+    if voting:
+        voting.save(update_fields=['status'])
+    if voting and voting.ingestion == Voting.Ingestion.LEDGER:
+        # Edited amounts are counted, rebuild_votes keeps them
+        set_ledger_baseline(voting, instance.character_id)
+
+
+@receiver(voting_finished)
+def warm_winner(sender, voting: Voting, **kwargs):
+    """Results of a finished voting are final, cache its winner."""
+    cache_winner(voting)
+
+
+@receiver(pre_save, sender=Voting)
+def keep_ledger_baseline(sender, instance: Voting, update_fields=None,
+                         **kwargs):
+    """Votes of a voting switched to the ledger, for rebuild_votes."""
+    if instance.ingestion != Voting.Ingestion.LEDGER or not instance.pk or \
+            (update_fields and 'ingestion' not in update_fields):
+        return
+    former = Voting.objects\
+        .filter(id=instance.pk)\
+        .exclude(ingestion=Voting.Ingestion.LEDGER)\
+        .first()
+    if former:
+        set_ledger_baseline(former)
+
+
+@receiver(post_save, sender=Voting)
+def forget_buffer_totals(sender, instance: Voting, **kwargs):
+    """Votes of other ingestions do not reach the vote buffer totals."""
+    if instance.ingestion != Voting.Ingestion.BUFFERED:
+        get_vote_buffer().discard_totals(instance.id)
+
+
+@receiver(post_save, sender=Voting)
+@receiver(post_delete, sender=Voting)
+def bump_voting_version(sender, instance: Voting, **kwargs):
+    """Conditional GETs of the voting see edits and status changes."""
+    bump_voting_versions(instance.id)
+
+
+@receiver(post_save, sender=Character)
+@receiver(post_delete, sender=Character)
+def bump_character_version(sender, instance: Character, **kwargs):
+    bump_versions(CHARACTERS)
@@ -0,0 +1,44 @@
+import threading
+from typing import Any, Callable
+
+
+class Flight:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+        Concurrent calls with the same key in this process wait for the
+        first one, the leader, and share its result or exception.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.flights = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return flight.result
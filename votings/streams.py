@@ -0,0 +1,176 @@
+import asyncio
+import json
+import logging
+from typing import AsyncIterator
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+
+from votings.models import Voting
+from votings.versions import VOTING, get_versions
+
+
+def release_connection() -> None:
+    """Streams outlive their requests, so do not keep a connection."""
+    if not connection.in_atomic_block:
+        connection.close()
+
+
+def voting_exists(voting_id: int) -> bool:
+    try:
+        return Voting.objects.filter(id=voting_id).exists()
+    finally:
+        release_connection()
+
+
+def read_totals(voting_id: int) -> dict[int, int]:
+    try:
+        voting = Voting.objects.filter(id=voting_id).first()
+        return voting.vote_totals() if voting else {}
+    finally:
+        release_connection()
+
+
+class Subscriber:
+    """Member votes a client has not read yet, later ones overwrite."""
+
+    def __init__(self, votes: dict[int, int]) -> None:
+        self.votes = dict(votes)
+        self.ready = asyncio.Event()
+        if self.votes:
+            self.ready.set()
+
+    def push(self, votes: dict[int, int]) -> None:
+        self.votes.update(votes)
+        self.ready.set()
+
+    async def next(self) -> dict[int, int]:
+        await self.ready.wait()
+        self.ready.clear()
+        votes, self.votes = self.votes, {}
+        return votes
+
+
+class VotingBroadcaster:
+    """
+        The one poll of a voting in this worker. Every interval it reads
+        the voting version, and when it changed the member totals, then
+        pushes the changed totals to all subscribers.
+    """
+
+    def __init__(self, voting_id: int, interval: float) -> None:
+        self.voting_id = voting_id
+        self.interval = interval
+        self.subscribers: set[Subscriber] = set()
+        self.totals: dict[int, int] = {}
+        self.version = None
+        self.task = None
+        self.reads = 0
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self.totals)
+        self.subscribers.add(subscriber)
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self.subscribers.discard(subscriber)
+        if not self.subscribers:
+            self.task.cancel()
+            self.leave()
+
+    def leave(self) -> None:
+        if broadcasters.get(self.voting_id) is self:
+            del broadcasters[self.voting_id]
+
+    async def run(self) -> None:
+        """
+            Polls until cancelled. A failed poll is logged and retried,
+            after twice the delay of the previous one, up to MAX_BACKOFF.
+        """
+        failures = 0
+        try:
+            while True:
+                try:
+                    await self.poll()
+                    failures = 0
+                except Exception as error:
+                    failures += 1
+                    logging.warning(f'Couldn\'t poll voting '
+                                    f'{self.voting_id}: {error!r}')
+                await asyncio.sleep(min(
+                    self.interval * 2 ** failures,
+                    settings.VOTES_STREAM['MAX_BACKOFF'],
+                ))
+        finally:
+            self.leave()
+
+    async def poll(self) -> None:
+        scope = VOTING.format(pk=self.voting_id)
+        version = await sync_to_async(get_versions)(scope)
+        if version == self.version:
+            return
+        self.version = version
+        totals = await sync_to_async(read_totals)(self.voting_id)
+        self.reads += 1
+        changed = {c: n for c, n in totals.items() if self.totals.get(c) != n}
+        self.totals = totals
+        if changed:
+            for subscriber in self.subscribers:
+                subscriber.push(changed)
+
+
+broadcasters: dict[int, VotingBroadcaster] = {}
+
+
+def get_broadcaster(voting_id: int) -> VotingBroadcaster:
+    if voting_id not in broadcasters:
+        interval = settings.VOTES_STREAM['INTERVAL_MS'] / 1000
+        broadcasters[voting_id] = VotingBroadcaster(voting_id, interval)
+    return broadcasters[voting_id]
+
+
+async def voting_events(voting_id: int) -> AsyncIterator[str]:
+    """
+        Server-sent events with member votes of the voting: all of them
+        first, then the changed ones. Ends after MAX_SECONDS, clients
+        reconnect after RETRY_MS.
+    """
+    options = settings.VOTES_STREAM
+    broadcaster = get_broadcaster(voting_id)
+    subscriber = broadcaster.subscribe()
+    loop = asyncio.get_running_loop()
+    ends = loop.time() + options['MAX_SECONDS']
+    try:
+        yield f'retry: {options["RETRY_MS"]}\n\n'
+        while (left := ends - loop.time()) > 0:
+            try:
+                votes = await asyncio.wait_for(
+                    subscriber.next(), min(options['KEEPALIVE'], left))
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            yield f'event: votes\ndata: {json.dumps(votes)}\n\n'
+    finally:
+        broadcaster.unsubscribe(subscriber)
+
+
+class VotingEventStream:
+    """
+        voting_events for StreamingHttpResponse. The response calls close()
+        from any thread when it is done, the generator is closed in its
+        event loop and the subscriber leaves the broadcaster.
+    """
+
+    def __init__(self, voting_id: int) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.events = voting_events(voting_id)
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self.events
+
+    def close(self) -> None:
+        self.loop.call_soon_threadsafe(
+            lambda: self.loop.create_task(self.events.aclose()))
@@ -1,35 +1,42 @@
 import logging
+from datetime import timedelta
 
 from django.conf import settings
-from django.core.files.base import ContentFile
-from django.core.mail import EmailMessage
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
 
 from API_project.celery import app
-from votings.models import ExportTask
-from votings.utilities import create_report_xlsx, is_active_voting
+from votings.counters import compact_vote_events, flush_buffered_votes
+from votings.exports import CONTENT_TYPES, batches
+from votings.models import ExportTask, Voting
+from votings.reports import report_file
+from votings.signals import voting_finished
+from votings.utilities import is_active_voting
+from votings.versions import bump_voting_versions
 
 
-@app.task(name='report')
-def send_report(export_task_id: int):
-    """Sends an xlsx voting report by email ExportTask is created."""
-    export_task = ExportTask.objects.filter(id=export_task_id).get()
+def save_report(export_task: ExportTask) -> bytes:
+    """Points ExportTask.file to its report and returns the report bytes."""
+    name, content = report_file(export_task.voting, export_task.format)
+    export_task.file.name = name
+    export_task.save(update_fields=['file'])
+    return content
+
+
+def report_message(export_task: ExportTask) -> EmailMessage:
+    """The report email of the ExportTask, its report built or reused."""
     voting = export_task.voting
 
     is_active = is_active_voting(voting)
     max_condition = voting.max_votes if voting.max_votes else 'no'
     attachment_str: str | None = None
-    attachment_file: str | None = None
+    attachment: bytes | None = None
+    file_name = f'voting_{voting.id}_members.{export_task.format}'
     if voting.votes.exists():
-        file_name = f'voting_{voting.id}_members.xlsx'
-        try:
-            data = create_report_xlsx(voting.votes.order_by('-amount'))
-            file = ContentFile(content=data, name=file_name)
-            export_task.xlsx.save(name=file_name, content=file)
-            attachment_str = 'See information about members in attachment.'
-            attachment_file = export_task.xlsx.path
-        except Exception:
-            logging.warning(f'Couldn\'t create xlsx for {export_task_id}')
-            return
+        attachment = save_report(export_task)
+        attachment_str = 'See information about members in attachment.'
     else:
         attachment_str = 'Voting has no members.'
 
@@ -50,7 +57,204 @@ def send_report(export_task_id: int):
         reply_to=[]
     )
 
-    if attachment_file:
-        email.attach_file(attachment_file)
+    if attachment:
+        email.attach(file_name, attachment,
+                     CONTENT_TYPES[export_task.format])
+    return email
+
+
+def claim_report(export_task_id: int) -> bool:
+    """
+        Claims the unsent report for sending, False when it is sent,
+        claimed by another worker within REPORT_SEND_TIMEOUT or given up
+        after REPORT_MAX_ATTEMPTS claims.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.REPORT_SEND_TIMEOUT)
+    return ExportTask.objects\
+        .filter(id=export_task_id, sent_at=None,
+                attempts__lt=settings.REPORT_MAX_ATTEMPTS)\
+        .filter(Q(claimed_at=None) | Q(claimed_at__lt=stale))\
+        .update(claimed_at=now, attempts=F('attempts') + 1) == 1
+
+
+def release_report(export_task_id: int, error: Exception) -> None:
+    """
+        Leaves a failed report unsent and unclaimed, for a later batch
+        unless it has used up its attempts.
+    """
+    logging.warning(f'Couldn\'t send report {export_task_id}: {error!r}')
+    ExportTask.objects.filter(id=export_task_id).update(claimed_at=None)
+    if ExportTask.objects.filter(
+            id=export_task_id,
+            attempts__gte=settings.REPORT_MAX_ATTEMPTS).exists():
+        logging.warning(f'Report {export_task_id} is given up after '
+                        f'{settings.REPORT_MAX_ATTEMPTS} attempts')
+
+
+def send_claimed_report(connection, export_task_id: int) -> int:
+    """
+        Builds the claimed report and sends it over connection, then
+        marks it sent. A failed send closes the connection, the next
+        report opens a new one.
+    """
+    try:
+        message = report_message(ExportTask.objects.get(id=export_task_id))
+    except Exception as error:
+        release_report(export_task_id, error)
+        return 0
+    try:
+        connection.open()
+        sent = connection.send_messages([message])
+    except Exception as error:
+        release_report(export_task_id, error)
+        connection.close()
+        return 0
+    if sent:
+        ExportTask.objects\
+            .filter(id=export_task_id)\
+            .update(sent_at=timezone.now())
+    return sent
+
+
+def send_batch(export_task_ids: list[int]) -> int:
+    """
+        Sends the reports claimed here over one connection of
+        EMAIL_BACKEND, each built right before it is sent.
+    """
+    sent = 0
+    connection = get_connection()
+    try:
+        for export_task_id in export_task_ids:
+            if claim_report(export_task_id):
+                sent += send_claimed_report(connection, export_task_id)
+    finally:
+        connection.close()
+    return sent
+
+
+@app.task(name='send_reports')
+def send_reports(export_task_ids: list[int]) -> int:
+    """
+        Emails reports of the ExportTasks, REPORT_EMAIL_BATCH_SIZE per
+        connection. Reports failing to build or send are left unsent and
+        do not stop the others.
+    """
+    sent = 0
+    for batch in batches(export_task_ids, settings.REPORT_EMAIL_BATCH_SIZE):
+        sent += send_batch(batch)
+    return sent
+
+
+@app.task(name='report')
+def send_report(export_task_id: int) -> int:
+    """
+        ETA task of an ExportTask in the 'eta' REPORT_SCHEDULER mode,
+        sends its report with the other due reports not sent yet in the
+        same batch.
+    """
+    due = ExportTask.objects\
+        .filter(execute_at__lte=timezone.now(), sent_at=None,
+                attempts__lt=settings.REPORT_MAX_ATTEMPTS)\
+        .exclude(id=export_task_id)\
+        .order_by('execute_at', 'id')\
+        .values_list('id', flat=True)
+    return send_reports(
+        [export_task_id, *due[:settings.REPORT_EMAIL_BATCH_SIZE - 1]])
+
+
+def claim_due_reports(limit: int) -> list[int]:
+    """
+        Marks up to limit due reports dispatched. Rows locked by another
+        run are skipped. Reports dispatched but still not sent after
+        REPORT_DISPATCH_TIMEOUT are due again, once no worker holds a
+        claim on them and until they are given up, see claim_report.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.REPORT_DISPATCH_TIMEOUT)
+    stale_claim = now - timedelta(seconds=settings.REPORT_SEND_TIMEOUT)
+    with transaction.atomic():
+        ids = list(
+            ExportTask.objects
+            .filter(execute_at__lte=now, sent_at=None,
+                    attempts__lt=settings.REPORT_MAX_ATTEMPTS)
+            .filter(Q(dispatched_at=None) | Q(dispatched_at__lt=stale))
+            .filter(Q(claimed_at=None) | Q(claimed_at__lt=stale_claim))
+            .order_by('execute_at', 'id')
+            .select_for_update(skip_locked=True)
+            .values_list('id', flat=True)[:limit]
+        )
+        ExportTask.objects.filter(id__in=ids).update(dispatched_at=now)
+    return ids
+
+
+@app.task(name='dispatch_reports')
+def dispatch_reports() -> list[int]:
+    """
+        Queues due reports, a send_reports task per REPORT_EMAIL_BATCH_SIZE
+        reports. Reports wait as ExportTask rows until due, not as ETA
+        tasks in the broker.
+    """
+    if settings.REPORT_SCHEDULER != 'database':
+        return []
+    dispatched = []
+    while ids := claim_due_reports(settings.REPORT_EMAIL_BATCH_SIZE):
+        send_reports.delay(ids)
+        dispatched += ids
+    return dispatched
+
+
+@app.task(name='flush_votes')
+def flush_votes() -> int:
+    """Adds votes accumulated in the vote buffer to CharacterVote.amount."""
+    return flush_buffered_votes()
+
+
+@app.task(name='compact_votes')
+def compact_votes() -> int:
+    """Folds ledger VoteEvents into CharacterVote.amount."""
+    return compact_vote_events(settings.VOTES_COMPACTION_BATCH)
+
+
+@app.task(name='update_statuses')
+def update_statuses() -> list[int]:
+    """
+        Moves votings between statuses at their date boundaries,
+        stamps finished_at and sends voting_finished for every voting
+        finished by date or by max votes since the last run. Votings
+        leaving FINISHED have finished_at cleared.
+    """
+    today = timezone.now().date()
+    started = Voting.objects.filter(status=Voting.Status.SCHEDULED,
+                                    start_date__lt=today,
+                                    end_date__gte=today)
+    ended = Voting.objects\
+        .filter(end_date__lt=today)\
+        .exclude(status=Voting.Status.FINISHED)
+    moved = []
+    for votings, changes in [
+        (started, {'status': Voting.Status.ACTIVE, 'finished_at': None}),
+        (ended, {'status': Voting.Status.FINISHED}),
+    ]:
+        ids = list(votings.values_list('id', flat=True))
+        votings.filter(id__in=ids).update(**changes)
+        moved += ids
+    if moved:
+        bump_voting_versions(*moved)
+
+    with transaction.atomic():
+        finished = list(
+            Voting.objects
+            .filter(status=Voting.Status.FINISHED, finished_at__isnull=True)
+            .select_for_update(skip_locked=True)
+        )
+        Voting.objects\
+            .filter(id__in=[voting.id for voting in finished])\
+            .update(finished_at=timezone.now())
+    if finished:
+        # Reports of the voting carry finished_at, see reports.report_key
+        bump_voting_versions(*[voting.id for voting in finished])
 
-    email.send()
+    for voting in finished:
+        voting_finished.send(sender=Voting, voting=voting)
+    return [voting.id for voting in finished]
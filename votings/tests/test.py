@@ -1,14 +1,61 @@
-from datetime import datetime
+import asyncio
+import gzip
+import hashlib
+import json
+from datetime import datetime, timedelta
 import os
-from django.test import TestCase
-from ..models import Voting, Character, CharacterVote
+import socketserver
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+from unittest import mock
+from xml.etree import ElementTree
+from concurrent.futures import ThreadPoolExecutor
+from django.test import (Client, RequestFactory, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from ..buffers import get_vote_buffer
+from ..forms import ExportTaskForm
+from ..counters import add_vote, voting_leaderboard
+from ..leaderboards import get_leaderboard
+from ..ledger import rebuild_votes
+from ..models import (Voting, Character, CharacterVote, ExportTask,
+                      VoteEvent, VoteFlush,
+                      VoteShard)
+from ..signals import voting_finished
+from ..tasks import (compact_votes, dispatch_reports, flush_votes,
+                     send_report, send_reports, update_statuses)
+from ..utilities import write_report_xlsx
 from freezegun import freeze_time
 from django.urls import reverse
 from django.utils import timezone
 from django.db.models import Sum
 from django.contrib.auth.models import User
+from django.core import mail
 import io
 from django.conf import settings
+from django.db import connection, transaction
+from django.core.management import call_command
+from django.core.cache import cache
+from django.contrib.admin import site
+from ..admin import VotingAdmin
+from .. import compression, exports, reports
+from .. import tasks as reports_tasks
+from ..reports import report_file, report_stats
+from ..response_cache import ResponseCache, get_response_cache
+from ..single_flight import SingleFlight
+from ..streams import VotingBroadcaster, broadcasters
+from asgiref.sync import sync_to_async
+from ..versions import (CHARACTERS, VOTING, bump_versions,
+                        bump_voting_versions, get_versions)
+from ..winners import winner_key
+from ..renderers import FastJSONRenderer
+from ..serializers import CharacterSerializer, VotingSerializer
+from ..views import VotingViewSet
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
 
 
 class TestVotings(TestCase):
@@ -24,6 +71,11 @@ class TestVotings(TestCase):
         self.finished_title = 'Самый сильный'
         self.future_title = 'Самый смелый'
 
+        cache.clear()
+        get_response_cache().clear()
+        get_leaderboard().clear()
+        with freeze_time('2023-07-09'):
+            update_statuses()
         self.voting_1 = Voting.objects.get(id=1)
         self.voting_2 = Voting.objects.get(id=2)
         self.voting_3 = Voting.objects.get(id=3)
@@ -256,6 +308,60 @@ class TestVotings(TestCase):
             r_names,
         )
 
+    def test_members_ranking(self):
+        for character, amount in [(self.character_1, 10),
+                                  (self.character_2, 30),
+                                  (self.character_3, 10)]:
+            CharacterVote.objects.create(voting=self.voting_1,
+                                         character=character, amount=amount)
+        CharacterVote.objects.create(voting=self.voting_2,
+                                     character=self.character_1, amount=99)
+
+        # Voting lookup, page count and the ranked page itself
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('voting-members',
+                                       kwargs={'pk': 1}))
+        members = response.json()['results']
+        self.assertEqual(
+            [(m['id'], m['votes_amount'], m['rank'], m['percentage'])
+             for m in members],
+            [(1, 10, 2, 20.0), (2, 30, 1, 60.0), (3, 10, 2, 20.0)],
+        )
+
+        response = self.client.get(reverse('voting-members', kwargs={'pk': 1}),
+                                   {'ordering': '-votes'})
+        self.assertEqual([m['id'] for m in response.json()['results']],
+                         [2, 1, 3])
+
+        response = self.client.get(reverse('voting-members', kwargs={'pk': 1}),
+                                   {'top': 1})
+        self.assertEqual([m['id'] for m in response.json()['results']], [2])
+
+        for top in ['x', '0', '\u00b2']:
+            response = self.client.get(
+                reverse('voting-members', kwargs={'pk': 1}), {'top': top})
+            self.assertEqual(response.status_code, 400)
+
+    def test_members_pages(self):
+        for i in range(12):
+            character = Character.objects.create(
+                last_name=f'Member {i}', birth_date='2000-01-01')
+            CharacterVote.objects.create(voting=self.voting_1,
+                                         character=character, amount=i + 1)
+        url = reverse('voting-members', kwargs={'pk': 1})
+        members = [m for page in [1, 2] for m in self.client.get(
+            url, {'ordering': '-votes', 'page': page}).json()['results']]
+        self.assertEqual([m['rank'] for m in members], list(range(1, 13)))
+        self.assertEqual([m['votes_amount'] for m in members],
+                         list(range(12, 0, -1)))
+        self.assertAlmostEqual(sum(m['percentage'] for m in members), 100)
+
+        for query in [{'pagination': 'cursor'}, {'cursor': 'cD0x'}]:
+            for name in ['voting-members', 'async-voting-members']:
+                response = self.client.get(reverse(name, kwargs={'pk': 1}),
+                                           query)
+                self.assertEqual(response.status_code, 400)
+
     def test_winner_no_voting(self):
         Voting.objects.all().delete()
         self.assertIs(Voting.objects.all().exists(), False)
@@ -333,6 +439,196 @@ class TestVotings(TestCase):
             [winner['id'], winner['first_name']]
         )
 
+    @freeze_time('2023-07-09')
+    def test_winner_is_cached_for_finished_voting(self):
+        CharacterVote.objects.create(voting=self.voting_2,
+                                     character=self.character_1, amount=5)
+        url = reverse('voting-winner', kwargs={'pk': 2})
+        self.assertEqual(self.client.get(url).json()['id'], 1)
+        bump_versions(CHARACTERS)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.json()['votes_amount'], 5)
+
+        CharacterVote.objects.filter(voting=self.voting_2).update(amount=0)
+        CharacterVote.objects.create(voting=self.voting_2,
+                                     character=self.character_2, amount=3)
+        self.assertEqual(self.client.get(url).json()['id'], 2)
+
+    def test_winner_cached_when_voting_finishes(self):
+        CharacterVote.objects.create(voting=self.voting_1,
+                                     character=self.character_2, amount=7)
+        with freeze_time('2023-07-30'):
+            update_statuses()
+            with self.assertNumQueries(1):
+                response = self.client.get(
+                    reverse('voting-winner', kwargs={'pk': 1}))
+        self.assertEqual(response.json()['id'], 2)
+
+    @freeze_time('2023-07-09')
+    def test_winner_forgotten_on_admin_edit(self):
+        url = reverse('voting-winner', kwargs={'pk': 2})
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.voting_2.end_date = datetime(2023, 7, 20).date()
+        request = RequestFactory().post('/')
+        VotingAdmin(Voting, site).save_model(request, self.voting_2,
+                                             None, True)
+        detail = self.client.get(url).json()['detail']
+        self.assertEqual(detail, 'Voting id 2 is still active')
+
+    @freeze_time('2023-07-09')
+    def test_winners(self):
+        for voting, character, amount in [(self.voting_2, self.character_1, 5),
+                                          (self.voting_2, self.character_2, 9),
+                                          (self.voting_3, self.character_1, 4),
+                                          (self.voting_3, self.character_2, 4)]:
+            CharacterVote.objects.create(voting=voting, character=character,
+                                         amount=amount)
+        url = reverse('voting-winners')
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {'ids': '1,2,3,99,2'})
+        self.assertEqual(response.status_code, 200)
+        entries = response.json()
+        self.assertEqual([e['voting'] for e in entries], [1, 2, 3, 99])
+        self.assertEqual(entries[0]['detail'], 'Voting id 1 is still active')
+        self.assertEqual([entries[1]['winner']['id'],
+                          entries[1]['winner']['votes_amount']], [2, 9])
+        self.assertEqual(entries[2]['detail'],
+                         'Voting id 3 members have no leader')
+        self.assertEqual(entries[3]['detail'], 'Voting id 99 does not exist')
+
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {'finished': 'true'})
+        self.assertEqual(response.json()['count'], 1)
+        self.assertEqual(response.json()['results'][0]['winner']['id'], 2)
+
+        for ids in ['', '1,x', '1,\u00b2', ','.join(['1'] * 101)]:
+            response = self.client.get(url, {'ids': ids})
+            self.assertEqual(response.status_code, 400)
+
+    @freeze_time('2023-07-09')
+    def test_conditional_get(self):
+        CharacterVote.objects.create(voting=self.voting_1,
+                                     character=self.character_1, amount=0)
+        url = reverse('voting-members', kwargs={'pk': 1})
+        response = self.client.get(url)
+        etag = response.headers['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response.headers['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        self.client.put(reverse('voting-add-vote',
+                                kwargs={'pk': 1, 'pk_2': 1}))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['votes_amount'], 1)
+
+        etag = response.headers['ETag']
+        self.character_1.first_name = 'Wally'
+        self.character_1.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    @freeze_time('2023-07-09')
+    def test_conditional_get_scopes(self):
+        urls = [reverse('voting-detail', kwargs={'pk': 2}),
+                reverse('voting-list'),
+                reverse('character-list')]
+        etags = [self.client.get(url).headers['ETag'] for url in urls]
+        self.voting_1.title = 'Самый добрый'
+        self.voting_1.save()
+        codes = [self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code
+                 for url, etag in zip(urls, etags)]
+        self.assertEqual(codes, [304, 200, 304])
+
+    def test_response_cache(self):
+        stats = get_response_cache().stats
+        url = reverse('voting-list')
+        first = self.client.get(url, {'page': 1})
+        with self.assertNumQueries(0):
+            cached = self.client.get(url, {'page': 1})
+        self.assertEqual(cached.content, first.content)
+        self.assertEqual((stats['misses'], stats['local_hits']), (1, 1))
+
+        get_response_cache().local.clear()
+        self.client.get(url, {'page': 1})
+        self.assertEqual(stats['shared_hits'], 1)
+
+        self.voting_1.title = 'Самый добрый'
+        self.voting_1.save()
+        response = self.client.get(url, {'page': 1})
+        self.assertEqual(response.json()['results'][0]['title'],
+                         'Самый добрый')
+        self.assertEqual(stats['misses'], 2)
+
+    @freeze_time('2023-07-09')
+    def test_leaderboard(self):
+        for character, amount in [(self.character_1, 0),
+                                  (self.character_2, 5),
+                                  (self.character_3, 5)]:
+            CharacterVote.objects.create(voting=self.voting_1,
+                                         character=character, amount=amount)
+        url = reverse('voting-leaderboard', kwargs={'pk': 1})
+        response = self.client.get(url, {'top': 2})
+        self.assertEqual(
+            [(c['id'], c['votes_amount'], c['rank']) for c in response.json()],
+            [(3, 5, 1), (2, 5, 1)],
+        )
+
+        for _ in range(6):
+            self.client.put(reverse('voting-add-vote',
+                                    kwargs={'pk': 1, 'pk_2': 1}))
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(
+            [(c['id'], c['votes_amount'], c['rank']) for c in response.json()],
+            [(1, 6, 1), (3, 5, 2), (2, 5, 2)],
+        )
+
+        vote = CharacterVote.objects.get(voting=self.voting_1, character_id=1)
+        vote.amount = 1
+        vote.save()
+        response = self.client.get(url, {'top': 1})
+        self.assertEqual([c['id'] for c in response.json()], [3])
+
+        for top in ['0', '101', 'x', '\u00b2']:
+            response = self.client.get(url, {'top': top})
+            self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('voting-leaderboard',
+                                           kwargs={'pk': 99}))
+        self.assertEqual(response.json()['detail'],
+                         'Voting id 99 does not exist')
+
+    @freeze_time('2023-07-09')
+    def test_rebuild_leaderboards_command(self):
+        CharacterVote.objects.create(voting=self.voting_1,
+                                     character=self.character_2, amount=4)
+        out = io.StringIO()
+        call_command('rebuild_leaderboards', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Rebuilt 1 leaderboards.')
+        self.assertEqual(get_leaderboard().top(1, 10), [(2, 4)])
+
+    def test_leaderboard_ties_like_redis(self):
+        leaderboard = get_leaderboard()
+        leaderboard.rebuild(1, {9: 5, 10: 5, 2: 6})
+        self.assertEqual(leaderboard.top(1, 3), [(2, 6), (9, 5), (10, 5)])
+
+    def test_empty_leaderboard_is_not_rebuilt(self):
+        with freeze_time('2023-07-09 10:00'):
+            self.assertEqual(voting_leaderboard(1, 10), [])
+            with self.assertNumQueries(0):
+                self.assertEqual(voting_leaderboard(1, 10), [])
+            CharacterVote.objects.create(voting=self.voting_1,
+                                         character=self.character_2, amount=4)
+            self.assertEqual(voting_leaderboard(1, 10), [(2, 4)])
+            CharacterVote.objects.filter(voting=self.voting_1).delete()
+            self.assertEqual(voting_leaderboard(1, 10), [])
+        with freeze_time('2023-07-09 10:02'):
+            self.assertIs(get_leaderboard().exists(1), False)
+
     def test_characters_list(self):
         response = self.client.get(reverse('character-list'))
         self.assertEqual(response.status_code, 200)
@@ -388,6 +684,7 @@ class TestVotings(TestCase):
         detail = response.json()['detail']
         self.assertEqual(detail, 'Voting id 2 is finished')
 
+    @freeze_time('2023-07-09')
     def test_add_vote_no_member(self):
         self.assertIs(CharacterVote.objects.all().exists(), False)
         response = self.client.put(reverse('voting-add-vote',
@@ -396,6 +693,7 @@ class TestVotings(TestCase):
         detail = response.json()['detail']
         self.assertEqual(detail, 'Voting id 1 has no member id 1')
 
+    @freeze_time('2023-07-09')
     def test_add_vote(self):
         voting = Voting.objects.filter(id=1)\
             .prefetch_related('votes')\
@@ -412,6 +710,165 @@ class TestVotings(TestCase):
             self.assertEqual(response.status_code, 201)
             self.assertEqual(voting.get().votes_amount, i)
 
+    @freeze_time('2023-07-09')
+    def test_add_vote_leaves_voting_row(self):
+        CharacterVote.objects.create(voting=self.voting_1,
+                                     character=self.character_1, amount=0)
+        sql = 'SELECT ctid::text FROM votings_voting WHERE id = 1'
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            row = cursor.fetchone()
+            for _ in range(3):
+                add_vote(1, 1)
+            cursor.execute(sql)
+            self.assertEqual(cursor.fetchone(), row)
+        self.assertEqual(Voting.objects.get(id=1).leader_votes, 3)
+
+    def test_update_statuses(self):
+        finished = []
+
+        def on_finished(sender, voting, **kwargs):
+            finished.append(voting.id)
+
+        voting_finished.connect(on_finished)
+        self.addCleanup(voting_finished.disconnect, on_finished)
+        self.assertEqual(
+            [self.voting_1.status, self.voting_2.status, self.voting_3.status],
+            [Voting.Status.ACTIVE, Voting.Status.FINISHED,
+             Voting.Status.SCHEDULED],
+        )
+        self.assertEqual(finished, [])
+
+        with freeze_time('2023-08-01'):
+            self.assertEqual(update_statuses(), [1])
+        self.assertEqual(update_statuses(), [3])
+        self.assertEqual(finished, [1, 3])
+        self.voting_1.refresh_from_db()
+        self.assertEqual(self.voting_1.status, Voting.Status.FINISHED)
+        self.assertIsNotNone(self.voting_1.finished_at)
+
+    def test_reopened_voting_clears_finished_at(self):
+        with freeze_time('2023-08-01'):
+            update_statuses()
+            self.voting_1.refresh_from_db()
+            finished_at = self.voting_1.finished_at
+            self.voting_1.end_date = '2023-08-10'
+            self.voting_1.save()
+        self.voting_1.refresh_from_db()
+        self.assertEqual(self.voting_1.status, Voting.Status.ACTIVE)
+        self.assertIsNone(self.voting_1.finished_at)
+
+        with freeze_time('2023-08-11'):
+            self.assertIn(1, update_statuses())
+        self.voting_1.refresh_from_db()
+        self.assertGreater(self.voting_1.finished_at, finished_at)
+
+    @freeze_time('2023-07-09')
+    def test_finished_by_max_votes_sends_hook(self):
+        finished = []
+
+        def on_finished(sender, voting, **kwargs):
+            finished.append(voting.id)
+
+        voting_finished.connect(on_finished)
+        self.addCleanup(voting_finished.disconnect, on_finished)
+        CharacterVote.objects.create(voting=self.voting_1,
+                                     character=self.character_1, amount=199)
+        response = self.client.put(reverse('voting-add-vote',
+                                   kwargs={'pk': 1, 'pk_2': 1}))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(update_statuses(), [1])
+        self.assertEqual(finished, [1])
+
+    def post_votes(self, pk: int, entries: list):
+        return self.client.post(reverse('voting-add-votes', kwargs={'pk': pk}),
+                                data=entries, content_type='application/json')
+
+    @freeze_time('2023-07-09')
+    def test_add_votes(self):
+        for character in [self.character_1, self.character_2]:
+            CharacterVote.objects.create(voting=self.voting_1,
+                                         character=character, amount=0)
+        response = self.post_votes(1, [{'character': 1, 'count': 3},
+                                       {'character': 2, 'count': 2},
+                                       {'character': 3, 'count': 1},
+                                       {'character': 1, 'count': 1}])
+        self.assertEqual(response.status_code, 201)
+        results = response.json()
+        self.assertEqual([r['accepted'] for r in results], [3, 2, 0, 1])
+        self.assertEqual(results[2]['detail'],
+                         'Voting id 1 has no member id 3')
+        self.assertEqual(results[3]['votes_amount'], 4)
+        amounts = dict(self.voting_1.votes.values_list('character_id',
+                                                       'amount'))
+        self.assertEqual(amounts, {1: 4, 2: 2})
+
+    @freeze_time('2023-07-09')
+    def test_add_votes_crossing_max_votes(self):
+        CharacterVote.objects.create(voting=self.voting_1,
+                                     character=self.character_1, amount=195)
+        CharacterVote.objects.create(voting=self.voting_1,
+                                     character=self.character_2, amount=0)
+        response = self.post_votes(1, [{'character': 1, 'count': 10},
+                                       {'character': 2, 'count': 1}])
+        self.assertEqual(response.status_code, 201)
+        results = response.json()
+        self.assertEqual([r['accepted'] for r in results], [5, 0])
+        self.assertEqual(results[0]['detail'], 'Voting id 1 is finished')
+        amounts = dict(self.voting_1.votes.values_list('character_id',
+                                                       'amount'))
+        self.assertEqual(amounts, {1: 200, 2: 0})
+
+        response = self.post_votes(1, [{'character': 2, 'count': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['detail'], 'Voting id 1 is finished')
+
+    def test_add_votes_invalid(self):
+        response = self.post_votes(1, [{'character': 1, 'count': 0}])
+        self.assertEqual(response.status_code, 400)
+        response = self.post_votes(
+            1, [{'character': 1,
+                 'count': settings.VOTES_MAX_ENTRY_COUNT + 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('count', response.json()[0])
+        self.assertIs(VoteEvent.objects.exists(), False)
+        Voting.objects.all().delete()
+        response = self.post_votes(1, [{'character': 1, 'count': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['detail'],
+                         'Voting id 1 does not exist')
+
+    def test_characters_cursor_pagination(self):
+        for i in range(10):
+            Character.objects.create(last_name=f'Character {i}',
+                                     birth_date='2000-01-01')
+        response = self.client.get(reverse('character-list'),
+                                   {'pagination': 'cursor'})
+        self.assertEqual(response.status_code, 200)
+        page = response.json()
+        self.assertNotIn('count', page)
+        ids = [c['id'] for c in page['results']]
+        response = self.client.get(page['next'])
+        page = response.json()
+        ids += [c['id'] for c in page['results']]
+        self.assertIsNone(page['next'])
+        self.assertEqual(ids, sorted(Character.objects.values_list('id',
+                                                                   flat=True)))
+
+    def test_votings_page_number_pagination_is_default(self):
+        response = self.client.get(reverse('voting-list'))
+        self.assertEqual(response.json()['count'], 3)
+
+    @freeze_time('2023-07-09')
+    def test_active_cursor_pagination(self):
+        response = self.client.get(reverse('voting-active'),
+                                   {'pagination': 'cursor'})
+        self.assertEqual(response.status_code, 200)
+        page = response.json()
+        self.assertNotIn('count', page)
+        titles = [v['title'] for v in page['results']]
+        self.assertEqual(titles, [self.active_title])
+
     def test_get_image_no_access(self):
         file_path = self.character_1.photo.path
         response = self.client.get(
@@ -445,3 +902,1457 @@ class TestVotings(TestCase):
         self.assertEqual(response.status_code, 400)
         detail = response.json()['detail']
         self.assertEqual(detail, f'No file {file_path}')
+
+
+@freeze_time('2023-07-09')
+class TestBufferedVotes(TestCase):
+    fixtures = TestVotings.fixtures
+
+    def setUp(self) -> None:
+        get_vote_buffer().clear()
+        get_leaderboard().clear()
+        cache.clear()
+        self.voting = Voting.objects.get(id=1)
+        self.voting.ingestion = Voting.Ingestion.BUFFERED
+        self.voting.save()
+        for character_id, amount in [(1, 10), (2, 12)]:
+            CharacterVote.objects.create(voting=self.voting,
+                                         character_id=character_id,
+                                         amount=amount)
+        return super().setUp()
+
+    def add_votes(self, character_id: int, times: int) -> None:
+        for _ in range(times):
+            response = self.client.put(reverse(
+                'voting-add-vote', kwargs={'pk': 1, 'pk_2': character_id}
+            ))
+            self.assertEqual(response.status_code, 201)
+
+    def test_add_vote_is_buffered(self):
+        self.add_votes(1, 5)
+        vote = CharacterVote.objects.get(voting=self.voting, character_id=1)
+        self.assertEqual(vote.amount, 10)
+        self.assertEqual(self.voting.pending_votes(), {1: 5})
+
+    def test_reads_merge_pending_votes(self):
+        self.add_votes(1, 5)
+        response = self.client.get(reverse('voting-members',
+                                   kwargs={'pk': 1}))
+        amounts = {c['id']: c['votes_amount']
+                   for c in response.json()['results']}
+        self.assertEqual(amounts, {1: 15, 2: 12})
+
+        response = self.client.get(reverse('voting-detail', kwargs={'pk': 1}))
+        self.assertEqual(response.json()['leader_votes'], 15)
+
+    @freeze_time('2023-07-30')
+    def test_winner_merges_pending_votes(self):
+        with freeze_time('2023-07-09'):
+            self.add_votes(1, 5)
+        update_statuses()
+        response = self.client.get(reverse('voting-winner', kwargs={'pk': 1}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['id'], 1)
+        self.assertEqual(response.json()['votes_amount'], 15)
+
+    def test_max_votes(self):
+        self.voting.max_votes = 14
+        self.voting.save()
+        self.add_votes(1, 4)
+        response = self.client.put(reverse('voting-add-vote',
+                                   kwargs={'pk': 1, 'pk_2': 2}))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['detail'], 'Voting id 1 is finished')
+        self.assertEqual(self.voting.pending_votes(), {1: 4})
+
+    def test_flush_votes(self):
+        self.add_votes(1, 5)
+        self.add_votes(2, 2)
+        self.assertEqual(flush_votes(), 7)
+        amounts = dict(self.voting.votes.values_list('character_id',
+                                                     'amount'))
+        self.assertEqual(amounts, {1: 15, 2: 14})
+        self.assertEqual(self.voting.pending_votes(), {})
+        self.assertEqual(self.voting.vote_totals(), {1: 15, 2: 14})
+
+    def test_vote_reads_database_once(self):
+        self.add_votes(1, 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(add_vote(1, 1), 12)
+
+    def test_votes_during_flush_are_pending(self):
+        self.add_votes(1, 5)
+        buffer = get_vote_buffer()
+        token, deltas = buffer.take(1, 'flushing')
+        self.assertEqual(deltas, {1: 5})
+        self.add_votes(1, 2)
+        self.assertEqual(self.voting.pending_votes(), {1: 7})
+        self.assertEqual(flush_votes(), 5)
+        self.assertEqual(flush_votes(), 2)
+        self.assertEqual(self.voting.vote_totals(), {1: 17, 2: 12})
+
+    def test_interrupted_flush_is_not_added_twice(self):
+        self.add_votes(1, 5)
+        buffer = get_vote_buffer()
+        with mock.patch.object(buffer, 'discard', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                flush_votes()
+        self.assertEqual(flush_votes(), 0)
+        vote = CharacterVote.objects.get(voting=self.voting, character_id=1)
+        self.assertEqual(vote.amount, 15)
+        self.assertEqual(self.voting.pending_votes(), {})
+
+    def test_committed_flush_is_not_pending(self):
+        self.add_votes(1, 5)
+        buffer = get_vote_buffer()
+        discard = buffer.discard
+        totals = []
+
+        def read_and_discard(voting_id: int, token: str) -> None:
+            totals.append(self.voting.vote_totals())
+            discard(voting_id, token)
+
+        with mock.patch.object(buffer, 'discard',
+                               side_effect=read_and_discard):
+            self.assertEqual(flush_votes(), 5)
+        self.assertEqual(totals, [{1: 15, 2: 12}])
+        self.assertEqual(self.voting.vote_totals(), {1: 15, 2: 12})
+
+    def test_flush_tokens_are_pruned(self):
+        with freeze_time('2023-07-09 10:00'):
+            self.add_votes(1, 5)
+            flush_votes()
+        self.assertEqual(VoteFlush.objects.count(), 1)
+        with freeze_time('2023-07-09 10:02'):
+            flush_votes()
+        self.assertFalse(VoteFlush.objects.exists())
+
+    def test_max_votes_across_flush(self):
+        self.voting.max_votes = 13
+        self.voting.save()
+        self.add_votes(1, 2)
+        flush_votes()
+        self.add_votes(1, 1)
+        self.assertIsNone(add_vote(1, 1))
+        self.assertIsNone(add_vote(1, 2))
+        self.assertEqual(self.voting.vote_totals(), {1: 13, 2: 12})
+
+
+@freeze_time('2023-07-09')
+class TestLedgerVotes(TestCase):
+    fixtures = TestVotings.fixtures
+
+    def setUp(self) -> None:
+        self.voting = Voting.objects.get(id=1)
+        self.voting.ingestion = Voting.Ingestion.LEDGER
+        self.voting.save()
+        for character_id, amount in [(1, 10), (2, 12)]:
+            CharacterVote.objects.create(voting=self.voting,
+                                         character_id=character_id,
+                                         amount=amount)
+        return super().setUp()
+
+    def add_votes(self, character_id: int, times: int) -> None:
+        for _ in range(times):
+            response = self.client.put(reverse(
+                'voting-add-vote', kwargs={'pk': 1, 'pk_2': character_id}
+            ))
+            self.assertEqual(response.status_code, 201)
+
+    def test_add_vote_inserts_event(self):
+        self.add_votes(1, 3)
+        self.assertEqual(VoteEvent.objects.filter(character_id=1).count(), 3)
+        vote = CharacterVote.objects.get(voting=self.voting, character_id=1)
+        self.assertEqual(vote.amount, 10)
+        self.assertEqual(self.voting.vote_totals(), {1: 13, 2: 12})
+
+    def test_compact_votes(self):
+        self.add_votes(1, 3)
+        self.add_votes(2, 1)
+        self.assertEqual(compact_votes(), 4)
+        self.assertEqual(compact_votes(), 0)
+        amounts = dict(self.voting.votes.values_list('character_id',
+                                                     'amount'))
+        self.assertEqual(amounts, {1: 13, 2: 13})
+        self.assertEqual(self.voting.pending_votes(), {})
+
+    def test_rebuild_votes(self):
+        self.add_votes(1, 3)
+        compact_votes()
+        self.add_votes(2, 2)
+        CharacterVote.objects.filter(voting=self.voting, character_id=1)\
+            .update(amount=99)
+        call_command('rebuild_votes', workers=1, stdout=io.StringIO())
+        amounts = dict(self.voting.votes.values_list('character_id',
+                                                     'amount'))
+        self.assertEqual(amounts, {1: 13, 2: 14})
+        self.assertIs(VoteEvent.objects.filter(compacted=False).exists(),
+                      False)
+
+    def test_rebuild_keeps_votes_before_ledger(self):
+        self.voting.ingestion = Voting.Ingestion.DIRECT
+        self.voting.save()
+        add_vote(1, 1)
+        add_vote(1, 1)
+        self.voting.ingestion = Voting.Ingestion.LEDGER
+        self.voting.save()
+        self.add_votes(1, 1)
+        compact_votes()
+        rebuild_votes(1)
+        self.assertEqual(self.voting.vote_totals(), {1: 13, 2: 12})
+
+    def test_rebuild_forgets_results(self):
+        self.add_votes(1, 1)
+        voting_leaderboard(1, 10)
+        cache.set(winner_key(1), {'character': 2, 'votes_amount': 12})
+        versions = get_versions(VOTING.format(pk=1))
+        rebuild_votes(1)
+        self.assertIsNone(cache.get(winner_key(1)))
+        self.assertIs(get_leaderboard().exists(1), False)
+        self.assertNotEqual(get_versions(VOTING.format(pk=1)), versions)
+
+
+@freeze_time('2023-07-09')
+class TestShardedVotes(TestCase):
+    fixtures = TestVotings.fixtures
+
+    def setUp(self) -> None:
+        self.voting = Voting.objects.get(id=1)
+        self.voting.shards = 4
+        self.voting.save()
+        for character_id, amount in [(1, 10), (2, 12)]:
+            CharacterVote.objects.create(voting=self.voting,
+                                         character_id=character_id,
+                                         amount=amount)
+        return super().setUp()
+
+    def test_add_vote_spreads_over_shards(self):
+        for _ in range(40):
+            self.assertIsNotNone(add_vote(1, 1))
+        shards = VoteShard.objects.filter(voting=self.voting, character_id=1)
+        self.assertGreater(shards.count(), 1)
+        self.assertLessEqual(shards.count(), 4)
+        self.assertEqual(sum(shards.values_list('amount', flat=True)), 40)
+        vote = CharacterVote.objects.get(voting=self.voting, character_id=1)
+        self.assertEqual(vote.amount, 10)
+
+    def test_reads_sum_shards(self):
+        for _ in range(5):
+            add_vote(1, 1)
+        response = self.client.get(reverse('voting-members',
+                                   kwargs={'pk': 1}))
+        amounts = {c['id']: c['votes_amount']
+                   for c in response.json()['results']}
+        self.assertEqual(amounts, {1: 15, 2: 12})
+
+        response = self.client.get(reverse('voting-detail', kwargs={'pk': 1}))
+        self.assertEqual(response.json()['leader_votes'], 15)
+
+    def test_add_vote_is_one_statement(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(add_vote(1, 1), 11)
+
+    def test_max_votes_sums_shards(self):
+        self.voting.max_votes = 15
+        self.voting.save()
+        for _ in range(5):
+            self.assertIsNotNone(add_vote(1, 1))
+        self.assertIsNone(add_vote(1, 1))
+        self.assertIsNone(add_vote(1, 2))
+        self.assertEqual(self.voting.vote_totals(), {1: 15, 2: 12})
+        self.voting.refresh_from_db()
+        self.assertEqual(self.voting.status, Voting.Status.FINISHED)
+
+
+@freeze_time('2023-07-09')
+class TestVoteConcurrency(TransactionTestCase):
+    threads = 8
+    votes_per_thread = 25
+
+    def setUp(self) -> None:
+        self.voting = Voting.objects.create(
+            title='Concurrent', start_date='2023-07-01', end_date='2023-07-30'
+        )
+        self.character = Character.objects.create(
+            last_name='Flash', birth_date='2000-01-01'
+        )
+        CharacterVote.objects.create(voting=self.voting,
+                                     character=self.character, amount=0)
+        return super().setUp()
+
+    def vote_many(self, times: int) -> list:
+        try:
+            return [add_vote(self.voting.id, self.character.id)
+                    for _ in range(times)]
+        finally:
+            connection.close()
+
+    def run_threads(self) -> list:
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            futures = [executor.submit(self.vote_many, self.votes_per_thread)
+                       for _ in range(self.threads)]
+            return [a for f in futures for a in f.result()]
+
+    def test_no_lost_updates(self):
+        amounts = self.run_threads()
+        total = self.threads * self.votes_per_thread
+        self.assertEqual(sorted(amounts), list(range(1, total + 1)))
+        vote = CharacterVote.objects.get(voting=self.voting)
+        self.assertEqual(vote.amount, total)
+        self.voting.refresh_from_db()
+        self.assertEqual(self.voting.leader_votes, total)
+
+    def test_max_votes_is_not_exceeded(self):
+        self.voting.max_votes = 50
+        self.voting.save()
+        amounts = self.run_threads()
+        accepted = [a for a in amounts if a is not None]
+        self.assertEqual(sorted(accepted), list(range(1, 51)))
+        vote = CharacterVote.objects.get(voting=self.voting)
+        self.assertEqual(vote.amount, 50)
+        self.voting.refresh_from_db()
+        self.assertEqual(self.voting.status, Voting.Status.FINISHED)
+
+
+class TestSingleFlight(TransactionTestCase):
+    threads = 8
+
+    def setUp(self) -> None:
+        cache.clear()
+        get_response_cache().clear()
+        self.voting = Voting.objects.create(
+            title='Finished', start_date='2023-07-01', end_date='2023-07-08'
+        )
+        for i, amount in enumerate([3, 7]):
+            character = Character.objects.create(
+                last_name=f'Flash {i}', birth_date='2000-01-01'
+            )
+            CharacterVote.objects.create(voting=self.voting,
+                                         character=character, amount=amount)
+        self.queries = []
+        self.lock = threading.Lock()
+        return super().setUp()
+
+    def run_together(self, fn) -> list:
+        barrier = threading.Barrier(self.threads)
+
+        def call():
+            barrier.wait()
+            return fn()
+
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            futures = [executor.submit(call) for _ in range(self.threads)]
+            return [f.result() for f in futures]
+
+    def slow_query(self, execute, sql, params, many, context):
+        with self.lock:
+            self.queries.append(sql)
+        time.sleep(0.05)
+        return execute(sql, params, many, context)
+
+    def get(self, url: str) -> int:
+        try:
+            with connection.execute_wrapper(self.slow_query):
+                return Client().get(url).status_code
+        finally:
+            connection.close()
+
+    def test_calls_share_one_leader(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return len(calls)
+
+        flight = SingleFlight()
+        results = self.run_together(lambda: flight.do('key', compute))
+        self.assertEqual(results, [1] * self.threads)
+        self.assertEqual(len(calls), 1)
+
+    def test_read_actions_coalesce(self):
+        for url, queries in [
+            (reverse('voting-winner', kwargs={'pk': self.voting.id}), 3),
+            (reverse('voting-members', kwargs={'pk': self.voting.id}), 3),
+            (reverse('voting-finished'), 2),
+        ]:
+            self.queries.clear()
+            codes = self.run_together(lambda: self.get(url))
+            self.assertEqual(codes, [200] * self.threads)
+            self.assertEqual(len(self.queries), queries, self.queries)
+
+    @freeze_time('2023-07-09')
+    def test_error_reads_coalesce(self):
+        # Winners of active votings are 400 and not cached
+        voting = Voting.objects.create(
+            title='Active', start_date='2023-07-01', end_date='2023-07-30'
+        )
+        url = reverse('voting-winner', kwargs={'pk': voting.id})
+        self.assertEqual(self.get(url), 400)
+        queries = len(self.queries)
+        self.queries.clear()
+        codes = self.run_together(lambda: self.get(url))
+        self.assertEqual(codes, [400] * self.threads)
+        self.assertEqual(len(self.queries), queries, self.queries)
+
+    def test_workers_wait_for_lock_holder(self):
+        options = dict(settings.RESPONSE_CACHE, LOCK_TIMEOUT=2)
+        workers = [ResponseCache(options), ResponseCache(options)]
+        calls = []
+
+        def render():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'content': b'[]'}
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(w.compute, 'key', render)
+                       for w in workers]
+            entries = [f.result() for f in futures]
+        self.assertEqual(entries, [{'content': b'[]'}] * 2)
+        self.assertEqual(len(calls), 1)
+
+    def test_workers_share_error_entries(self):
+        options = dict(settings.RESPONSE_CACHE, LOCK_TIMEOUT=2)
+        workers = [ResponseCache(options), ResponseCache(options)]
+        calls = []
+
+        def render():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'content': b'{}', 'status': 400}
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(w.compute, 'key', render)
+                       for w in workers]
+            entries = [f.result() for f in futures]
+        self.assertEqual(entries, [{'content': b'{}', 'status': 400}] * 2)
+        self.assertEqual(len(calls), 1)
+        self.assertIsNone(workers[0].get('key'))
+
+    def test_waiting_ends_with_the_lock(self):
+        worker = ResponseCache(dict(settings.RESPONSE_CACHE,
+                                    LOCK_TIMEOUT=30))
+        worker.shared.add('gone:lock', 1)
+        threading.Timer(0.1, worker.shared.delete, ['gone:lock']).start()
+        started = time.monotonic()
+        self.assertIsNone(worker.wait_for('gone'))
+        self.assertLess(time.monotonic() - started, 5)
+
+
+@override_settings(VOTES_STREAM={'INTERVAL_MS': 20, 'KEEPALIVE': 1,
+                                 'MAX_SECONDS': 10, 'RETRY_MS': 1000,
+                                 'MAX_BACKOFF': 1})
+class TestVoteStream(TestCase):
+    clients = 50
+
+    def setUp(self) -> None:
+        cache.clear()
+        today = timezone.now().date()
+        self.voting = Voting.objects.create(
+            title='Streamed',
+            start_date=today - timedelta(days=1),
+            end_date=today + timedelta(days=1),
+        )
+        self.characters = [
+            Character.objects.create(last_name=f'Flash {i}',
+                                     birth_date='2000-01-01')
+            for i in range(2)
+        ]
+        for character in self.characters:
+            CharacterVote.objects.create(voting=self.voting,
+                                         character=character, amount=0)
+        return super().setUp()
+
+    async def next_votes(self, stream) -> dict:
+        async for chunk in stream:
+            if chunk.startswith(b'event: votes'):
+                data = chunk.decode().split('data: ', 1)[1]
+                return {int(k): v for k, v in json.loads(data).items()}
+
+    async def test_clients_share_one_poll(self):
+        url = reverse('voting-stream', kwargs={'pk': self.voting.id})
+        responses = [await self.async_client.get(url)
+                     for _ in range(self.clients)]
+        self.assertEqual(responses[0]['Content-Type'], 'text/event-stream')
+        streams = [r.streaming_content for r in responses]
+        first, second = [c.id for c in self.characters]
+
+        snapshots = await asyncio.gather(*map(self.next_votes, streams))
+        self.assertEqual(snapshots, [{first: 0, second: 0}] * self.clients)
+
+        for _ in range(3):
+            await sync_to_async(add_vote)(self.voting.id, first)
+        updates = await asyncio.gather(*map(self.next_votes, streams))
+        self.assertEqual(updates, [{first: 3}] * self.clients)
+
+        broadcaster = broadcasters[self.voting.id]
+        self.assertLessEqual(broadcaster.reads, 3)
+        for response in responses:
+            response.close()
+        await asyncio.sleep(0.05)
+        self.assertNotIn(self.voting.id, broadcasters)
+
+    async def test_failed_poll_is_retried(self):
+        poll = VotingBroadcaster.poll
+        calls = []
+
+        async def flaky_poll(broadcaster):
+            calls.append(broadcaster.voting_id)
+            if len(calls) == 1:
+                raise ConnectionError('redis is down')
+            await poll(broadcaster)
+
+        url = reverse('voting-stream', kwargs={'pk': self.voting.id})
+        with mock.patch.object(VotingBroadcaster, 'poll', flaky_poll), \
+                self.assertLogs(level='WARNING') as logs:
+            response = await self.async_client.get(url)
+            votes = await self.next_votes(response.streaming_content)
+        self.assertEqual(votes, {c.id: 0 for c in self.characters})
+        self.assertIn('redis is down', logs.output[0])
+
+        broadcaster = broadcasters[self.voting.id]
+        broadcaster.task.cancel()
+        await asyncio.sleep(0.05)
+        self.assertNotIn(self.voting.id, broadcasters)
+        response.close()
+        await asyncio.sleep(0.05)
+
+    async def test_missing_voting(self):
+        response = await self.async_client.get(
+            reverse('voting-stream', kwargs={'pk': 99}))
+        self.assertEqual(response.status_code, 400)
+
+
+class TestAsyncReads(TestCase):
+    fixtures = TestVotings.fixtures
+
+    def setUp(self) -> None:
+        cache.clear()
+        get_response_cache().clear()
+        get_vote_buffer().clear()
+        with freeze_time('2023-07-09'):
+            update_statuses()
+        for voting_id, character_id, amount in [(1, 1, 3), (1, 2, 5),
+                                                (2, 1, 7), (2, 3, 2)]:
+            CharacterVote.objects.create(voting_id=voting_id,
+                                         character_id=character_id,
+                                         amount=amount)
+        return super().setUp()
+
+    def assert_same(self, name: str, query: str = '', **kwargs) -> dict:
+        """The async view answers like the DRF one, links aside."""
+        sync = self.client.get(reverse(name, kwargs=kwargs) + query)
+        response = self.client.get(reverse(f'async-{name}', kwargs=kwargs)
+                                   + query)
+        self.assertEqual(response.status_code, sync.status_code)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        content = response.content.replace(b'/async/', b'/')
+        self.assertEqual(content, sync.content)
+        return response.json()
+
+    def test_votings(self):
+        self.assert_same('voting-list')
+        self.assert_same('voting-list', '?page=1&page_size=1')
+        self.assert_same('voting-active')
+        self.assert_same('voting-finished')
+        self.assert_same('voting-detail', pk=1)
+        self.assert_same('voting-detail', pk=99)
+
+    def test_cursor_pages(self):
+        page = self.assert_same('voting-list', '?pagination=cursor')
+        self.assertIsNone(page['next'])
+        for i in range(15):
+            Voting.objects.create(title=f'Async {i}', start_date='2023-07-01',
+                                  end_date='2023-07-31')
+
+        page = self.assert_same('voting-list', '?pagination=cursor')
+        forward = page['next'].split('?')[1]
+        page = self.assert_same('voting-list', f'?{forward}')
+        backward = page['previous'].split('?')[1]
+        page = self.assert_same('voting-list', f'?{backward}')
+        self.assertEqual(page['results'][0]['id'], 1)
+        self.assert_same('voting-list', '?cursor=broken')
+
+    def test_members_and_winner(self):
+        self.assert_same('voting-members', pk=1)
+        self.assert_same('voting-members', '?top=1&ordering=-votes', pk=1)
+        self.assert_same('voting-members', '?top=0', pk=1)
+        self.assert_same('voting-members', pk=99)
+        self.assert_same('voting-winner', pk=1)
+        response = self.client.get(reverse('async-voting-winner',
+                                           kwargs={'pk': 2}))
+        self.assertEqual(response.json()['id'], 1)
+        self.assertIn('votings:winner:2', cache)
+        self.assert_same('voting-winner', pk=2)
+
+    def test_characters(self):
+        self.assert_same('character-list')
+        self.assert_same('character-list', '?page=9')
+        self.assert_same('character-detail', pk=1)
+        self.assert_same('character-detail', pk=99)
+
+    def test_pending_votes(self):
+        voting = Voting.objects.get(id=1)
+        voting.ingestion = Voting.Ingestion.LEDGER
+        voting.save()
+        add_vote(1, 1)
+        self.assertEqual(
+            self.assert_same('voting-detail', pk=1)['leader_votes'],
+            voting.total_leader_votes())
+        self.assert_same('voting-active')
+        self.assert_same('voting-members', pk=1)
+
+        voting.ingestion = Voting.Ingestion.BUFFERED
+        voting.save()
+        add_vote(1, 2)
+        self.assert_same('voting-list')
+        self.assert_same('voting-members', pk=1)
+
+    def test_fields(self):
+        self.assert_same('voting-list', '?fields=id,title')
+        self.assert_same('voting-active', '?fields=leader_votes')
+        self.assert_same('voting-detail', '?fields=url,max_votes', pk=1)
+        self.assert_same('voting-members', '?fields=id,rank&top=1', pk=1)
+        self.assert_same('voting-winner', '?fields=last_name', pk=2)
+        self.assert_same('character-list', '?fields=age,photo')
+        self.assert_same('character-detail', '?fields=id', pk=1)
+        self.assert_same('voting-list', '?fields=id,nope')
+
+    def test_read_only(self):
+        response = self.client.post(reverse('async-voting-list'))
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response.json(),
+                         {'detail': 'Method "POST" not allowed.'})
+
+
+@freeze_time('2023-07-09')
+class TestRowSerializers(TestCase):
+    fixtures = TestVotings.fixtures
+
+    def setUp(self) -> None:
+        cache.clear()
+        get_response_cache().clear()
+        birth_dates = ['2000-07-08', '2000-07-09', '2000-07-10',
+                       '2000-02-29', '2000-12-31', '2000-01-01']
+        for i, birth_date in enumerate(birth_dates * 2):
+            Character.objects.create(
+                last_name=f'Born {i} {birth_date}', birth_date=birth_date,
+                first_name='Ёжик "в" тумане\\',
+                photo=f'character_images/Ёж #{i}?%20.jpg' if i % 2 else '',
+                description='line\nsep\u2028par\u2029tab\t\x01\x7f',
+            )
+        voting = Voting.objects.get(id=1)
+        voting.ingestion = Voting.Ingestion.LEDGER
+        voting.save()
+        CharacterVote.objects.create(voting=voting, character_id=1, amount=4)
+        with freeze_time('2023-07-09'):
+            add_vote(1, 1)
+        return super().setUp()
+
+    def drf_page(self, url: str, serializer, query, **context) -> bytes:
+        """The page as the DRF serializer and JSONRenderer render it."""
+        request = Request(RequestFactory().get(url))
+        paginator = VotingViewSet.pagination_class()
+        page = paginator.paginate_queryset(query, request)
+        data = serializer(page, many=True,
+                          context={'request': request, **context}).data
+        return JSONRenderer().render(
+            paginator.get_paginated_response(data).data)
+
+    def assert_page(self, url: str, serializer, query, **context) -> None:
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content,
+                         self.drf_page(url, serializer, query, **context))
+
+    def test_characters(self):
+        characters = Character.objects.all()
+        self.assert_page('/characters/', CharacterSerializer, characters)
+        self.assert_page('/characters/?page=2', CharacterSerializer,
+                         characters)
+        self.assert_page('/characters/?pagination=cursor',
+                         CharacterSerializer, characters)
+        self.assert_page('/characters.json?page=2', CharacterSerializer,
+                         characters, format='json')
+
+    def test_votings(self):
+        votings = Voting.objects.order_by('id')
+        self.assertEqual(votings[0].total_leader_votes(), 5)
+        self.assert_page('/votings/', VotingSerializer, votings)
+        self.assert_page('/votings/active/', VotingSerializer,
+                         votings.filter(status=Voting.Status.ACTIVE))
+
+    def test_votings_leader_votes_in_list_query(self):
+        get_vote_buffer().clear()
+        with CaptureQueriesContext(connection) as direct:
+            self.client.get('/votings/')
+        Voting.objects.filter(id=2).update(
+            ingestion=Voting.Ingestion.BUFFERED)
+        Voting.objects.filter(id=3).update(shards=4)
+        CharacterVote.objects.create(voting_id=2, character_id=2, amount=7)
+        CharacterVote.objects.create(voting_id=3, character_id=2, amount=1)
+        VoteShard.objects.create(voting_id=3, character_id=2, index=0,
+                                 amount=2)
+        get_response_cache().clear()
+        self.assert_page('/votings/', VotingSerializer,
+                         Voting.objects.order_by('id'))
+        get_response_cache().clear()
+        with self.assertNumQueries(len(direct)):
+            response = self.client.get('/votings/')
+        self.assertEqual(
+            [v['leader_votes'] for v in response.json()['results']],
+            [5, 7, 3])
+
+    def test_renderer(self):
+        data = {'text': '\u2028\u2029\x00\\"ü😀', 1: None,
+                'items': [True, 2 ** 62, {'date': timezone.now()}]}
+        self.assertEqual(FastJSONRenderer().render(data),
+                         JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(data, renderer_context={
+            'indent': 2}), JSONRenderer().render(data, renderer_context={
+                'indent': 2}))
+        response = self.client.get(
+            reverse('character-list'),
+            HTTP_ACCEPT='application/json; indent=4')
+        self.assertIn(b'\n    "count": 15', response.content)
+
+
+class TestSparseFields(TestCase):
+    fixtures = TestVotings.fixtures
+
+    def setUp(self) -> None:
+        cache.clear()
+        get_response_cache().clear()
+        get_leaderboard().clear()
+        with freeze_time('2023-07-09'):
+            update_statuses()
+        for voting_id, character_id, amount in [(1, 1, 3), (1, 2, 5),
+                                                (2, 1, 7), (2, 3, 2)]:
+            CharacterVote.objects.create(voting_id=voting_id,
+                                         character_id=character_id,
+                                         amount=amount)
+        return super().setUp()
+
+    def get(self, url: str, fields: str, **kwargs) -> tuple[dict, str]:
+        """Response json and the SQL of its queries."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'fields': fields, **kwargs})
+        self.assertEqual(response.status_code, 200)
+        return response.json(), ' '.join(q['sql'] for q in queries)
+
+    def test_votings(self):
+        data, sql = self.get(reverse('voting-list'), 'id, title')
+        self.assertEqual(list(data['results'][0]), ['id', 'title'])
+        self.assertNotIn('"end_date"', sql)
+        self.assertNotIn('"leader_votes"', sql)
+
+        data, sql = self.get(reverse('voting-detail', kwargs={'pk': 1}),
+                             'title,url')
+        self.assertEqual(data, {'url': 'http://testserver/votings/1/',
+                                'title': 'Самый быстрый'})
+        self.assertNotIn('"max_votes"', sql)
+
+    @freeze_time('2023-07-09')
+    def test_leader_votes_need_pending_votes(self):
+        voting = Voting.objects.get(id=1)
+        voting.ingestion = Voting.Ingestion.LEDGER
+        voting.save()
+        add_vote(1, 2)
+        url = reverse('voting-detail', kwargs={'pk': 1})
+
+        data, sql = self.get(url, 'leader_votes')
+        self.assertEqual(data, {'leader_votes': 6})
+        self.assertIn('votings_voteevent', sql)
+        data, sql = self.get(url, 'id')
+        self.assertNotIn('votings_voteevent', sql)
+        data, sql = self.get(reverse('voting-list'), 'id')
+        self.assertNotIn('votings_voteevent', sql)
+
+    def test_characters(self):
+        data, sql = self.get(reverse('character-list'), 'id,last_name')
+        self.assertEqual(data['results'][0], {'id': 1, 'last_name': 'Flash'})
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn('EXTRACT', sql)
+
+        data, sql = self.get(reverse('character-detail', kwargs={'pk': 1}),
+                             'age')
+        self.assertEqual(list(data), ['age'])
+        self.assertIn('"birth_date"', sql)
+        self.assertNotIn('"photo"', sql)
+
+    def test_actions(self):
+        data, sql = self.get(reverse('voting-members', kwargs={'pk': 1}),
+                             'last_name,votes_amount,rank')
+        self.assertEqual(data['results'][0], {
+            'last_name': 'Flash', 'votes_amount': 3, 'rank': 2})
+        self.assertNotIn('"description"', sql)
+
+        data, sql = self.get(reverse('voting-winner', kwargs={'pk': 2}),
+                             'id,votes_amount')
+        self.assertEqual(data, {'id': 1, 'votes_amount': 7})
+        self.assertNotIn('"description"', sql)
+
+        data, _ = self.get(reverse('voting-winners'), 'id', ids='2')
+        self.assertEqual(data, [{'voting': 2, 'winner': {'id': 1}}])
+        data, _ = self.get(reverse('voting-leaderboard', kwargs={'pk': 1}),
+                           'id,rank')
+        self.assertEqual(data, [{'id': 2, 'rank': 1}, {'id': 1, 'rank': 2}])
+
+    def test_unknown_fields(self):
+        response = self.client.get(reverse('voting-list'),
+                                   {'fields': 'id,nope'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['detail'],
+                         'fields can be url, id, title, start_date, '
+                         'end_date, max_votes, leader_votes')
+
+    def test_writes_ignore_fields(self):
+        self.client.force_login(
+            User.objects.create_superuser('admin', 'a@b.c', 'secret'))
+        response = self.client.patch(
+            reverse('voting-detail', kwargs={'pk': 3}) + '?fields=id',
+            {'title': 'Renamed'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], 'Renamed')
+        self.assertIn('end_date', response.json())
+
+
+@override_settings(COMPRESSION={**settings.COMPRESSION, 'MIN_LENGTH': 200})
+class TestCompression(TestCase):
+    fixtures = TestVotings.fixtures
+
+    def setUp(self) -> None:
+        cache.clear()
+        get_response_cache().clear()
+        self.url = reverse('character-list')
+        return super().setUp()
+
+    def test_gzip(self):
+        plain = self.client.get(self.url, {'page': 1})
+        self.assertIn('Accept-Encoding', plain.headers['Vary'])
+        self.assertNotIn('Content-Encoding', plain.headers)
+
+        response = self.client.get(self.url, {'page': 1},
+                                   HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(response.headers['Content-Length'],
+                         str(len(response.content)))
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+    @unittest.skipIf(compression.brotli is None, 'brotli is not installed')
+    def test_brotli(self):
+        plain = self.client.get(self.url, {'page': 1})
+        response = self.client.get(self.url, {'page': 1},
+                                   HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(response.content),
+                         plain.content)
+
+        response = self.client.get(self.url, {'page': 1},
+                                   HTTP_ACCEPT_ENCODING='gzip, br;q=0.5')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+
+    def test_not_compressed(self):
+        for accept_encoding in ['', 'identity', 'gzip;q=0', 'br;q=0,*;q=0']:
+            response = self.client.get(self.url, {'page': 1},
+                                       HTTP_ACCEPT_ENCODING=accept_encoding)
+            self.assertNotIn('Content-Encoding', response.headers)
+            self.assertIn('Accept-Encoding', response.headers['Vary'])
+
+        response = self.client.get(reverse('voting-detail', kwargs={'pk': 1}),
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertNotIn('Accept-Encoding', response.headers['Vary'])
+
+    def test_accepted_encoding(self):
+        factory = RequestFactory()
+        cases = [('gzip', 'gzip'), ('*', compression.encodings()[0]),
+                 ('br;q=0, *', 'gzip'), ('gzip;q=x', None),
+                 ('GZIP;Q=0.1', 'gzip'), ('deflate', None)]
+        for header, expected in cases:
+            request = factory.get('/', HTTP_ACCEPT_ENCODING=header)
+            self.assertEqual(compression.accepted_encoding(request),
+                             expected, header)
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url, {'page': 1},
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        etag = response.headers['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        response = self.client.get(self.url, {'page': 1},
+                                   HTTP_ACCEPT_ENCODING='gzip',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_cached_encodings(self):
+        self.client.get(self.url, {'page': 1})
+        compress = mock.Mock(wraps=compression.compress)
+        with mock.patch.object(compression, 'compress', compress):
+            for encoding in compression.encodings():
+                response = self.client.get(self.url, {'page': 1},
+                                           HTTP_ACCEPT_ENCODING=encoding)
+                self.assertEqual(response.headers['Content-Encoding'],
+                                 encoding)
+        compress.assert_not_called()
+
+
+def read_xlsx(file) -> list[list]:
+    """Cell values of the first sheet, rows of a constant memory workbook."""
+    namespace = {'x': 'http://schemas.openxmlformats.org/'
+                      'spreadsheetml/2006/main'}
+    with zipfile.ZipFile(file) as workbook:
+        sheet = ElementTree.fromstring(
+            workbook.read('xl/worksheets/sheet1.xml'))
+    return [[cell.findtext('x:is/x:t', namespaces=namespace) or
+             int(cell.findtext('x:v', namespaces=namespace))
+             for cell in row.findall('x:c', namespace)]
+            for row in sheet.iterfind('.//x:row', namespace)]
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.connections += 1
+        self.reply(220)
+        while line := self.rfile.readline():
+            verb = line[:4].upper()
+            if verb == b'QUIT':
+                return self.reply(221)
+            if verb == b'DATA':
+                self.reply(354)
+                self.server.messages.append(self.read_data())
+            refused = verb == b'RCPT' and \
+                any(r.encode() in line for r in self.server.refused)
+            self.reply(550 if refused else 250)
+
+    def read_data(self) -> bytes:
+        lines = []
+        while (line := self.rfile.readline()) != b'.\r\n':
+            lines.append(line)
+        return b''.join(lines)
+
+    def reply(self, code: int) -> None:
+        self.wfile.write(f'{code} stand-in\r\n'.encode())
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """
+        Local SMTP server counting connections and keeping messages,
+        recipients containing a refused string are refused.
+    """
+    daemon_threads = True
+
+    def __init__(self, refused: tuple[str, ...] = ()) -> None:
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.connections = 0
+        self.messages = []
+        self.refused = refused
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def settings(self):
+        return override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=self.server_address[1],
+            EMAIL_USE_SSL=False, EMAIL_HOST_USER=None)
+
+
+class TestReports(TestCase):
+    fixtures = TestVotings.fixtures
+
+    def setUp(self) -> None:
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        cache.clear()
+        self.names = dict(Character.objects.values_list('id', 'last_name'))
+        for character_id, amount in [(1, 3), (2, 5), (3, 4)]:
+            CharacterVote.objects.create(voting_id=1,
+                                         character_id=character_id,
+                                         amount=amount)
+        return super().setUp()
+
+    def export_task(self, voting_id: int = 1,
+                    export_format: str = 'xlsx') -> ExportTask:
+        return ExportTask.objects.create(
+            execute_at=timezone.now(), e_mail='admin@example.com',
+            voting_id=voting_id, task_id='scheduled', format=export_format)
+
+    def finish_voting(self) -> None:
+        Voting.objects.filter(id=1).update(
+            status=Voting.Status.FINISHED,
+            finished_at=timezone.make_aware(datetime(2023, 8, 1)))
+
+    def test_pending_votes_order(self):
+        file = io.BytesIO()
+        votes = Voting.objects.get(id=1).votes.all()
+        with self.assertNumQueries(2):
+            write_report_xlsx(file, votes, {1: 3, 3: 0}, chunk_size=1)
+        self.assertEqual(read_xlsx(file), [
+            ['Last name', 'Votes'], [self.names[1], 6],
+            [self.names[2], 5], [self.names[3], 4],
+        ])
+
+    def test_send_report(self):
+        export_task = ExportTask.objects.create(
+            execute_at=timezone.now(), e_mail='admin@example.com',
+            voting_id=1, task_id='scheduled')
+        send_report(export_task.id)
+
+        export_task.refresh_from_db()
+        attachment_name, content, mimetype = mail.outbox[0].attachments[0]
+        self.assertEqual(attachment_name, 'voting_1_members.xlsx')
+        self.assertTrue(mimetype.endswith('spreadsheetml.sheet'))
+        with export_task.file.open('rb') as file:
+            self.assertEqual(file.read(), content)
+        self.assertEqual(read_xlsx(io.BytesIO(content))[1:], [
+            [self.names[2], 5], [self.names[3], 4], [self.names[1], 3],
+        ])
+
+    def test_send_report_without_members(self):
+        export_task = ExportTask.objects.create(
+            execute_at=timezone.now(), e_mail='admin@example.com',
+            voting_id=2, task_id='scheduled')
+        send_report(export_task.id)
+        self.assertIn('Voting has no members.', mail.outbox[0].body)
+        self.assertEqual(mail.outbox[0].attachments, [])
+
+    def test_send_report_formats(self):
+        rows = [[1, 2, self.names[2], 5], [1, 3, self.names[3], 4],
+                [1, 1, self.names[1], 3]]
+        expected = {
+            'csv': ''.join(f'{",".join(map(str, row))}\r\n' for row in
+                           [exports.COLUMNS, *rows]),
+            'ndjson': ''.join(
+                json.dumps(dict(zip(exports.COLUMNS, row)),
+                           separators=(',', ':')) + '\n' for row in rows),
+        }
+        for export_format, content in expected.items():
+            export_task = ExportTask.objects.create(
+                execute_at=timezone.now(), e_mail='admin@example.com',
+                voting_id=1, task_id='scheduled', format=export_format)
+            send_report(export_task.id)
+            name, attachment, mimetype = mail.outbox[-1].attachments[0]
+            self.assertEqual(name, f'voting_1_members.{export_format}')
+            self.assertEqual(mimetype, exports.CONTENT_TYPES[export_format])
+            # EmailMessage.attach decodes text/* attachments
+            if isinstance(attachment, bytes):
+                attachment = attachment.decode()
+            self.assertEqual(attachment, content)
+
+    @unittest.skipIf(exports.pyarrow is None, 'pyarrow is not installed')
+    def test_send_report_parquet(self):
+        export_task = ExportTask.objects.create(
+            execute_at=timezone.now(), e_mail='admin@example.com',
+            voting_id=1, task_id='scheduled', format='parquet')
+        with self.settings(REPORT_ROW_GROUP_SIZE=2):
+            send_report(export_task.id)
+
+        export_task.refresh_from_db()
+        with export_task.file.open('rb') as file:
+            parquet = exports.pyarrow.parquet.ParquetFile(file)
+            self.assertEqual(parquet.metadata.num_row_groups, 2)
+            self.assertEqual(parquet.read().to_pylist()[0], {
+                'voting': 1, 'character': 2, 'last_name': self.names[2],
+                'votes': 5})
+
+    def test_finished_voting_reports_are_reused(self):
+        self.finish_voting()
+        write_export = mock.Mock(wraps=reports.write_export)
+        with mock.patch.object(reports, 'write_export', write_export):
+            first, second = self.export_task(), self.export_task()
+            send_report(first.id)
+            send_report(second.id)
+            self.assertEqual(write_export.call_count, 1)
+            self.assertEqual(report_stats(), {'hits': 1, 'misses': 1})
+            self.assertEqual(mail.outbox[0].attachments,
+                             mail.outbox[1].attachments)
+
+            first.refresh_from_db()
+            second.refresh_from_db()
+            self.assertEqual(first.file.name, second.file.name)
+            content = mail.outbox[0].attachments[0][1]
+            self.assertEqual(
+                first.file.name,
+                f'reports/{hashlib.sha256(content).hexdigest()}.xlsx')
+
+            send_report(self.export_task(export_format='csv').id)
+            bump_voting_versions(1)
+            send_report(self.export_task().id)
+            self.assertEqual(write_export.call_count, 3)
+            self.assertEqual(report_stats(), {'hits': 1, 'misses': 3})
+
+    def test_same_content_is_stored_once(self):
+        self.finish_voting()
+        first = report_file(Voting.objects.get(id=1), 'xlsx')
+        cache.clear()
+        self.assertEqual(report_file(Voting.objects.get(id=1), 'xlsx'),
+                         first)
+        self.assertEqual(len(os.listdir(settings.MEDIA_ROOT + '/reports')), 1)
+
+    def test_active_voting_reports_are_built(self):
+        Voting.objects.filter(id=1).update(status=Voting.Status.ACTIVE)
+        write_export = mock.Mock(wraps=reports.write_export)
+        with mock.patch.object(reports, 'write_export', write_export):
+            send_report(self.export_task().id)
+            send_report(self.export_task().id)
+        self.assertEqual(write_export.call_count, 2)
+        self.assertEqual(report_stats(), {'hits': 0, 'misses': 0})
+
+    def test_concurrent_builds(self):
+        self.finish_voting()
+        voting = Voting.objects.get(id=1)
+
+        def write_export(file, *args):
+            time.sleep(0.2)
+            file.write(b'report')
+        write_export = mock.Mock(side_effect=write_export)
+        with mock.patch.object(reports, 'write_export', write_export), \
+                ThreadPoolExecutor(2) as executor:
+            results = list(executor.map(
+                lambda _: report_file(voting, 'csv'), range(2)))
+        self.assertEqual(write_export.call_count, 1)
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(report_stats(), {'hits': 1, 'misses': 1})
+
+    def test_waiters_build_when_the_lock_is_gone(self):
+        self.finish_voting()
+        voting = Voting.objects.get(id=1)
+        lock = reports.report_key(voting, 'csv') + ':lock'
+        cache.add(lock, 1)
+
+        def wait():
+            try:
+                return report_file(voting, 'csv')
+            finally:
+                connection.close()
+        with ThreadPoolExecutor(1) as executor:
+            waiter = executor.submit(wait)
+            time.sleep(0.2)
+            self.assertFalse(waiter.done())
+            # The builder holding the lock failed
+            cache.delete(lock)
+            name, _ = waiter.result(timeout=5)
+        self.assertTrue(ExportTask.file.field.storage.exists(name))
+        self.assertEqual(report_stats(), {'hits': 0, 'misses': 1})
+
+    def test_deleted_report_file_is_built_again(self):
+        self.finish_voting()
+        voting = Voting.objects.get(id=1)
+        name, content = report_file(voting, 'csv')
+        ExportTask.file.field.storage.delete(name)
+        self.assertEqual(report_file(voting, 'csv'), (name, content))
+        self.assertTrue(ExportTask.file.field.storage.exists(name))
+        self.assertEqual(report_stats(), {'hits': 0, 'misses': 2})
+
+    def test_shared_file_deleted_with_last_task(self):
+        self.finish_voting()
+        first, second = self.export_task(), self.export_task()
+        send_report(first.id)
+        send_report(second.id)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        path = first.file.path
+
+        first.delete()
+        self.assertTrue(os.path.exists(path))
+        second.delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_shared_file_deleted_with_tasks(self):
+        self.finish_voting()
+        for export_task in [self.export_task(), self.export_task()]:
+            send_report(export_task.id)
+        path = ExportTask.objects.first().file.path
+
+        ExportTask.objects.all().delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_due_reports_share_a_connection(self):
+        tasks = [self.export_task(voting_id=2) for _ in range(3)]
+        smtp = SMTPStandIn()
+        self.addCleanup(smtp.server_close)
+        self.addCleanup(smtp.shutdown)
+        with smtp.settings():
+            self.assertEqual(send_report(tasks[1].id), 3)
+            self.assertEqual(send_report(tasks[0].id), 0)
+        self.assertEqual((smtp.connections, len(smtp.messages)), (1, 3))
+        self.assertFalse(ExportTask.objects.filter(sent_at=None).exists())
+
+    def test_batch_size(self):
+        tasks = [self.export_task(voting_id=2) for _ in range(5)]
+        smtp = SMTPStandIn()
+        self.addCleanup(smtp.server_close)
+        self.addCleanup(smtp.shutdown)
+        with smtp.settings(), self.settings(REPORT_EMAIL_BATCH_SIZE=2):
+            self.assertEqual(send_reports([t.id for t in tasks]), 5)
+            self.assertEqual(send_report(tasks[0].id), 0)
+        self.assertEqual((smtp.connections, len(smtp.messages)), (3, 5))
+
+    def test_failed_messages_are_isolated(self):
+        tasks = [self.export_task(voting_id=2) for _ in range(3)]
+        tasks[1].e_mail = 'refused@example.com'
+        tasks[1].save()
+        smtp = SMTPStandIn(refused=('refused@',))
+        self.addCleanup(smtp.server_close)
+        self.addCleanup(smtp.shutdown)
+        with smtp.settings():
+            self.assertEqual(send_reports([t.id for t in tasks]), 2)
+        self.assertEqual(len(smtp.messages), 2)
+        self.assertEqual(
+            list(ExportTask.objects.filter(sent_at=None)
+                 .values_list('id', flat=True)),
+            [tasks[1].id])
+
+        with smtp.settings():
+            self.assertEqual(send_reports([tasks[1].id]), 0)
+        smtp.refused = ()
+        with smtp.settings():
+            self.assertEqual(send_reports([tasks[1].id]), 1)
+
+    def test_failed_reports_are_isolated(self):
+        tasks = [self.export_task(voting_id=2) for _ in range(3)]
+        report_message = reports_tasks.report_message
+
+        def fail_second(export_task):
+            if export_task.id == tasks[1].id:
+                raise OSError('storage is down')
+            return report_message(export_task)
+        with mock.patch.object(reports_tasks, 'report_message',
+                               side_effect=fail_second):
+            self.assertEqual(send_report(tasks[0].id), 2)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertIsNone(ExportTask.objects.get(id=tasks[1].id).sent_at)
+
+    def test_reports_are_built_one_at_a_time(self):
+        tasks = [self.export_task(voting_id=2) for _ in range(3)]
+        report_message = reports_tasks.report_message
+        sent_before = []
+
+        def build(export_task):
+            sent_before.append(len(mail.outbox))
+            return report_message(export_task)
+        with mock.patch.object(reports_tasks, 'report_message',
+                               side_effect=build):
+            self.assertEqual(send_reports([t.id for t in tasks]), 3)
+        self.assertEqual(sent_before, [0, 1, 2])
+
+    def test_killed_send_is_claimed_again(self):
+        export_task = self.export_task(voting_id=2)
+        with mock.patch.object(reports_tasks, 'report_message',
+                               side_effect=SystemExit), \
+                self.assertRaises(SystemExit):
+            send_reports([export_task.id])
+        export_task.refresh_from_db()
+        self.assertIsNone(export_task.sent_at)
+        self.assertIsNotNone(export_task.claimed_at)
+
+        self.assertEqual(send_reports([export_task.id]), 0)
+        timeout = timedelta(seconds=settings.REPORT_SEND_TIMEOUT + 1)
+        with freeze_time(timezone.now() + timeout):
+            self.assertEqual(send_reports([export_task.id]), 1)
+        export_task.refresh_from_db()
+        self.assertIsNotNone(export_task.sent_at)
+
+
+class TestReportScheduler(TransactionTestCase):
+    def setUp(self) -> None:
+        self.voting = Voting.objects.create(
+            title='Reported', start_date='2023-07-01', end_date='2023-07-30'
+        )
+        delay = mock.patch.object(reports_tasks.send_reports, 'delay')
+        self.delay = delay.start()
+        self.addCleanup(delay.stop)
+        return super().setUp()
+
+    def export_task(self, execute_at: str, **kwargs) -> ExportTask:
+        return ExportTask.objects.create(
+            execute_at=timezone.make_aware(datetime.fromisoformat(execute_at)),
+            e_mail='admin@example.com', voting=self.voting, **kwargs)
+
+    def dispatched(self) -> list[list[int]]:
+        calls = [c.args[0] for c in self.delay.call_args_list]
+        self.delay.reset_mock()
+        return calls
+
+    def test_due_reports_are_dispatched(self):
+        with mock.patch('celery.current_app.send_task') as send_task:
+            first = self.export_task('2023-07-09 09:00')
+            second = self.export_task('2023-07-09 09:30')
+            later = self.export_task('2023-07-09 11:00')
+            self.export_task('2023-07-09 08:00',
+                             sent_at=timezone.make_aware(datetime(2023, 7, 9)))
+        send_task.assert_not_called()
+
+        with freeze_time('2023-07-09 10:00'), \
+                self.settings(REPORT_EMAIL_BATCH_SIZE=1):
+            self.assertEqual(dispatch_reports(), [first.id, second.id])
+            self.assertEqual(self.dispatched(), [[first.id], [second.id]])
+            self.assertEqual(dispatch_reports(), [])
+
+        # second is not sent within REPORT_DISPATCH_TIMEOUT
+        ExportTask.objects.filter(id=first.id).update(sent_at=timezone.now())
+        with freeze_time('2023-07-09 10:16'):
+            self.assertEqual(dispatch_reports(), [second.id])
+        ExportTask.objects.filter(id=second.id).update(sent_at=timezone.now())
+        with freeze_time('2023-07-09 11:00'):
+            self.assertEqual(dispatch_reports(), [later.id])
+        self.assertEqual(self.dispatched(), [[second.id], [later.id]])
+
+    def test_killed_send_is_dispatched_again(self):
+        report = self.export_task('2023-07-09 09:00')
+        with freeze_time('2023-07-09 10:00'):
+            self.assertEqual(dispatch_reports(), [report.id])
+            with mock.patch.object(reports_tasks, 'report_message',
+                                   side_effect=SystemExit), \
+                    self.assertRaises(SystemExit):
+                send_reports(*self.dispatched())
+        with freeze_time('2023-07-09 10:16'):
+            self.assertEqual(dispatch_reports(), [report.id])
+            self.assertEqual(send_reports(*self.dispatched()), 1)
+            self.assertEqual(dispatch_reports(), [])
+        self.assertEqual(len(mail.outbox), 1)
+        report.refresh_from_db()
+        self.assertIsNotNone(report.sent_at)
+
+    def test_failing_report_is_given_up(self):
+        report = self.export_task('2023-07-09 09:00')
+        dispatched = []
+        with self.settings(REPORT_MAX_ATTEMPTS=2), \
+                mock.patch.object(reports_tasks, 'report_message',
+                                  side_effect=ValueError) as build:
+            for retry_at in ['10:00', '10:16', '10:32']:
+                with freeze_time(f'2023-07-09 {retry_at}'):
+                    dispatched.append(dispatch_reports())
+                    for ids in self.dispatched():
+                        self.assertEqual(send_reports(ids), 0)
+            self.assertEqual(send_reports([report.id]), 0)
+            self.assertEqual(build.call_count, 2)
+            report.refresh_from_db()
+            self.assertEqual(site._registry[ExportTask].status(report),
+                             'FAILED')
+        self.assertEqual(dispatched, [[report.id], [report.id], []])
+        self.assertEqual(report.attempts, 2)
+        self.assertIsNone(report.sent_at)
+
+    def test_locked_reports_are_skipped(self):
+        reports = [self.export_task('2023-07-09 09:00') for _ in range(3)]
+        locked, release = threading.Event(), threading.Event()
+
+        def lock_first():
+            try:
+                with transaction.atomic():
+                    ExportTask.objects.select_for_update()\
+                        .get(id=reports[0].id)
+                    locked.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(1) as executor, \
+                freeze_time('2023-07-09 10:00'):
+            executor.submit(lock_first)
+            locked.wait(5)
+            self.assertEqual(dispatch_reports(),
+                             [reports[1].id, reports[2].id])
+            release.set()
+        with freeze_time('2023-07-09 10:00'):
+            self.assertEqual(dispatch_reports(), [reports[0].id])
+
+    def test_eta_mode(self):
+        with self.settings(REPORT_SCHEDULER='eta'), \
+                mock.patch('celery.current_app.send_task',
+                           return_value='task id') as send_task:
+            export_task = self.export_task('2023-07-09 09:00')
+            with freeze_time('2023-07-09 10:00'):
+                self.assertEqual(dispatch_reports(), [])
+        send_task.assert_called_once_with(
+            args=[export_task.id], name='report',
+            eta=export_task.execute_at)
+        export_task.refresh_from_db()
+        self.assertEqual(export_task.task_id, 'task id')
+
+
+class TestExports(TestCase):
+    fixtures = TestVotings.fixtures
+
+    def setUp(self) -> None:
+        self.client.force_login(
+            User.objects.create_superuser('admin', 'a@b.c', 'secret'))
+        self.names = dict(Character.objects.values_list('id', 'last_name'))
+        for voting_id, character_id, amount in [(1, 1, 3), (1, 2, 5),
+                                                (2, 3, 7)]:
+            CharacterVote.objects.create(voting_id=voting_id,
+                                         character_id=character_id,
+                                         amount=amount)
+        return super().setUp()
+
+    def url(self, export_format: str, pk: int | None = None) -> str:
+        kwargs = {'export_format': export_format}
+        if pk is not None:
+            kwargs['pk'] = pk
+        return reverse('voting-export', kwargs=kwargs)
+
+    def test_csv(self):
+        response = self.client.get(self.url('csv', 1),
+                                   HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response.headers['Content-Disposition'],
+                         'attachment; filename="voting_1_members.csv"')
+        self.assertEqual(
+            b''.join(response.streaming_content).decode().splitlines(),
+            ['voting,character,last_name,votes',
+             f'1,2,{self.names[2]},5', f'1,1,{self.names[1]},3'])
+
+    def test_ndjson_all_votings(self):
+        with self.settings(REPORT_CHUNK_SIZE=1):
+            response = self.client.get(self.url('ndjson'))
+            lines = list(response.streaming_content)
+        self.assertEqual(response.headers['Content-Type'],
+                         'application/x-ndjson')
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(json.loads(lines[2]), {
+            'voting': 2, 'character': 3, 'last_name': self.names[3],
+            'votes': 7})
+
+    def test_no_members(self):
+        response = self.client.get(self.url('csv', 3))
+        self.assertEqual(b''.join(response.streaming_content),
+                         b'voting,character,last_name,votes\r\n')
+
+    def test_errors(self):
+        response = self.client.get(self.url('csv', 100))
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/votings/1/export/xlsx/')
+        self.assertEqual(response.status_code, 404)
+        self.client.logout()
+        response = self.client.get(self.url('csv', 1))
+        self.assertEqual(response.status_code, 403)
+
+    def test_parquet_needs_pyarrow(self):
+        data = {'execute_at_0': '2100-01-01', 'execute_at_1': '10:00:00',
+                'voting': 1, 'e_mail': 'admin@example.com',
+                'format': 'parquet'}
+        with mock.patch.object(exports, 'pyarrow', None):
+            form = ExportTaskForm(data)
+            self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['format'],
+                         ['Parquet reports need pyarrow installed'])
+
+        form = ExportTaskForm({**data, 'format': 'pdf'})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['format'], [
+            'Select a valid choice. pdf is not one of the available choices.'])
+
+    async def test_asgi(self):
+        await sync_to_async(self.client.force_login)(
+            await User.objects.aget(username='admin'))
+        self.async_client.cookies = self.client.cookies
+        response = await self.async_client.get(self.url('csv', 1))
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in
+                            response.streaming_content])
+        self.assertEqual(len(content.splitlines()), 3)
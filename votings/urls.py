@@ -1,6 +1,6 @@
 from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
-from votings import views
+from votings import async_views, views
 
 
 # Create a router and register our viewsets with it.
@@ -10,13 +10,49 @@ router.register(r'characters', views.CharacterViewSet, basename='character')
 
 # The API URLs are now determined automatically by the router.
 
+# Async read endpoints for ASGI servers, named like the router ones
+async_urlpatterns = [
+    path('votings/', async_views.voting_list,
+         name='async-voting-list'),
+    path('votings/active/', async_views.voting_active,
+         name='async-voting-active'),
+    path('votings/finished/', async_views.voting_finished,
+         name='async-voting-finished'),
+    path('votings/<int:pk>/', async_views.voting_detail,
+         name='async-voting-detail'),
+    path('votings/<int:pk>/members/', async_views.voting_members,
+         name='async-voting-members'),
+    path('votings/<int:pk>/winner/', async_views.voting_winner,
+         name='async-voting-winner'),
+    path('characters/', async_views.character_list,
+         name='async-character-list'),
+    path('characters/<int:pk>/', async_views.character_detail,
+         name='async-character-detail'),
+]
+
 urlpatterns = [
     path('', include(router.urls)),
+    path('async/', include(async_urlpatterns)),
     path(
         'votings/<int:pk>/characters/<int:pk_2>/add_vote/',
         views.CharacterVoteView.as_view(),
         name='voting-add-vote'
     ),
+    path(
+        'votings/<int:pk>/add_votes/',
+        views.CharacterVotesView.as_view(),
+        name='voting-add-votes'
+    ),
+    path(
+        'votings/<int:pk>/stream/',
+        views.voting_stream,
+        name='voting-stream'
+    ),
+    re_path(
+        r'^votings/(?:(?P<pk>[0-9]+)/)?export/(?P<export_format>csv|ndjson)/$',
+        views.ExportView.as_view(),
+        name='voting-export'
+    ),
     re_path(
         r'media/(?P<file_path>.*?)$',
         views.FileDownloadView.as_view(),
@@ -1,9 +1,12 @@
 from datetime import datetime
-import io
+import heapq
+from operator import itemgetter
 from django.utils import timezone
-from django.db.models import QuerySet
-import pandas as pd
-from typing import TYPE_CHECKING
+from django.db.models import (Case, ExpressionWrapper, IntegerField, Q,
+                              QuerySet, Value, When)
+from django.db.models.functions import ExtractYear
+import xlsxwriter
+from typing import TYPE_CHECKING, BinaryIO, Iterator
 
 if TYPE_CHECKING:
     from votings.models import Voting, Character
@@ -11,23 +14,11 @@ if TYPE_CHECKING:
 
 def is_active_voting(voting: 'Voting') -> bool:
     """
-        Checking that
-            voting has actual dates
-            leader votes is under max parameter, if it was set.
+        Checking that voting status is active.
+        Statuses follow dates by update_statuses task and max votes
+        by vote paths.
     """
-    now_date = timezone.now().date()
-    member_votes = voting.votes.all()
-
-    if voting.start_date < now_date <= voting.end_date:
-        if not voting.max_votes:
-            return True
-        elif not member_votes.exists():
-            return True
-        else:
-            leader_votes = max([i.amount for i in member_votes])
-            return True if leader_votes < voting.max_votes else False
-    else:
-        return False
+    return voting.status == voting.Status.ACTIVE
 
 
 def character_image_path(instance: 'Character', filename: str):
@@ -35,20 +26,53 @@ def character_image_path(instance: 'Character', filename: str):
     return 'character_images/{0}{1}'.format(instance.last_name, extension)
 
 
-def create_report_xlsx(votes: QuerySet) -> bytes:
-    df = pd.DataFrame(
-        {
-            'Last name': [vote.character.last_name for vote in votes],
-            'Votes': [vote.amount for vote in votes],
-        }
+def report_rows(votes: QuerySet, pending: dict[int, int], chunk_size: int,
+                columns: tuple[str, ...] = ('character__last_name',)
+                ) -> Iterator[tuple]:
+    """
+        columns and votes of members, pending votes included, most votes
+        first. Members without pending votes stream from the database in
+        chunks, only those with pending votes are sorted in memory.
+    """
+    settled = votes\
+        .exclude(character_id__in=pending)\
+        .order_by('-amount', 'id')\
+        .values_list(*columns, 'amount')\
+        .iterator(chunk_size=chunk_size)
+    changed = sorted(
+        [(*row, amount + pending[character_id])
+         for character_id, *row, amount in votes
+         .filter(character_id__in=pending)
+         .values_list('character_id', *columns, 'amount')
+         .iterator(chunk_size=chunk_size)],
+        key=itemgetter(-1),
+        reverse=True,
     )
+    return heapq.merge(settled, changed, key=itemgetter(-1), reverse=True)
 
-    output = io.BytesIO()
-    writer = pd.ExcelWriter(output, engine='xlsxwriter')
-    df.to_excel(writer, index=False, sheet_name='Members')
-    writer.close()
 
-    return output.getvalue()
+def write_report_xlsx(file: BinaryIO, votes: QuerySet,
+                      pending: dict[int, int] | None = None,
+                      chunk_size: int = 2000,
+                      created: datetime | None = None) -> None:
+    """
+        Members sheet of votes into file, row by row. In constant memory
+        mode only the current row is held in memory. The same votes and
+        created time give the same bytes, xlsxwriter stamps the current
+        time without it.
+    """
+    workbook = xlsxwriter.Workbook(file, {'constant_memory': True})
+    if created is not None:
+        workbook.set_properties({'created': created})
+    worksheet = workbook.add_worksheet('Members')
+    # The header pandas.DataFrame.to_excel used to write
+    header = workbook.add_format({'bold': True, 'border': 1,
+                                  'align': 'center', 'valign': 'top'})
+    worksheet.write_row(0, 0, ('Last name', 'Votes'), header)
+    for row, member in enumerate(
+            report_rows(votes, pending or {}, chunk_size), start=1):
+        worksheet.write_row(row, 0, member)
+    workbook.close()
 
 
 def calculate_age(birth_date: datetime) -> int:
@@ -56,3 +80,22 @@ def calculate_age(birth_date: datetime) -> int:
     return today.year - birth_date.year - (
         (today.month, today.day) <= (birth_date.month, birth_date.day)
     )
+
+
+def age_expression(field: str = 'birth_date') -> ExpressionWrapper:
+    """calculate_age in SQL, for querysets with the birth date field."""
+    today = timezone.now().date()
+    not_yet = Q(**{f'{field}__month__gt': today.month}) | \
+        Q(**{f'{field}__month': today.month, f'{field}__day__gte': today.day})
+    return ExpressionWrapper(
+        Value(today.year) - ExtractYear(field) -
+        Case(When(not_yet, then=Value(1)), default=Value(0)),
+        output_field=IntegerField(),
+    )
+
+
+def positive_int(value: str) -> int | None:
+    """Query parameter as a positive integer, None when it is not one."""
+    if not value.isdecimal():
+        return None
+    return int(value) or None
@@ -0,0 +1,88 @@
+import calendar
+import hashlib
+import secrets
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from votings.response_cache import cached_response
+
+# Version scopes, a voting scope is VOTING.format(pk=voting_id)
+VOTINGS = 'votings'
+VOTING = 'voting:{pk}'
+CHARACTERS = 'characters'
+
+
+def version_key(scope: str) -> str:
+    return f'votings:version:{scope}'
+
+
+def new_version() -> tuple[float, str]:
+    """Change time, and a token telling apart changes at the same time."""
+    return time.time(), secrets.token_hex(8)
+
+
+def bump_versions(*scopes: str) -> None:
+    """Marks data of the scopes as changed now."""
+    version = new_version()
+    cache.set_many({version_key(s): version for s in scopes}, timeout=None)
+
+
+def bump_voting_versions(*voting_ids: int) -> None:
+    bump_versions(VOTINGS, *[VOTING.format(pk=i) for i in voting_ids])
+
+
+def get_versions(*scopes: str) -> list[tuple[float, str]]:
+    """
+        new_version of the last change of every scope. A scope missing
+        from the cache starts a new version, evicted ones never repeat.
+    """
+    keys = [version_key(s) for s in scopes]
+    versions = cache.get_many(keys)
+    missing = [k for k in keys if k not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, new_version(), timeout=None)
+        versions.update(cache.get_many(missing))
+    return [versions[k] for k in keys]
+
+
+def today_started() -> float:
+    """Character ages and voting dates move at midnight."""
+    return calendar.timegm(timezone.now().date().timetuple())
+
+
+def conditional(*scopes: str):
+    """
+        ETag and Last-Modified of a view method from the versions of
+        scopes formatted with the view kwargs. Requests matching them
+        get 304 before the method runs, others may get a cached_response
+        of the same versions.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            versions = get_versions(*[s.format(**kwargs) for s in scopes])
+            last_modified = max([t for t, _ in versions] + [today_started()])
+            tag = f'{request.accepted_renderer.format} {last_modified} ' \
+                f'{versions}'
+            etag = f'"{hashlib.md5(tag.encode()).hexdigest()}"'
+
+            response = get_conditional_response(
+                request, etag=etag, last_modified=int(last_modified))
+            if response is None:
+                response = cached_response(
+                    view, request, etag,
+                    lambda: method(view, request, *args, **kwargs),
+                )
+            if response.status_code in (200, 304):
+                response.headers.setdefault('ETag', etag)
+                response.headers.setdefault('Last-Modified',
+                                            http_date(last_modified))
+            return response
+        return wrapper
+    return decorator
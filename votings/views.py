@@ -1,134 +1,273 @@
 import os
-from django.db.models import F, Q, Max
+from asgiref.sync import sync_to_async
 from django.db.models.query import QuerySet
-from django.http import FileResponse
-from django.utils import timezone
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
 from django.conf import settings
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.request import Request
 from rest_framework.serializers import SerializerMetaclass
 from rest_framework.permissions import IsAdminUser
-from votings.models import Character, Voting
+from votings.counters import (add_vote, add_votes, ranked_members,
+                              vote_rejection_detail, voting_leaderboard)
+from votings.exports import all_voting_rows, export_response, voting_rows
+from votings.models import Character, CharacterVote, Voting
 from votings.permissions import IsStafforReadOnly
-from votings.serializers import (CharacterSerializer, CharacterVoteSerializer,
-                                 VotingSerializer)
-from rest_framework.pagination import PageNumberPagination
-from .utilities import is_active_voting
-from django.db import transaction
+from votings.renderers import FastJSONRenderer
+from votings.serializers import (CharacterRowSerializer, CharacterSerializer,
+                                 CharacterVoteSerializer, LeaderSerializer,
+                                 MemberSerializer, RowSerializer,
+                                 VoteEntrySerializer, VotingRowSerializer,
+                                 VotingSerializer, sparse_query)
+from votings.streams import VotingEventStream, voting_exists
+from votings.utilities import positive_int
+from votings.versions import CHARACTERS, VOTING, VOTINGS, conditional
+from votings.winners import forget_winner, voting_winner, voting_winners
 
 
-class VotingViewSet(viewsets.ModelViewSet):
-    queryset = Voting.objects\
-        .prefetch_related('votes')\
-        .annotate(leader_votes=Max('votes__amount'))
+class ReadMixin:
+    """?fields= and values() rows for the read views of a viewset."""
+
+    def get_queryset(self):
+        return sparse_query(super().get_queryset(),
+                            self.get_serializer_class(), self.request)
+
+    def get_rows_response(self, query: QuerySet, request: Request,
+                          serializer: type[RowSerializer]) -> Response:
+        """Paginated values() rows, for list pages."""
+        serializer = serializer(request, format=self.format_kwarg)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(serializer.values(query),
+                                           request, view=self)
+        return paginator.get_paginated_response(serializer.data(page))
+
+
+class VotingViewSet(ReadMixin, viewsets.ModelViewSet):
+    queryset = Voting.objects.order_by('id')
     serializer_class = VotingSerializer
     permission_classes = [IsStafforReadOnly]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    members_ordering = {
+        'id': ['id'],
+        'votes': ['votes_amount', 'id'],
+        '-votes': ['-votes_amount', 'id'],
+    }
+    winners_max_ids = 100
+    leaderboard_top = 10
+    leaderboard_max = 100
 
     @action(detail=False)
+    @conditional(VOTINGS)
     def active(self, request, *args, **kwargs):
-        now_date = timezone.now().date()
-        actual_votings = self.queryset\
-            .filter(start_date__lt=now_date, end_date__gte=now_date)
-        no_max_votings = actual_votings.filter(max_votes__isnull=True)
-        under_max_votings = actual_votings\
-            .filter(max_votes__isnull=False)\
-            .filter(Q(leader_votes__lt=F('max_votes')) |
-                    Q(leader_votes=None))
-        query = no_max_votings.union(under_max_votings).order_by('id')
-
-        return self.get_p_response(query, request, VotingSerializer)
+        query = self.queryset.filter(status=Voting.Status.ACTIVE)
+
+        return self.get_rows_response(query, request, VotingRowSerializer)
 
     @action(detail=False)
+    @conditional(VOTINGS)
     def finished(self, request, *args, **kwargs):
-        now_date = timezone.now().date()
-        outdated = self.queryset.filter(end_date__lt=now_date)
-        max_votes = self.queryset\
-            .filter(start_date__lt=now_date, end_date__gte=now_date)\
-            .filter(max_votes__isnull=False)\
-            .filter(leader_votes__isnull=False)\
-            .filter(leader_votes__gte=F('max_votes'))
-        query = outdated.union(max_votes).order_by('id')
+        query = self.queryset.filter(status=Voting.Status.FINISHED)
 
-        return self.get_p_response(query, request, VotingSerializer)
+        return self.get_rows_response(query, request, VotingRowSerializer)
 
-    @action(detail=True)
+    # Percentages are floats, see FastJSONRenderer
+    @action(detail=True, renderer_classes=[JSONRenderer,
+                                           BrowsableAPIRenderer])
+    @conditional(VOTING, CHARACTERS)
     def members(self, request, *args, **kwargs):
+        """
+            Voting members with votes, rank and percentage.
+            ?ordering=votes or -votes sorts by votes, ?top=N keeps
+            members ranked N or higher.
+        """
         pk = kwargs['pk']
-        voting = Voting.objects.filter(id=pk)
-        if not voting.exists():
+        voting = Voting.objects.filter(id=pk).first()
+        if voting is None:
             return Response(
                 data={"detail": f"Voting id {pk} does not exist"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        query = voting.get().characters\
-            .prefetch_related('votes')\
-            .annotate(votes_amount=F('votes__amount'))
-
-        response = self.get_p_response(query, request, CharacterSerializer)
-        if not query.exists():
+        query = self.filter_members(ranked_members(voting), request)
+        query = sparse_query(query, MemberSerializer, request)
+        response = self.get_p_response(query, request, MemberSerializer)
+        if not response.data['results']:
             response.data['detail'] = f'Voting id {pk} has no members'
 
         return response
 
+    @classmethod
+    def filter_members(cls, query: QuerySet, request: Request) -> QuerySet:
+        """
+            ranked_members rows by ?top= and ?ordering= of members. Ranks
+            are windows over all members, keyset pages would rank only
+            the members after the cursor, so those are refused.
+        """
+        if cls.pagination_class().is_cursor_request(request):
+            raise ParseError('members are paginated by page numbers')
+        params = request.query_params
+        top = params.get('top')
+        if top is not None:
+            top = positive_int(top)
+            if top is None:
+                raise ParseError('top must be a positive integer')
+            query = query.filter(rank__lte=top).order_by('rank', 'id')
+        ordering = cls.members_ordering.get(params.get('ordering'))
+        if ordering:
+            query = query.order_by(*ordering)
+        return query
+
     @action(detail=True)
+    @conditional(VOTING, CHARACTERS)
     def winner(self, request, *args, **kwargs):
-        pk = kwargs['pk']
-        voting = Voting.objects.filter(id=pk)
-        if not voting.exists():
+        winner = voting_winner(kwargs['pk'])
+        if 'detail' in winner:
             return Response(
-                    data={"detail": f"Voting id {pk} does not exist"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
+                data={"detail": winner['detail']},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        voting = voting.get()
-        if is_active_voting(voting):
+        character = sparse_query(Character.objects.all(), CharacterSerializer,
+                                 request).get(id=winner['character'])
+        character.votes_amount = winner['votes_amount']
+        serializer = CharacterSerializer(
+            character,
+            many=False,
+            context={"request": request}
+        )
+        return Response(serializer.data)
+
+    @action(detail=True)
+    def leaderboard(self, request, *args, **kwargs):
+        """Live ?top=N members, 10 by default, from the leaderboard."""
+        pk = kwargs['pk']
+        top = positive_int(request.query_params.get(
+            'top', str(self.leaderboard_top)))
+        if top is None or top > self.leaderboard_max:
             return Response(
-                data={"detail": f"Voting id {pk} is still active"},
-                status=status.HTTP_400_BAD_REQUEST,
+                data={"detail": "top must be an integer from 1 to "
+                                f"{self.leaderboard_max}"},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
-        members = voting.votes.all()
-        if not members.exists():
+        leaders = voting_leaderboard(pk, top)
+        if leaders is None:
             return Response(
-                data={"detail": f"Voting id {pk} has no members"},
-                status=status.HTTP_400_BAD_REQUEST,
+                data={"detail": f"Voting id {pk} does not exist"},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
-        leader_vote = members.order_by('-amount').first()
-        if leader_vote:
-            character = leader_vote.character
-            character.votes_amount = leader_vote.amount
-            serializer = CharacterSerializer(
-                character,
-                many=False,
-                context={"request": request}
+        characters = sparse_query(Character.objects.all(), LeaderSerializer,
+                                  request).in_bulk([c for c, _ in leaders])
+        ranked = []
+        for position, (character_id, amount) in enumerate(leaders, 1):
+            character = characters[character_id]
+            character.votes_amount = amount
+            character.rank = ranked[-1].rank \
+                if ranked and ranked[-1].votes_amount == amount else position
+            ranked.append(character)
+        serializer = LeaderSerializer(ranked, many=True,
+                                      context={'request': request})
+        return Response(serializer.data)
+
+    @action(detail=False)
+    @conditional(VOTINGS, CHARACTERS)
+    def winners(self, request, *args, **kwargs):
+        """
+            Winners of ?ids=1,2,3 votings, or of finished votings with
+            ?finished=true (paginated). Votings without a winner get
+            a detail instead.
+        """
+        if request.query_params.get('finished') == 'true':
+            paginator = self.pagination_class()
+            votings = paginator.paginate_queryset(
+                self.queryset.filter(status=Voting.Status.FINISHED),
+                request,
+                view=self,
             )
-            return Response(serializer.data)
-        else:
+            entries = self.winner_entries([v.id for v in votings], request)
+            return paginator.get_paginated_response(entries)
+
+        ids = [positive_int(i)
+               for i in request.query_params.get('ids', '').split(',')]
+        if None in ids or len(ids) > self.winners_max_ids:
             return Response(
-                data={"detail": f"Voting id {pk} members has no leader"},
+                data={"detail": "ids must be up to "
+                                f"{self.winners_max_ids} comma separated "
+                                "voting ids, or use finished=true"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        voting_ids = list(dict.fromkeys(ids))
+        return Response(self.winner_entries(voting_ids, request))
+
+    def winner_entries(self, voting_ids: list[int],
+                       request: Request) -> list[dict]:
+        """{'voting': id} with a serialized winner or a detail."""
+        winners = voting_winners(voting_ids)
+        characters = sparse_query(Character.objects.all(),
+                                  CharacterSerializer, request).in_bulk(
+            [w['character'] for w in winners.values() if 'character' in w]
+        )
+        entries = []
+        for voting_id in voting_ids:
+            winner = winners[voting_id]
+            entry = {'voting': voting_id}
+            if 'detail' in winner:
+                entry['detail'] = winner['detail']
+            else:
+                character = characters[winner['character']]
+                character.votes_amount = winner['votes_amount']
+                entry['winner'] = CharacterSerializer(
+                    character, context={'request': request}).data
+            entries.append(entry)
+        return entries
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        forget_winner(serializer.instance.id)
+
+    def perform_destroy(self, instance):
+        forget_winner(instance.id)
+        super().perform_destroy(instance)
 
     def get_p_response(self, query: QuerySet, request: Request,
                        serializer: SerializerMetaclass) -> Response:
         """Rest pagination for additional actions."""
-        paginator = PageNumberPagination()
-        p_query = paginator.paginate_queryset(query, request)
+        paginator = self.pagination_class()
+        p_query = paginator.paginate_queryset(query, request, view=self)
         serializer = serializer(p_query, many=True,
                                 context={'request': request})
         p_response = paginator.get_paginated_response(serializer.data)
         return p_response
 
+    @conditional(VOTINGS)
+    def list(self, request, *args, **kwargs):
+        return self.get_rows_response(self.get_queryset(), request,
+                                      VotingRowSerializer)
+
+    @conditional(VOTING)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
-class CharacterViewSet(viewsets.ModelViewSet):
+
+class CharacterViewSet(ReadMixin, viewsets.ModelViewSet):
     queryset = Character.objects.all()
     serializer_class = CharacterSerializer
     permission_classes = [IsStafforReadOnly]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    @conditional(CHARACTERS)
+    def list(self, request, *args, **kwargs):
+        return self.get_rows_response(self.get_queryset(), request,
+                                      CharacterRowSerializer)
+
+    @conditional(CHARACTERS)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
 
 class CharacterVoteView(APIView):
@@ -136,38 +275,39 @@ class CharacterVoteView(APIView):
         pk = kwargs['pk']
         pk_2 = kwargs['pk_2']
 
-        with transaction.atomic():
-            voting = Voting.objects.filter(id=pk).select_for_update()
-            if not voting.exists():
-                return Response(
-                    data={"detail": f"Voting id {pk} does not exist"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            voting = voting.get()
-            if not is_active_voting(voting):
-                return Response(
-                    data={"detail": f"Voting id {pk} is finished"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            vote = voting.votes.filter(character_id=pk_2)
-            if not vote.exists():
-                return Response(
-                    data={"detail": f"Voting id {pk} has no member id {pk_2}"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            vote = vote.get()
-            vote.amount += 1
-            vote.save()
-
-            serializer = CharacterVoteSerializer(
-                vote,
-                many=False,
-                context={'request': request}
+        amount = add_vote(pk, pk_2)
+        if amount is None:
+            return Response(
+                data={"detail": vote_rejection_detail(pk, pk_2)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        vote = CharacterVote(voting_id=pk, character_id=pk_2, amount=amount)
+        serializer = CharacterVoteSerializer(
+            vote,
+            many=False,
+            context={'request': request}
+        )
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class CharacterVotesView(APIView):
+    def post(self, request, *args, **kwargs):
+        pk = kwargs['pk']
+        entries = VoteEntrySerializer(data=request.data, many=True)
+        entries.is_valid(raise_exception=True)
+
+        results = add_votes(
+            pk,
+            [(e['character'], e['count']) for e in entries.validated_data],
+        )
+        if results is None:
+            return Response(
+                data={"detail": vote_rejection_detail(pk)},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+        return Response(results, status=status.HTTP_201_CREATED)
 
 
 class FileDownloadView(APIView):
@@ -186,3 +326,49 @@ class FileDownloadView(APIView):
                 data={"detail": f"No file {file_path}"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+
+
+class ExportView(APIView):
+    """
+        Members of a voting, or of all votings without pk, streamed as
+        CSV or NDJSON, see votings/exports.py.
+    """
+    permission_classes = [IsAdminUser]
+
+    def perform_content_negotiation(self, request, force=False):
+        # The export format is in the url, whatever Accept asks for
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, export_format, pk=None, *args, **kwargs):
+        chunk_size = settings.REPORT_CHUNK_SIZE
+        if pk is None:
+            return export_response(request._request,
+                                   all_voting_rows(chunk_size),
+                                   export_format, 'votings_members')
+
+        voting = Voting.objects.filter(id=pk).first()
+        if voting is None:
+            return Response(
+                data={"detail": f"Voting id {pk} does not exist"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return export_response(request._request,
+                               voting_rows(voting, chunk_size),
+                               export_format, f'voting_{pk}_members')
+
+
+async def voting_stream(request, pk):
+    """
+        Member votes of the voting as server-sent events, see
+        votings/streams.py. Needs an ASGI server, make asgi.
+    """
+    if not await sync_to_async(voting_exists)(pk):
+        return JsonResponse(
+            data={"detail": f"Voting id {pk} does not exist"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    response = StreamingHttpResponse(VotingEventStream(pk),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
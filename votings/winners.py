@@ -0,0 +1,130 @@
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db.models import F, Window
+from django.db.models.functions import Rank
+
+from votings.counters import aranked_members, ranked_members
+from votings.models import CharacterVote, Voting
+from votings.utilities import is_active_voting
+
+
+def winner_key(voting_id: int) -> str:
+    return f'votings:winner:{voting_id}'
+
+
+def leader_outcome(voting_id: int, leaders: list[tuple[int, int]]) -> dict:
+    """Winner from (character id, votes) rows ranked first."""
+    if not leaders:
+        return {'detail': f'Voting id {voting_id} has no members'}
+    if len(leaders) > 1:
+        return {'detail': f'Voting id {voting_id} members have no leader'}
+    character_id, votes_amount = leaders[0]
+    return {'character': character_id, 'votes_amount': votes_amount}
+
+
+def find_winner(voting: Voting) -> dict:
+    """Leader character id and votes, or detail why there is none."""
+    leaders = ranked_members(voting)\
+        .filter(rank=1)\
+        .values_list('id', 'votes_amount')[:2]
+    return leader_outcome(voting.id, list(leaders))
+
+
+def find_winners(votings: list[Voting]) -> dict[int, dict]:
+    """
+        find_winner of votings without pending votes, ranked in one
+        query partitioned by voting.
+    """
+    leaders = defaultdict(list)
+    rows = CharacterVote.objects\
+        .filter(voting__in=votings)\
+        .annotate(rank=Window(Rank(), partition_by=F('voting_id'),
+                              order_by=F('amount').desc()))\
+        .filter(rank=1)\
+        .values_list('voting_id', 'character_id', 'amount')
+    for voting_id, character_id, amount in rows:
+        leaders[voting_id].append((character_id, amount))
+    return {v.id: leader_outcome(v.id, leaders[v.id]) for v in votings}
+
+
+def closed_winner(voting_id: int, voting: Voting | None) -> dict | None:
+    """Detail for votings which can't have a winner yet."""
+    if voting is None:
+        return {'detail': f'Voting id {voting_id} does not exist'}
+    if is_active_voting(voting):
+        return {'detail': f'Voting id {voting_id} is still active'}
+    return None
+
+
+def voting_winner(voting_id: int) -> dict:
+    """
+        find_winner of the voting. Results of finished votings never
+        change, so they are cached until an admin edits the voting.
+    """
+    winner = cache.get(winner_key(voting_id))
+    if winner is not None:
+        return winner
+
+    voting = Voting.objects.filter(id=voting_id).first()
+    winner = closed_winner(voting_id, voting) or find_winner(voting)
+    if voting and voting.status == Voting.Status.FINISHED:
+        cache.set(winner_key(voting_id), winner, timeout=None)
+    return winner
+
+
+async def avoting_winner(voting_id: int) -> dict:
+    """voting_winner for async views."""
+    winner = await cache.aget(winner_key(voting_id))
+    if winner is not None:
+        return winner
+
+    voting = await Voting.objects.filter(id=voting_id).afirst()
+    winner = closed_winner(voting_id, voting)
+    if winner is None:
+        leaders = (await aranked_members(voting))\
+            .filter(rank=1)\
+            .values_list('id', 'votes_amount')[:2]
+        winner = leader_outcome(voting.id, [row async for row in leaders])
+    if voting and voting.status == Voting.Status.FINISHED:
+        await cache.aset(winner_key(voting_id), winner, timeout=None)
+    return winner
+
+
+def voting_winners(voting_ids: list[int]) -> dict[int, dict]:
+    """
+        voting_winner of many votings: one cache read, one query for
+        the votings and one for all their leaders. Votings with pending
+        votes are ranked one by one.
+    """
+    cached = cache.get_many([winner_key(i) for i in voting_ids])
+    winners = {i: cached[winner_key(i)] for i in voting_ids
+               if winner_key(i) in cached}
+    votings = Voting.objects.in_bulk(
+        [i for i in voting_ids if i not in winners]
+    )
+
+    direct = []
+    for voting_id in voting_ids:
+        if voting_id in winners:
+            continue
+        voting = votings.get(voting_id)
+        winners[voting_id] = closed_winner(voting_id, voting)
+        if voting and not winners[voting_id]:
+            if voting.has_pending_votes:
+                winners[voting_id] = find_winner(voting)
+            else:
+                direct.append(voting)
+    winners.update(find_winners(direct))
+
+    cache.set_many({winner_key(v.id): winners[v.id] for v in votings.values()
+                    if v.status == Voting.Status.FINISHED}, timeout=None)
+    return winners
+
+
+def cache_winner(voting: Voting) -> None:
+    cache.set(winner_key(voting.id), find_winner(voting), timeout=None)
+
+
+def forget_winner(voting_id: int) -> None:
+    cache.delete(winner_key(voting_id))